@@ -2,11 +2,16 @@
 # -*- coding: utf-8 -*-
 
 import sys
-import math
+import argparse
+import time
 import pygame
 from pygame import Color
 from src.sim_core import Simulation, SimConfig
 from src.controller import Phase
+from src.live import LiveSimulation, interpolate
+from src.profiling import StageProfiler
+from src.replay import Replay, ReplayClock, format_time, parse_time
+from src.replay import SPEEDS as REPLAY_SPEEDS
 
 # Escala y geometría
 PX_PER_M = 4.0
@@ -18,6 +23,9 @@ LANE_OFFSET = 0  # un carril por dirección (centrado)
 CAR_LENGTH_PX = 18
 CAR_WIDTH_PX = 10
 
+# Velocidades objetivo (múltiplos del tiempo real); None = lo más rápido posible
+SPEEDS = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, None)
+
 # Colores
 GRAY_DARK = Color(40, 40, 40)
 GRAY_ROAD = Color(90, 90, 90)
@@ -27,6 +35,7 @@ YELLOW = Color(230, 180, 0)
 RED = Color(220, 0, 0)
 BLUE = Color(80, 140, 255)
 CYAN = Color(0, 200, 200)
+LIGHT_BLUE = Color(120, 200, 255)
 TEXT = Color(240, 240, 240)
 
 def m_to_px(m):
@@ -74,23 +83,10 @@ def draw_signals(surface, ctrl_phase):
     draw_light(surface, CENTER_X + ROAD_WIDTH//2 + 18, CENTER_Y - 18, color_A)
     draw_light(surface, CENTER_X - 18, CENTER_Y + ROAD_WIDTH//2 + 18, color_B)
 
-def draw_vehicle(surface, lane_name, x_m, color=BLUE):
-    # Convertir posición de la simulación a coordenadas de pantalla.
-    # x_m es la coordenada 1D de ese carril (0 en la línea de alto).
-    if lane_name == "A":
-        # A: horizontal, movimiento hacia +x (izq -> der)
-        screen_x = CENTER_X + m_to_px(x_m)
-        screen_y = CENTER_Y - LANE_OFFSET
-        rect = pygame.Rect(0, 0, CAR_LENGTH_PX, CAR_WIDTH_PX)
-        rect.center = (screen_x, screen_y)
-        pygame.draw.rect(surface, color, rect, border_radius=2)
-    else:
-        # B: vertical, movimiento hacia +x en eje vertical (arriba -> abajo)
-        screen_x = CENTER_X + LANE_OFFSET
-        screen_y = CENTER_Y + m_to_px(x_m)
-        rect = pygame.Rect(0, 0, CAR_WIDTH_PX, CAR_LENGTH_PX)
-        rect.center = (screen_x, screen_y)
-        pygame.draw.rect(surface, color, rect, border_radius=2)
+def signal_rects():
+    # Área que ocupan las dos luces de draw_signals
+    return [pygame.Rect(CENTER_X + ROAD_WIDTH//2 + 18 - 11, CENTER_Y - 18 - 11, 22, 22),
+            pygame.Rect(CENTER_X - 18 - 11, CENTER_Y + ROAD_WIDTH//2 + 18 - 11, 22, 22)]
 
 def draw_sensing_guides(surface, cfg):
     # Dibuja d, r y e como guías visuales
@@ -122,33 +118,214 @@ def draw_sensing_guides(surface, cfg):
     pygame.draw.line(surface, YELLOW, (CENTER_X + e_px, CENTER_Y),
                      (CENTER_X + e_px, CENTER_Y + 8), 1)
 
-def draw_hud(surface, font, sim):
-    cfg = sim.cfg
-    ctrl = sim.ctrl
-    qA = sim.lane_A.count_red_zone(cfg.road_length)
-    qB = sim.lane_B.count_red_zone(cfg.road_length)
+CONTROLS = ("Controles: P pausa/reanuda | +/- velocidad sim | I perfil por etapas | ESC salir",)
 
+def hud_lines(snap, cfg, fps, speed, profiler=None, controls=CONTROLS):
+    speed_txt = "máx" if speed is None else f"{speed:g}x"
     lines = [
-        f"t = {sim.time:6.1f}s   fase: {ctrl.phase.name}   en fase: {ctrl.t_in_phase:4.1f}s",
-        f"qA={qA} qB={qB}   contRojoA={ctrl.red_counter_A:.1f}  contRojoB={ctrl.red_counter_B:.1f}",
-        f"completados A/B = {sim.completed_A}/{sim.completed_B}   cambios={ctrl.switches}",
+        f"t = {snap.time:6.1f}s   fase: {snap.phase.name}   en fase: {snap.t_in_phase:4.1f}s",
+        f"qA={snap.upstream_A} qB={snap.upstream_B}   contRojoA={snap.red_counter_A:.1f}  contRojoB={snap.red_counter_B:.1f}",
+        f"completados A/B = {snap.completed_A}/{snap.completed_B}   cambios={snap.switches}",
         f"u(min verde)={cfg.u_min_green}s, y(amarillo)={cfg.y_yellow}s, n(umbral)={cfg.n_threshold}, m={cfg.m_small_platoon}",
         f"d={cfg.d_detect}m, r={cfg.r_close}m, e={cfg.e_after}m   v_max={cfg.v_max}m/s",
-        "Controles: P pausa/reanuda | +/- velocidad sim | ESC salir"
+        f"vel. {speed_txt}   sim: {snap.sim_rate:.0f} pasos/s ({snap.sim_rate * cfg.dt:.0f}x real)   dibujo: {fps:.0f} fps",
     ]
-    x = 10
-    y = 10
-    for ln in lines:
-        surf = font.render(ln, True, TEXT)
-        surface.blit(surf, (x, y))
-        y += surf.get_height() + 2
+    lines.extend(controls)
+    if profiler is not None:
+        lines.extend(profiler.overlay_lines())
+    return lines
 
-def main():
+# Capas cacheadas y actualización por rectángulos sucios
+class StaticLayer:
+    """
+    Fondo, calzadas y guías de sensado pre-dibujados; se rehace si cambia la geometría.
+    Las guías también quedan solas en `guides` (transparente) para volver a ponerlas
+    encima de las luces, como en el dibujo original.
+    """
+    def __init__(self):
+        self.key = None
+        self.surface = None
+        self.guides = None
+
+    def get(self, cfg):
+        key = (cfg.d_detect, cfg.r_close, cfg.e_after)
+        if key != self.key:
+            surf = pygame.Surface((SCREEN_W, SCREEN_H)).convert()
+            surf.fill(GRAY_DARK)
+            draw_roads(surf)
+            draw_sensing_guides(surf, cfg)
+            guides = pygame.Surface((SCREEN_W, SCREEN_H), pygame.SRCALPHA)
+            draw_sensing_guides(guides, cfg)
+            self.key, self.surface, self.guides = key, surf, guides.convert_alpha()
+        return self.surface
+
+class HudCache:
+    """Superficies de texto del HUD; cada línea se vuelve a renderizar solo si cambia."""
+    def __init__(self, font, x=10, y=10):
+        self.font = font
+        self.x = x
+        self.y = y
+        self.lines = []   # [(texto, superficie, rect)]
+
+    def update(self, texts):
+        """Actualiza las líneas y devuelve los índices cuyo texto cambió (con el rect a repintar)."""
+        changed = []
+        y = self.y
+        for i, text in enumerate(texts):
+            if i < len(self.lines) and self.lines[i][0] == text:
+                rect = self.lines[i][2]
+            else:
+                surf = self.font.render(text, True, TEXT)
+                rect = surf.get_rect(topleft=(self.x, y))
+                old = self.lines[i][2] if i < len(self.lines) else rect
+                if i < len(self.lines):
+                    self.lines[i] = (text, surf, rect)
+                else:
+                    self.lines.append((text, surf, rect))
+                changed.append((i, rect.union(old)))
+            y = rect.bottom + 2
+        return changed
+
+def make_vehicle_sprites():
+    """Un sprite por (carril, color): A horizontal, B vertical."""
+    sprites = {}
+    for color in (BLUE, LIGHT_BLUE, RED):
+        for lane_name, size in (("A", (CAR_LENGTH_PX, CAR_WIDTH_PX)), ("B", (CAR_WIDTH_PX, CAR_LENGTH_PX))):
+            surf = pygame.Surface(size, pygame.SRCALPHA)
+            pygame.draw.rect(surf, color, surf.get_rect(), border_radius=2)
+            sprites[(lane_name, tuple(color))] = surf.convert_alpha()
+    return sprites
+
+class FrameRenderer:
+    """
+    Dibuja cada cuadro repintando solo lo que cambió: la franja ocupada por los
+    vehículos de cada carril (en el cuadro anterior y en éste), las luces si cambió
+    la fase y las líneas del HUD cuyo texto cambió o que quedaron bajo una franja.
+    """
+    def __init__(self, screen, font):
+        self.screen = screen
+        self.static = StaticLayer()
+        self.hud = HudCache(font)
+        self.sprites = make_vehicle_sprites()
+        self.screen_rect = screen.get_rect()
+        self.prev_bands = []
+        self.prev_phase = None
+        self.full = True  # primer cuadro (o ventana expuesta): todo
+
+    def _blits(self, lane_name, vehicles):
+        """Lista para Surface.blits y rect que las contiene (None si no hay vehículos)."""
+        if not vehicles:
+            return [], None
+        blue, light, red = (self.sprites[(lane_name, tuple(c))] for c in (BLUE, LIGHT_BLUE, RED))
+        w, h = blue.get_size()
+        # Centrado en la posición del vehículo; rojo si está bloqueado (stopped_for < 0)
+        if lane_name == "A":
+            ox, oy = CENTER_X - w // 2, CENTER_Y - LANE_OFFSET - h // 2
+            seq = [(red if sf < 0 else (blue if x < 0 else light), (ox + m_to_px(x), oy))
+                   for _vid, x, sf in vehicles]
+            lo = min(p[1][0] for p in seq)
+            hi = max(p[1][0] for p in seq)
+            band = pygame.Rect(lo, oy, hi - lo + w, h)
+        else:
+            ox, oy = CENTER_X + LANE_OFFSET - w // 2, CENTER_Y - h // 2
+            seq = [(red if sf < 0 else (blue if x < 0 else light), (ox, oy + m_to_px(x)))
+                   for _vid, x, sf in vehicles]
+            lo = min(p[1][1] for p in seq)
+            hi = max(p[1][1] for p in seq)
+            band = pygame.Rect(ox, lo, w, hi - lo + h)
+        return seq, band
+
+    def _draw_signals(self, phase):
+        draw_signals(self.screen, phase)
+        for r in signal_rects():
+            self.screen.blit(self.static.guides, r, r)
+
+    def draw(self, snap, positions, cfg, fps, speed, profiler=None, controls=CONTROLS):
+        screen = self.screen
+        key = self.static.key
+        bg = self.static.get(cfg)
+        if self.static.key != key:
+            self.full = True
+
+        blits = []
+        bands = []
+        for lane_name in ("A", "B"):
+            seq, band = self._blits(lane_name, positions[lane_name])
+            blits.extend(seq)
+            if band is not None:
+                bands.append(band.clip(self.screen_rect))
+
+        texts = hud_lines(snap, cfg, fps, speed, profiler, controls)
+        if len(texts) != len(self.hud.lines):
+            # Aparecen o desaparecen líneas (perfil): repintar todo
+            self.hud.lines = []
+            self.full = True
+        hud_changed = self.hud.update(texts)
+        if self.full:
+            screen.blit(bg, (0, 0))
+            self._draw_signals(snap.phase)
+            screen.blits(blits, doreturn=False)
+            for _text, surf, rect in self.hud.lines:
+                screen.blit(surf, rect)
+            pygame.display.flip()
+            self.full = False
+            self.prev_bands = bands
+            self.prev_phase = snap.phase
+            return
+
+        dirty = self.prev_bands + bands
+        if snap.phase != self.prev_phase:
+            dirty.extend(signal_rects())
+        hud_redraw = dict(hud_changed)
+        for i, (_text, _surf, rect) in enumerate(self.hud.lines):
+            if i not in hud_redraw and rect.collidelist(dirty) != -1:
+                hud_redraw[i] = rect
+        dirty.extend(hud_redraw.values())
+
+        for r in dirty:
+            screen.blit(bg, r, r)
+        self._draw_signals(snap.phase)
+        screen.blits(blits, doreturn=False)
+        for i in hud_redraw:
+            _text, surf, rect = self.hud.lines[i]
+            screen.blit(surf, rect)
+        pygame.display.update(dirty)
+        self.prev_bands = bands
+        self.prev_phase = snap.phase
+
+class SeekBar:
+    """Barra de posición de la reproducción; clic o arrastre para ir a un instante."""
+    def __init__(self, screen, t_start, t_end, height=8, margin=10):
+        self.screen = screen
+        self.t_start = t_start
+        self.t_end = t_end
+        self.rect = pygame.Rect(margin, SCREEN_H - margin - height, SCREEN_W - 2 * margin, height)
+        self.hit = self.rect.inflate(0, 16)  # área sensible al clic
+        self.dragging = False
+
+    def time_at(self, x):
+        frac = min(1.0, max(0.0, (x - self.rect.x) / self.rect.w))
+        return self.t_start + frac * (self.t_end - self.t_start)
+
+    def draw(self, t):
+        # Se dibuja encima de lo que haya pintado FrameRenderer y se actualiza solo su rect
+        span = self.t_end - self.t_start
+        frac = (t - self.t_start) / span if span > 0 else 1.0
+        pygame.draw.rect(self.screen, GRAY_DARK, self.rect)
+        pygame.draw.rect(self.screen, LIGHT_BLUE, (self.rect.x, self.rect.y, int(frac * self.rect.w), self.rect.h))
+        pygame.draw.rect(self.screen, WHITE, self.rect, 1)
+        pygame.display.update(self.rect)
+
+def open_window(caption):
+    """Ventana, reloj y FrameRenderer: el único camino de dibujo, en vivo y en la repetición."""
     pygame.init()
-    pygame.display.set_caption("Simulación de Semáforos Auto-Organizantes")
+    pygame.display.set_caption(caption)
     screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
-    clock = pygame.time.Clock()
     font = pygame.font.SysFont("consolas", 16)
+    return screen, pygame.time.Clock(), FrameRenderer(screen, font)
+
+def main():
+    _screen, clock, renderer = open_window("Simulación de Semáforos Auto-Organizantes")
 
     cfg = SimConfig(
         duration=1e9,         # corremos hasta que cierres
@@ -173,61 +350,127 @@ def main():
     )
     sim = Simulation(cfg)
 
-    running = True
-    paused = False
-    sim_speed = 1.0  # multiplicador de velocidad (pasos por frame)
+    # La simulación corre en su propio hilo; el dibujo toma la última instantánea
+    speed_idx = SPEEDS.index(10.0)
+    live = LiveSimulation(sim, speed=SPEEDS[speed_idx]).start()
+
+    profiler = None
 
+    running = True
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+            elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                renderer.full = True
             elif event.type == pygame.KEYDOWN:
                 if event.key in (pygame.K_ESCAPE, pygame.K_q):
                     running = False
                 elif event.key == pygame.K_p:
-                    paused = not paused
+                    live.paused = not live.paused
+                elif event.key == pygame.K_i:
+                    # Perfil por etapas: el hilo de simulación lo usa desde el próximo paso
+                    if profiler is None:
+                        profiler = StageProfiler().attach(sim)
+                    else:
+                        profiler.detach()
+                        profiler = None
                 elif event.key in (pygame.K_PLUS, pygame.K_EQUALS):
-                    sim_speed = min(5.0, sim_speed + 0.25)
+                    speed_idx = min(len(SPEEDS) - 1, speed_idx + 1)
+                    live.speed = SPEEDS[speed_idx]
                 elif event.key in (pygame.K_MINUS, pygame.K_UNDERSCORE):
-                    sim_speed = max(0.25, sim_speed - 0.25)
-
-        if not paused:
-            # Avanzar la simulación; ejecutar múltiples subpasos si sim_speed > 1
-            substeps = max(1, int(round(sim_speed)))
-            for _ in range(substeps):
-                sim.step_once()
-
-        # Dibujo
-        screen.fill(GRAY_DARK)
-        draw_roads(screen)
-        draw_signals(screen, sim.ctrl.phase)
-        draw_sensing_guides(screen, sim.cfg)
-
-        # Vehículos
-        for v in sim.lane_A.vehicles:
-            color = BLUE if v.x < 0 else Color(120, 200, 255)
-            # Si está bloqueado aguas abajo (tiempo_detenido negativo en our model) lo mostramos rojo
-            if v.stopped_for < 0:
-                color = RED
-            draw_vehicle(screen, "A", v.x, color=color)
-
-        for v in sim.lane_B.vehicles:
-            color = BLUE if v.x < 0 else Color(120, 200, 255)
-            if v.stopped_for < 0:
-                color = RED
-            draw_vehicle(screen, "B", v.x, color=color)
-
-        draw_hud(screen, font, sim)
-
-        pygame.display.flip()
+                    speed_idx = max(0, speed_idx - 1)
+                    live.speed = SPEEDS[speed_idx]
+
+        prev, snap = live.latest()
+        positions = interpolate(prev, snap, time.perf_counter())
+        renderer.draw(snap, positions, cfg, clock.get_fps(), live.speed, profiler)
         clock.tick(60)
 
+    live.stop()
     pygame.quit()
     sys.exit(0)
 
+def replay_main(directory, start=None, speed=10.0):
+    """Reproduce un registro de src.run --record; ir a cualquier instante es inmediato."""
+    replay = Replay(directory)
+    cfg = replay.cfg
+    speed_idx = min(range(len(REPLAY_SPEEDS)), key=lambda i: abs(REPLAY_SPEEDS[i] - speed))
+
+    screen, clock, renderer = open_window(f"Repetición: {directory}")
+    bar = SeekBar(screen, replay.t_start, replay.t_end)
+    clock_t = ReplayClock(replay, start, REPLAY_SPEEDS[speed_idx])
+    end_txt = format_time(replay.t_end)
+
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                renderer.full = True
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and bar.hit.collidepoint(event.pos):
+                bar.dragging = True
+                clock_t.seek(bar.time_at(event.pos[0]))
+            elif event.type == pygame.MOUSEMOTION and bar.dragging:
+                clock_t.seek(bar.time_at(event.pos[0]))
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                bar.dragging = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key in (pygame.K_ESCAPE, pygame.K_q):
+                    running = False
+                elif event.key in (pygame.K_p, pygame.K_SPACE):
+                    clock_t.paused = not clock_t.paused
+                elif event.key == pygame.K_RIGHT:
+                    clock_t.skip(10.0)
+                elif event.key == pygame.K_LEFT:
+                    clock_t.skip(-10.0)
+                elif event.key == pygame.K_PAGEUP:
+                    clock_t.skip(600.0)
+                elif event.key == pygame.K_PAGEDOWN:
+                    clock_t.skip(-600.0)
+                elif event.key == pygame.K_HOME:
+                    clock_t.seek(replay.t_start)
+                elif event.key == pygame.K_END:
+                    clock_t.seek(replay.t_end)
+                elif event.key in (pygame.K_PLUS, pygame.K_EQUALS):
+                    speed_idx = min(len(REPLAY_SPEEDS) - 1, speed_idx + 1)
+                    clock_t.speed = REPLAY_SPEEDS[speed_idx]
+                elif event.key in (pygame.K_MINUS, pygame.K_UNDERSCORE):
+                    speed_idx = max(0, speed_idx - 1)
+                    clock_t.speed = REPLAY_SPEEDS[speed_idx]
+
+        t = clock_t.tick()
+        state = "pausa" if clock_t.paused else ("fin" if clock_t.at_end else "reproduciendo")
+        controls = (
+            f"registro {format_time(t)} / {end_txt}   ({state})",
+            "Controles: P/ESPACIO pausa | <-/-> 10 s | RePág/AvPág 10 min | Inicio/Fin | +/- vel. | clic en la barra | ESC",
+        )
+        snap = replay.snapshot(t, sim_rate=clock_t.speed / cfg.dt)
+        renderer.draw(snap, replay.positions(t), cfg, clock.get_fps(), clock_t.speed, controls=controls)
+        bar.draw(t)
+        clock.tick(60)
+
+    pygame.quit()
+    sys.exit(0)
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Ventana de la simulación o reproducción de un registro.")
+    p.add_argument("--replay", metavar="DIR", default=None,
+                   help="reproducir un registro de python -m src.run --record DIR en lugar de simular")
+    p.add_argument("--start", type=parse_time, default=None, metavar="T",
+                   help="con --replay, instante inicial (s o h:m:s)")
+    p.add_argument("--speed", type=float, default=10.0,
+                   help="con --replay, velocidad inicial (1 a 1000 veces el tiempo real)")
+    return p.parse_args(argv)
+
 if __name__ == "__main__":
     try:
-        main()
+        args = parse_args()
+        if args.replay:
+            replay_main(args.replay, args.start, args.speed)
+        else:
+            main()
     except Exception as e:
         import traceback
         traceback.print_exc()
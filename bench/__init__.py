@@ -0,0 +1,9 @@
+"""
+Benchmarks de rendimiento y comprobaciones de determinismo del motor.
+
+    python -m bench run --out resultados.json      # matriz completa
+    python -m bench check --tolerance 0.25         # falla si el rendimiento cae
+    python -m bench golden                         # equivalencia exacta de los caminos rápidos
+
+Ver bench/suite.py (mediciones) y bench/golden.py (trayectorias de referencia).
+"""
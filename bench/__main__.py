@@ -0,0 +1,189 @@
+"""
+Línea de comandos de los benchmarks (ejecutar desde la raíz del repositorio).
+
+    python -m bench run [--quick] [--engines reference,numpy] [--repeat 3] [--out archivo.json]
+    python -m bench check [--quick] [--baseline bench/baseline.json] [--tolerance 0.35] [--results archivo.json]
+    python -m bench golden [--engines ...] [--update]
+    python -m bench convergence [--quick] [--tolerance 0.05] [--workers 4] [--out archivo.json]
+
+`check` mide con los mismos ajustes (matriz y motores) que la línea base (con --quick,
+solo el punto reducido), salvo que se le pase --results con una medición ya hecha. Las métricas se
+normalizan por la velocidad de la máquina medida en cada corrida (suite.calibrate) y se compara la
+mediana por medición y motor a lo largo de la matriz. Termina con código 1 si alguna mediana cae más
+que la tolerancia, o si algún motor no reproduce golden.json.
+`convergence` (bench/convergence.py) termina con código 1 si con integrator="exact" y
+dt = 1 alguna métrica se aparta de la referencia con dt = 0.05 más que la tolerancia.
+"""
+import argparse
+import json
+import os
+import sys
+
+from . import convergence, golden, suite
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Por encima del ruido medido entre corridas en una misma máquina con las métricas
+# normalizadas: hasta 17% en la mediana de la matriz completa y 22% con --quick
+CHECK_TOLERANCE = 0.35
+
+
+def _engines(text: str, valid) -> list:
+    names = [e.strip() for e in text.split(",") if e.strip()]
+    unknown = [e for e in names if e not in valid]
+    if unknown:
+        raise ValueError(f"motores desconocidos: {', '.join(unknown)} (válidos: {', '.join(valid)})")
+    return names
+
+
+def _progress(key: str):
+    print(f"  {key}", file=sys.stderr, flush=True)
+
+
+def _points(quick: bool):
+    return suite.matrix(**suite.QUICK) if quick else suite.matrix()
+
+
+def _write_json(data, path: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=1)
+        fh.write("\n")
+    os.replace(tmp, path)
+
+
+def cmd_run(args) -> int:
+    engines = _engines(args.engines, suite.ENGINES)
+    report = suite.run_suite(_points(args.quick), engines, args.repeat, progress=_progress)
+    report["settings"]["quick"] = args.quick
+    print(suite.format_results(report["results"]))
+    if args.out:
+        _write_json(report, args.out)
+        print(f"resultados en {args.out}", file=sys.stderr)
+    return 0
+
+
+def cmd_check(args) -> int:
+    with open(args.baseline, "r", encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    if args.results:
+        with open(args.results, "r", encoding="utf-8") as fh:
+            current = json.load(fh)
+    else:
+        settings = baseline["settings"]
+        current = suite.run_suite(_points(args.quick or settings.get("quick", False)), settings["engines"],
+                                  args.repeat or settings["repeat"], progress=_progress)
+    if current["environment"] != baseline["environment"]:
+        print("aviso: la línea base se midió en otro entorno:", json.dumps(baseline["environment"]), file=sys.stderr)
+    if not (baseline.get("calibration_per_s") and current.get("calibration_per_s")):
+        print("aviso: sin calibración en alguna de las mediciones; se comparan valores absolutos", file=sys.stderr)
+    rows, regressions = suite.compare(baseline, current, args.tolerance)
+    for row in rows:
+        print(f"{row['key']:<70} {row['metric']:<24} {row['ratio']:>7.3f}")
+    if not rows:
+        print("error: ninguna medición en común con la línea base", file=sys.stderr)
+        return 2
+    failed = bool(regressions)
+    if args.golden:
+        problems = golden.verify()
+        for p in problems:
+            print(f"golden: {p}", file=sys.stderr)
+        failed = failed or bool(problems)
+    if regressions:
+        print(f"{len(regressions)} regresiones (tolerancia {100.0 * args.tolerance:.0f}% en la mediana):", file=sys.stderr)
+        for r in regressions:
+            print(f"  {r}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_golden(args) -> int:
+    if args.update:
+        data = golden.update()
+        print(f"golden.json actualizado: {len(data['scenarios'])} escenarios", file=sys.stderr)
+        return 0
+    engines = _engines(args.engines, golden.ALL_ENGINES)
+    problems = golden.verify(engines)
+    for p in problems:
+        print(p)
+    if problems:
+        return 1
+    print(f"ok: {', '.join(engines)} reproducen golden.json", file=sys.stderr)
+    return 0
+
+
+def cmd_convergence(args) -> int:
+    kwargs = {}
+    if args.quick:
+        q = convergence.QUICK
+        kwargs = {"scenarios": [sc for sc in convergence.SCENARIOS if sc["name"] in q["scenarios"]],
+                  "replications": q["replications"], "run_s": q["run_s"]}
+    if args.replications:
+        kwargs["replications"] = args.replications
+
+    def progress(done, total):
+        print(f"\r{done}/{total} corridas", end="", file=sys.stderr, flush=True)
+
+    report = convergence.run_convergence(workers=args.workers, progress=progress, **kwargs)
+    print(file=sys.stderr)
+    print(convergence.format_report(report))
+    if args.out:
+        _write_json(report, args.out)
+        print(f"resultados en {args.out}", file=sys.stderr)
+    problems = convergence.check(report, args.tolerance)
+    for p in problems:
+        print(f"fuera de tolerancia: {p}", file=sys.stderr)
+    if problems:
+        return 1
+    print(f"ok: exact con dt={convergence.CHECK_DT:g} dentro de {100.0 * args.tolerance:.0f}% de la referencia",
+          file=sys.stderr)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m bench", description="Benchmarks y determinismo del motor.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    r = sub.add_parser("run", help="medir la matriz y mostrar las curvas")
+    r.add_argument("--quick", action="store_true", help="un solo punto de la matriz")
+    r.add_argument("--engines", default="reference", help=f"separados por coma ({', '.join(suite.ENGINES)})")
+    r.add_argument("--repeat", type=int, default=3, help="repeticiones por medición (se toma la mejor)")
+    r.add_argument("--out", help="guardar el resultado en JSON (p. ej. bench/baseline.json)")
+    r.set_defaults(func=cmd_run)
+
+    c = sub.add_parser("check", help="comparar contra la línea base; código 1 si hay regresión")
+    c.add_argument("--baseline", default=BASELINE_PATH)
+    c.add_argument("--results", help="usar esta medición en vez de medir de nuevo")
+    c.add_argument("--quick", action="store_true", help="medir solo el punto reducido de la matriz")
+    c.add_argument("--tolerance", type=float, default=CHECK_TOLERANCE,
+                   help=f"caída relativa admitida de la mediana (por defecto: {CHECK_TOLERANCE:g})")
+    c.add_argument("--repeat", type=int, default=None)
+    c.add_argument("--golden", action="store_true", help="además, verificar golden.json")
+    c.set_defaults(func=cmd_check)
+
+    g = sub.add_parser("golden", help="verificar (o regenerar) las trayectorias de referencia")
+    g.add_argument("--engines", default=",".join(golden.ALL_ENGINES))
+    g.add_argument("--update", action="store_true", help="regenerar golden.json con el motor de referencia")
+    g.set_defaults(func=cmd_golden)
+
+    v = sub.add_parser("convergence", help="métricas con dt grandes contra la referencia con dt chico")
+    v.add_argument("--quick", action="store_true", help="un escenario, menos réplicas y corridas más cortas")
+    v.add_argument("--tolerance", type=float, default=convergence.TOLERANCE,
+                   help=f"error relativo admitido con exact y dt={convergence.CHECK_DT:g} "
+                        f"(por defecto: {convergence.TOLERANCE:g})")
+    v.add_argument("--replications", type=int, default=None, help="réplicas por dt e integrador")
+    v.add_argument("--workers", type=int, default=None, help="procesos (por defecto: todos los núcleos)")
+    v.add_argument("--out", help="guardar el resultado en JSON")
+    v.set_defaults(func=cmd_convergence)
+    return p
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Convergencia en dt: métricas con pasos grandes contra una referencia con paso chico.
+
+Para cada escenario de SCENARIOS se corren `replications` réplicas con cada
+integrador de INTEGRATORS y cada dt de DTS; se descartan los primeros WARMUP_S s
+y se miden RUN_S s. Las llegadas son "schedule" (instantes precalculados que no
+dependen del paso), así que la réplica k ve las mismas llegadas con todos los dt y
+las diferencias entre dt no son ruido de muestreo. La referencia es
+integrator="exact" con REFERENCE_DT. Se comprueba que con "exact" y CHECK_DT
+ninguna métrica se aparte de la referencia más que la tolerancia relativa
+(código 1 si no).
+
+Métricas: throughput (salidas/h), delay y travel_time (s por vehículo salido),
+stops (por vehículo salido), queue (vehículos aguas arriba, media por paso) y
+switches (cambios de fase por hora). También se mide el tiempo de reloj por hora
+simulada.
+
+integrator="exact" es otro modelo, no una forma más rápida de calcular el de
+Euler: sigue al de adelante sin la frenada en seco de Euler (velocidad 0 cuando
+la distancia baja de safe_gap), el contador en rojo suma vehículo-segundos por
+COUNTER_DT y p_block es una probabilidad por cada 0.2 s. Por eso el reporte
+agrega, por escenario, la diferencia de modelo: "exact" contra "euler" con
+REFERENCE_DT (model_gap). No se compara con la tolerancia; solo la convergencia
+en dt de "exact" es el control.
+
+Los escenarios no tienen bloqueos (p_block = 0): cada réplica con bloqueos
+termina detenida en ALL_RED (un vehículo detenido pasada la línea no arranca en
+rojo) en un instante que cambia con el paso, y las métricas varían tanto entre
+réplicas que una tolerancia que las acepte no controla nada.
+"""
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.config import make_config
+from src.metrics import Metrics
+from src.sim_core import Simulation
+
+SCENARIOS: List[Dict[str, Any]] = [
+    {"name": "low", "params": {"lambda_a": 0.15, "lambda_b": 0.1, "p_block": 0.0, "arrivals": "schedule"}},
+    {"name": "default", "params": {"lambda_a": 0.35, "lambda_b": 0.25, "p_block": 0.0, "arrivals": "schedule"}},
+    {"name": "high", "params": {"lambda_a": 0.5, "lambda_b": 0.4, "p_block": 0.0, "arrivals": "schedule"}},
+]
+INTEGRATORS = ("euler", "exact")
+DTS = (0.05, 0.2, 0.5, 1.0)
+REFERENCE_DT = 0.05
+CHECK_DT = 1.0
+REPLICATIONS = 8
+WARMUP_S = 600.0
+RUN_S = 3600.0
+TOLERANCE = 0.05
+# --quick: un escenario, menos réplicas y corridas más cortas
+QUICK = {"scenarios": ("default",), "replications": 4, "run_s": 1800.0}
+
+METRICS = ("throughput", "delay", "travel_time", "stops", "queue", "switches")
+
+
+def run_one(params: Dict[str, Any], integrator: str, dt: float, seed: int,
+            warmup: float = WARMUP_S, run_s: float = RUN_S) -> Dict[str, float]:
+    """Una réplica: métricas de los run_s s posteriores al calentamiento."""
+    cfg = make_config(params, integrator=integrator, dt=dt, seed=seed)
+    sim = Simulation(cfg)
+    sim.run_for(warmup)
+    switches = sim.ctrl.switches
+    m = Metrics(sim)
+    t0 = time.perf_counter()
+    sim.run_for(run_s)
+    wall = time.perf_counter() - t0
+    m.detach()
+    exited = delay = travel = stops = queue = 0.0
+    for d in m.directions.values():
+        exited += d.exited
+        delay += d.delay.acc.mean * d.delay.acc.n
+        travel += d.travel.acc.mean * d.travel.acc.n
+        stops += d.stops.acc.mean * d.stops.acc.n
+        queue += sum(k * c for k, c in enumerate(d.queue.counts))
+    elapsed = m.steps * dt
+    return {
+        "throughput": 3600.0 * exited / elapsed,
+        "delay": delay / exited if exited else float("nan"),
+        "travel_time": travel / exited if exited else float("nan"),
+        "stops": stops / exited if exited else float("nan"),
+        "queue": queue / m.steps,
+        "switches": 3600.0 * (sim.ctrl.switches - switches) / elapsed,
+        "wall_per_h": wall * 3600.0 / elapsed,
+    }
+
+
+def _task(args: Tuple) -> Tuple[Tuple, Dict[str, float]]:
+    key, params, warmup, run_s = args
+    _, integrator, dt, seed = key
+    return key, run_one(params, integrator, dt, seed, warmup, run_s)
+
+
+def _mean_se(values: Sequence[float]) -> Tuple[float, float]:
+    mean = statistics.fmean(values)
+    se = statistics.stdev(values) / len(values) ** 0.5 if len(values) > 1 else 0.0
+    return mean, se
+
+
+def run_convergence(scenarios: Sequence[Dict[str, Any]] = SCENARIOS, integrators: Sequence[str] = INTEGRATORS,
+                    dts: Sequence[float] = DTS, replications: int = REPLICATIONS, warmup: float = WARMUP_S,
+                    run_s: float = RUN_S, workers: Optional[int] = None,
+                    progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Medias y errores estándar por (escenario, integrador, dt) y error relativo de
+    cada media respecto de la referencia.
+    """
+    if REFERENCE_DT not in dts or "exact" not in integrators:
+        raise ValueError(f"hace falta la referencia: integrator \"exact\" y dt={REFERENCE_DT:g}")
+    by_name = {sc["name"]: sc for sc in scenarios}
+    tasks = [((sc["name"], integrator, dt, 1000 + rep), sc["params"], warmup, run_s)
+             for sc in scenarios for integrator in integrators for dt in dts for rep in range(replications)]
+    runs: Dict[Tuple, List[Dict[str, float]]] = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        for done, (key, row) in enumerate(pool.map(_task, tasks), 1):
+            runs.setdefault(key[:3], []).append(row)
+            if progress is not None:
+                progress(done, len(tasks))
+
+    results = []
+    for name in by_name:
+        ref = {k: _mean_se([r[k] for r in runs[(name, "exact", REFERENCE_DT)]])[0] for k in METRICS}
+        for integrator in integrators:
+            for dt in dts:
+                rows = runs[(name, integrator, dt)]
+                entry = {"scenario": name, "integrator": integrator, "dt": dt, "replications": len(rows),
+                         "wall_per_h": statistics.fmean(r["wall_per_h"] for r in rows), "metrics": {}}
+                for k in METRICS:
+                    mean, se = _mean_se([r[k] for r in rows])
+                    rel = (mean - ref[k]) / ref[k] if ref[k] else 0.0
+                    entry["metrics"][k] = {"mean": mean, "se": se, "rel_error": rel}
+                results.append(entry)
+    # Diferencia de modelo: "euler" contra "exact", los dos con REFERENCE_DT
+    model_gap = {}
+    if "euler" in integrators:
+        for entry in results:
+            if entry["integrator"] == "euler" and entry["dt"] == REFERENCE_DT:
+                model_gap[entry["scenario"]] = {k: s["rel_error"] for k, s in entry["metrics"].items()}
+    return {
+        "settings": {"scenarios": list(scenarios), "dts": list(dts), "integrators": list(integrators),
+                     "replications": replications, "warmup_s": warmup, "run_s": run_s,
+                     "reference": {"integrator": "exact", "dt": REFERENCE_DT}},
+        "results": results,
+        "model_gap": model_gap,
+    }
+
+
+def check(report: Dict[str, Any], tolerance: float = TOLERANCE, dt: float = CHECK_DT) -> List[str]:
+    """Métricas de "exact" con `dt` que se apartan de la referencia más que la tolerancia."""
+    problems = []
+    for entry in report["results"]:
+        if entry["integrator"] != "exact" or entry["dt"] != dt:
+            continue
+        for k, stat in entry["metrics"].items():
+            if not abs(stat["rel_error"]) <= tolerance:
+                problems.append(f"{entry['scenario']} / {k}: {100.0 * stat['rel_error']:+.1f}% con dt={dt:g}")
+    return problems
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Una tabla por escenario: media y error relativo contra la referencia (el error estándar queda en el JSON)."""
+    lines = []
+    by_scenario: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in report["results"]:
+        by_scenario.setdefault(entry["scenario"], []).append(entry)
+    for name, entries in by_scenario.items():
+        lines.append(f"{name} (referencia: exact dt={REFERENCE_DT:g}, {entries[0]['replications']} réplicas)")
+        lines.append(f"  {'integrador':<10} {'dt':>5} {'s/h sim':>8}  " + "  ".join(f"{k:>18}" for k in METRICS))
+        for e in entries:
+            cells = []
+            for k in METRICS:
+                s = e["metrics"][k]
+                cells.append(f"{s['mean']:>8.2f} {100.0 * s['rel_error']:>+8.1f}%")
+            lines.append(f"  {e['integrator']:<10} {e['dt']:>5g} {e['wall_per_h']:>8.2f}  " + "  ".join(cells))
+        gap = report.get("model_gap", {}).get(name)
+        if gap:
+            lines.append(f"  modelo: euler contra exact con dt={REFERENCE_DT:g}: "
+                         + ", ".join(f"{k} {100.0 * gap[k]:+.1f}%" for k in METRICS))
+        lines.append("")
+    return "\n".join(lines)
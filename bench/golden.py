@@ -0,0 +1,211 @@
+"""
+Trayectorias de referencia (golden) para comprobar equivalencia exacta.
+
+Para cada escenario de SCENARIOS se guarda en golden.json un resumen SHA-256 del
+estado completo cada EVERY pasos: fase, temporizador, contadores en rojo, cambios,
+completados y (vid, x, v, stopped_for) de cada vehículo, ordenados por vid y con
+-0.0 normalizado a 0.0. Los resúmenes los produce el motor de referencia (Lane,
+paso fijo); cada camino rápido debe reproducirlos bit a bit:
+
+- numpy, event, event-numpy: Simulation con lane_backend / time_advance
+- batch: todas las réplicas knuth en un solo BatchSimulation
+- profiled: con src.profiling.StageProfiler enganchado
+- event-profiled: avance por eventos con el perfilador (StageProfiler.jump)
+- checkpoint: pasando por src.checkpoint.dumps/loads en cada punto de control
+
+Los escenarios con integrator="exact" solo los corren los motores de Lane con paso
+fijo (reference, profiled, checkpoint); ver supports().
+
+Un camino rápido nuevo se agrega en ENGINES (y, si no es un Simulation, con su
+propia función de trayectoria como _batch_digests).
+Si golden.json se regenera porque cambió el motor, subir sim_core.ENGINE_VERSION
+para invalidar los resultados guardados por src/service.py.
+"""
+import hashlib
+import json
+import os
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src import checkpoint
+from src.batch import BatchSimulation
+from src.config import make_config
+from src.controller import Phase
+from src.profiling import StageProfiler
+from src.sim_core import SimConfig, Simulation
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden.json")
+FORMAT_VERSION = 1
+STEPS = 3000
+EVERY = 500
+
+_PHASE_CODE = {p: i for i, p in enumerate(Phase)}
+
+SCENARIOS: List[Dict[str, Any]] = [
+    {"name": "default", "params": {}},
+    {"name": "dense-blocks", "params": {"seed": 1, "lambda_a": 0.9, "lambda_b": 0.72, "p_block": 0.1}},
+    {"name": "sparse", "params": {"seed": 2, "lambda_a": 0.05, "lambda_b": 0.04, "p_block": 0.0}},
+    {"name": "heavy-blocks", "params": {"seed": 3, "lambda_a": 0.5, "lambda_b": 0.4, "p_block": 0.3}},
+    {"name": "long-road", "params": {"seed": 4, "road_length": 600.0}},
+    {"name": "schedule", "params": {"seed": 5, "arrivals": "schedule"}},
+    {"name": "rate-profile", "params": {"seed": 6, "arrivals": "schedule", "profile_period": 600.0,
+                                        "rate_profile": [[0.0, 0.5], [300.0, 2.0], [600.0, 0.5]]}},
+    {"name": "split-streams", "params": {"seed": 7, "lambda_a": 0.5, "lambda_b": 0.4, "p_block": 0.1,
+                                         "rng_streams": "split"}},
+    {"name": "antithetic", "params": {"seed": 8, "lambda_a": 0.5, "lambda_b": 0.4, "p_block": 0.1,
+                                      "rng_streams": "split", "antithetic": True}},
+    {"name": "exact-dt1", "params": {"seed": 9, "dt": 1.0, "lambda_a": 0.5, "lambda_b": 0.4, "p_block": 0.05,
+                                     "integrator": "exact"}},
+]
+
+
+def state_digest(phase: int, t_in_phase: float, red_A: float, red_B: float, switches: int,
+                 completed_A: int, completed_B: int, lanes) -> str:
+    """lanes: por carril, (vid, x, v, stopped_for) como secuencias."""
+    h = hashlib.sha256()
+    h.update(np.array([phase, switches, completed_A, completed_B], dtype="<i8").tobytes())
+    h.update((np.array([t_in_phase, red_A, red_B], dtype="<f8") + 0.0).tobytes())
+    for vid, x, v, sf in lanes:
+        vid = np.asarray(vid, dtype="<i8")
+        order = np.argsort(vid, kind="stable")
+        h.update(np.int64(len(vid)).tobytes())
+        h.update(vid[order].tobytes())
+        for col in (x, v, sf):
+            h.update((np.asarray(col, dtype="<f8")[order] + 0.0).tobytes())
+    return h.hexdigest()[:32]
+
+
+def sim_digest(sim: Simulation) -> str:
+    ctrl = sim.ctrl
+    lanes = []
+    for lane in (sim.lane_A, sim.lane_B):
+        cols = lane.snapshot_vehicles()
+        lanes.append((cols["vid"], cols["x"], cols["v"], cols["stopped_for"]))
+    return state_digest(_PHASE_CODE[ctrl.phase], ctrl.t_in_phase, ctrl.red_counter_A, ctrl.red_counter_B,
+                        ctrl.switches, sim.completed_A, sim.completed_B, lanes)
+
+
+def _sim_digests(cfg: SimConfig, steps: int, every: int, profiled: bool = False,
+                 roundtrip: bool = False) -> List[str]:
+    sim = Simulation(cfg)
+    prof = StageProfiler().attach(sim) if profiled else None
+    out = []
+    done = 0
+    while done < steps:
+        target = min(done + every, steps)
+        while done < target:
+            done += sim.advance(target - done)
+        out.append(sim_digest(sim))
+        if roundtrip:
+            sim = checkpoint.loads(checkpoint.dumps(sim))
+    if prof is not None:
+        prof.detach()
+    return out
+
+
+def _batch_digests(cfgs: Sequence[SimConfig], steps: int, every: int) -> List[List[str]]:
+    batch = BatchSimulation(cfgs)
+    ctrl = batch.ctrl
+    out: List[List[str]] = [[] for _ in cfgs]
+    for done in range(1, steps + 1):
+        batch.step_once()
+        if done % every and done != steps:
+            continue
+        for i in range(len(cfgs)):
+            lanes = []
+            for lane in (batch.lane_A, batch.lane_B):
+                n = lane.n[i]
+                lanes.append((lane.vid[i, :n], lane.x[i, :n], lane.v[i, :n], lane.stopped_for[i, :n]))
+            out[i].append(state_digest(int(ctrl.phase[i]), ctrl.t_in_phase[i], ctrl.red_counter_A[i],
+                                       ctrl.red_counter_B[i], int(ctrl.switches[i]),
+                                       int(batch.completed_A[i]), int(batch.completed_B[i]), lanes))
+    return out
+
+
+ENGINES: Dict[str, Callable[[SimConfig, int, int], List[str]]] = {
+    "reference": lambda cfg, steps, every: _sim_digests(cfg, steps, every),
+    "numpy": lambda cfg, steps, every: _sim_digests(replace(cfg, lane_backend="numpy"), steps, every),
+    "event": lambda cfg, steps, every: _sim_digests(replace(cfg, time_advance="event"), steps, every),
+    "event-numpy": lambda cfg, steps, every: _sim_digests(replace(cfg, time_advance="event", lane_backend="numpy"),
+                                                          steps, every),
+    "profiled": lambda cfg, steps, every: _sim_digests(cfg, steps, every, profiled=True),
+    "event-profiled": lambda cfg, steps, every: _sim_digests(replace(cfg, time_advance="event"), steps, every,
+                                                             profiled=True),
+    "checkpoint": lambda cfg, steps, every: _sim_digests(cfg, steps, every, roundtrip=True),
+}
+BATCH = "batch"
+ALL_ENGINES = tuple(ENGINES) + (BATCH,)
+# Motores que solo integran con Euler: omiten los escenarios con integrator="exact"
+EULER_ONLY = ("numpy", "event", "event-numpy", "event-profiled", BATCH)
+
+
+def supports(engine: str, cfg: SimConfig) -> bool:
+    if engine in EULER_ONLY and cfg.integrator != "euler":
+        return False
+    return engine != BATCH or cfg.arrivals == "knuth"
+
+
+def scenario_config(scenario: Dict[str, Any]) -> SimConfig:
+    return make_config(scenario["params"])
+
+
+def compute(engine: str, scenarios: Sequence[Dict[str, Any]] = SCENARIOS,
+            steps: int = STEPS, every: int = EVERY) -> Dict[str, Optional[List[str]]]:
+    """Resúmenes por escenario; None si el motor no admite el escenario."""
+    cfgs = {sc["name"]: scenario_config(sc) for sc in scenarios}
+    if engine == BATCH:
+        names = [name for name, cfg in cfgs.items() if supports(engine, cfg)]
+        digests = _batch_digests([cfgs[name] for name in names], steps, every) if names else []
+        out: Dict[str, Optional[List[str]]] = {name: None for name in cfgs}
+        out.update(zip(names, digests))
+        return out
+    if engine not in ENGINES:
+        raise ValueError(f"motor desconocido: {engine!r} (válidos: {', '.join(ALL_ENGINES)})")
+    run = ENGINES[engine]
+    return {name: run(cfg, steps, every) if supports(engine, cfg) else None for name, cfg in cfgs.items()}
+
+
+def load(path: str = GOLDEN_PATH) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as fh:
+        data = json.load(fh)
+    if data.get("version") != FORMAT_VERSION:
+        raise ValueError(f"versión de golden.json no soportada: {data.get('version')}")
+    return data
+
+
+def update(path: str = GOLDEN_PATH) -> Dict[str, Any]:
+    """Regenera golden.json con el motor de referencia (solo si el cambio de comportamiento es intencional)."""
+    digests = compute("reference")
+    data = {
+        "version": FORMAT_VERSION,
+        "steps": STEPS,
+        "every": EVERY,
+        "scenarios": [dict(sc, digests=digests[sc["name"]]) for sc in SCENARIOS],
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=1)
+        fh.write("\n")
+    os.replace(tmp, path)
+    return data
+
+
+def verify(engines: Sequence[str] = ALL_ENGINES, path: str = GOLDEN_PATH) -> List[str]:
+    """Compara cada motor con golden.json; devuelve los desacuerdos (vacío: todo igual)."""
+    data = load(path)
+    scenarios = data["scenarios"]
+    problems = []
+    for engine in engines:
+        got = compute(engine, scenarios, data["steps"], data["every"])
+        for sc in scenarios:
+            digests = got[sc["name"]]
+            if digests is None:
+                continue
+            for k, (want, have) in enumerate(zip(sc["digests"], digests)):
+                if want != have:
+                    step = min((k + 1) * data["every"], data["steps"])
+                    problems.append(f"{engine} / {sc['name']}: difiere a más tardar en el paso {step}")
+                    break
+    return problems
@@ -0,0 +1,309 @@
+"""
+Mediciones de rendimiento sobre una matriz de escenarios.
+
+Cada punto de la matriz (demanda lambda_a/lambda_b, road_length, p_block, más los
+puntos sueltos de EXTRA_POINTS) se
+calienta una vez (WARMUP_S simulados) y se guarda con src.checkpoint; todas las
+repeticiones parten de ese mismo estado, así miden exactamente el mismo trabajo.
+De cada medición se toma la mejor de `repeat` repeticiones.
+
+Mediciones (por motor):
+- step_once: pasos/s y actualizaciones de vehículo/s en régimen.
+- lane_step: Lane.step (tiempo de la etapa según src.profiling), vehículos/s.
+- sensors.<método>: llamadas/s de read_sensors y de los métodos sueltos de Lane,
+  cada una justo después de un paso (sin la caché de posiciones).
+- controller_step: llamadas/s de Controller.step con las lecturas de una corrida real.
+- run_for: la corrida completa desde t=0 (RUN_S simulados), pasos/s.
+
+Motores: "reference" (Lane, paso fijo), "numpy" (ArrayLane), "event" (avance por
+eventos; solo run_for) y "batch" (BatchSimulation con BATCH_REPLICAS réplicas;
+solo run_for, pasos de réplica/s).
+"""
+import itertools
+import platform
+import statistics
+import time
+from dataclasses import replace
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from src import checkpoint
+from src.batch import BatchSimulation
+from src.config import make_config
+from src.controller import Controller, ControllerConfig
+from src.profiling import StageProfiler
+from src.sim_core import SimConfig, Simulation
+
+# Matriz por defecto
+DEMANDS = ((0.1, 0.08), (0.35, 0.25), (0.7, 0.55))
+ROAD_LENGTHS = (180.0, 600.0)
+P_BLOCKS = (0.0, 0.05)
+# Fuera del producto: demanda baja sin bloqueos, donde el modo "event" puede saltar
+EXTRA_POINTS = ({"lambda_a": 0.05, "lambda_b": 0.04, "road_length": 180.0, "p_block": 0.0},)
+# Matriz reducida (--quick): un punto de la matriz por defecto
+QUICK = {"demands": ((0.35, 0.25),), "road_lengths": (180.0,), "p_blocks": (0.05,), "extra": ()}
+
+ENGINES = ("reference", "numpy", "event", "batch")
+WARMUP_S = 600.0
+MEASURE_STEPS = 1500
+RUN_S = 600.0
+BATCH_REPLICAS = 32
+
+SENSOR_METHODS = ("read_sensors", "count_red_zone", "count_close_to_line",
+                  "any_in_range_upstream", "has_stopped_downstream", "count_in_range_upstream")
+
+
+def matrix(demands=DEMANDS, road_lengths=ROAD_LENGTHS, p_blocks=P_BLOCKS,
+           extra=EXTRA_POINTS) -> List[Dict[str, float]]:
+    points = [{"lambda_a": la, "lambda_b": lb, "road_length": L, "p_block": pb}
+              for (la, lb), L, pb in itertools.product(demands, road_lengths, p_blocks)]
+    return points + [dict(p) for p in extra]
+
+
+def point_key(point: Dict[str, float]) -> str:
+    return "la={lambda_a:g},lb={lambda_b:g},L={road_length:g},pb={p_block:g}".format(**point)
+
+
+def engine_config(cfg: SimConfig, engine: str) -> SimConfig:
+    if engine == "numpy":
+        return replace(cfg, lane_backend="numpy")
+    if engine == "event":
+        return replace(cfg, time_advance="event")
+    return cfg
+
+
+def _best(fn, repeat: int) -> float:
+    return min(fn() for _ in range(repeat))
+
+
+# Mediciones en régimen (a partir del estado calentado)
+def _step_once(snap: bytes, steps: int) -> float:
+    sim = checkpoint.loads(snap)
+    step = sim.step_once
+    t0 = time.perf_counter()
+    for _ in range(steps):
+        step()
+    return time.perf_counter() - t0
+
+
+def _instrumented_pass(snap: bytes, steps: int) -> Dict[str, Any]:
+    """Pasada con perfilador: tiempo de Lane.step, sensores tras cada paso y lecturas para el controlador."""
+    sim = checkpoint.loads(snap)
+    cfg = sim.cfg
+    prof = StageProfiler().attach(sim)
+    clock = time.perf_counter_ns
+    lanes = (sim.lane_A, sim.lane_B)
+    calls = [
+        lambda ln: ln.read_sensors(cfg.d_detect, cfg.r_close, cfg.e_after),
+        lambda ln: ln.count_red_zone(cfg.d_detect),
+        lambda ln: ln.count_close_to_line(cfg.r_close),
+        lambda ln: ln.any_in_range_upstream(cfg.d_detect),
+        lambda ln: ln.has_stopped_downstream(cfg.e_after),
+        lambda ln: ln.count_in_range_upstream(ln.road_length),
+    ]
+    sensor_ns = [0] * len(calls)
+    readings = []
+    for _ in range(steps):
+        sim.step_once()
+        readings.append((sim.readings_A, sim.readings_B))
+        # Tras el paso la caché de posiciones está invalidada, como al leer en step_once
+        for i, call in enumerate(calls):
+            for lane in lanes:
+                t0 = clock()
+                call(lane)
+                sensor_ns[i] += clock() - t0
+            for lane in lanes:
+                if hasattr(lane, "_xs"):
+                    lane._xs = None
+    prof.detach()
+    rep = prof.report()
+    return {
+        "lane_step_s": rep["stages"]["lane_step"]["total_s"],
+        "vehicle_updates": rep["counters"]["vehicles_processed"],
+        "sensor_s": [ns / 1e9 for ns in sensor_ns],
+        "readings": readings,
+    }
+
+
+def _controller_replay(cfg: SimConfig, readings) -> float:
+    ctrl = Controller(ControllerConfig(
+        n_threshold=cfg.n_threshold, u_min_green=cfg.u_min_green, y_yellow=cfg.y_yellow,
+        m_small_platoon=cfg.m_small_platoon, d_detect=cfg.d_detect, r_close=cfg.r_close, e_after=cfg.e_after,
+    ))
+    args = [(ra.count_d, rb.count_d, ra.count_r, rb.count_r, ra.any_d, rb.any_d, ra.blocked, rb.blocked)
+            for ra, rb in readings]
+    step = ctrl.step
+    dt = cfg.dt
+    t0 = time.perf_counter()
+    for a in args:
+        step(dt, *a)
+    return time.perf_counter() - t0
+
+
+def _run_for(cfg: SimConfig, engine: str) -> float:
+    t0 = time.perf_counter()
+    if engine == "batch":
+        BatchSimulation.replications(cfg, seeds=range(cfg.seed, cfg.seed + BATCH_REPLICAS)).run_for(cfg.duration)
+    else:
+        Simulation(cfg).run_for(cfg.duration)
+    return time.perf_counter() - t0
+
+
+def _run_vehicle_updates(cfg: SimConfig) -> int:
+    sim = Simulation(cfg)
+    prof = StageProfiler().attach(sim)
+    sim.run_for(cfg.duration)
+    prof.detach()
+    return prof.vehicles
+
+
+def measure_point(point: Dict[str, float], engines: Sequence[str], repeat: int,
+                  steps: int = MEASURE_STEPS, base: Dict[str, Any] = None) -> Dict[str, Dict[str, float]]:
+    """Resultados {"<medición>/<motor>/<punto>": {métrica: valor}} de un punto de la matriz."""
+    key = point_key(point)
+    out: Dict[str, Dict[str, float]] = {}
+    for engine in engines:
+        cfg = engine_config(make_config(base or {}, duration=RUN_S, **point), engine)
+        rsteps = int(cfg.duration / cfg.dt)
+        if engine in ("reference", "numpy"):
+            warm = Simulation(cfg)
+            warm.run_for(WARMUP_S)
+            snap = checkpoint.dumps(warm)
+            wall = _best(lambda: _step_once(snap, steps), repeat)
+            passes = [_instrumented_pass(snap, steps) for _ in range(repeat)]
+            updates = passes[0]["vehicle_updates"]
+            out[f"step_once/{engine}/{key}"] = {
+                "steps_per_s": steps / wall,
+                "vehicle_updates_per_s": updates / wall,
+                "vehicles_mean": updates / steps,
+            }
+            lane_s = min(p["lane_step_s"] for p in passes)
+            out[f"lane_step/{engine}/{key}"] = {
+                "calls_per_s": 2 * steps / lane_s,
+                "vehicle_updates_per_s": updates / lane_s,
+            }
+            for i, name in enumerate(SENSOR_METHODS):
+                sec = min(p["sensor_s"][i] for p in passes)
+                out[f"sensors.{name}/{engine}/{key}"] = {"calls_per_s": 2 * steps / sec}
+            if engine == "reference":
+                readings = passes[0]["readings"]
+                ctrl_s = _best(lambda: _controller_replay(cfg, readings), repeat)
+                out[f"controller_step/{engine}/{key}"] = {"calls_per_s": len(readings) / ctrl_s}
+        wall = _best(lambda: _run_for(cfg, engine), repeat)
+        if engine == "batch":
+            out[f"run_for/{engine}/{key}"] = {"steps_per_s": BATCH_REPLICAS * rsteps / wall}
+        else:
+            # Mismas trayectorias en todos los motores: se cuentan con el de referencia
+            updates = _run_vehicle_updates(replace(cfg, lane_backend="list", time_advance="fixed"))
+            out[f"run_for/{engine}/{key}"] = {
+                "steps_per_s": rsteps / wall,
+                "vehicle_updates_per_s": updates / wall,
+                "vehicles_mean": updates / rsteps,
+            }
+    return out
+
+
+def calibrate(repeat: int = 5) -> float:
+    """
+    Velocidad de la máquina: iteraciones/s de una carga fija de Python puro que no
+    usa el motor (aritmética de floats, listas y un sort). `compare` divide por ella
+    para que la puerta no dependa de la máquina ni de su carga del momento.
+    """
+    n = 200_000
+
+    def work() -> float:
+        t0 = time.perf_counter()
+        acc = 0.0
+        xs = []
+        for i in range(n):
+            acc += i * 0.5 - acc * 1e-6
+            xs.append(acc % 97.0)
+        xs.sort()
+        return time.perf_counter() - t0
+
+    return n / _best(work, repeat)
+
+
+def environment() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor() or "",
+        "system": platform.system(),
+    }
+
+
+def run_suite(points: Iterable[Dict[str, float]], engines: Sequence[str] = ("reference",), repeat: int = 3,
+              progress=None) -> Dict[str, Any]:
+    for engine in engines:
+        if engine not in ENGINES:
+            raise ValueError(f"motor desconocido: {engine!r} (válidos: {', '.join(ENGINES)})")
+    results: Dict[str, Dict[str, float]] = {}
+    t0 = time.perf_counter()
+    calibration = [calibrate()]
+    for point in points:
+        results.update(measure_point(point, engines, repeat))
+        if progress is not None:
+            progress(point_key(point))
+    calibration.append(calibrate())
+    return {
+        "environment": environment(),
+        "calibration_per_s": statistics.median(calibration),
+        "settings": {"engines": list(engines), "repeat": repeat, "warmup_s": WARMUP_S,
+                     "measure_steps": MEASURE_STEPS, "run_s": RUN_S, "batch_replicas": BATCH_REPLICAS},
+        "wall_s": time.perf_counter() - t0,
+        "results": results,
+    }
+
+
+# Puerta de regresión
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Compara cada métrica de rendimiento (las que terminan en "_per_s") presente en
+    ambos, normalizada por la velocidad de la máquina (calibration_per_s) de cada
+    medición. Devuelve (filas, regresiones): hay regresión si la mediana de los
+    cocientes de una medición y motor a lo largo de la matriz cae por debajo de
+    1 - tolerance; un punto suelto es ruidoso y no alcanza.
+    """
+    scale = 1.0
+    if baseline.get("calibration_per_s") and current.get("calibration_per_s"):
+        scale = current["calibration_per_s"] / baseline["calibration_per_s"]
+    rows = []
+    groups: Dict[Tuple[str, str], List[float]] = {}
+    base = baseline["results"]
+    for key, metrics in sorted(current["results"].items()):
+        if key not in base:
+            continue
+        bench, engine, _point = key.split("/", 2)
+        for metric, value in metrics.items():
+            ref = base[key].get(metric)
+            if not metric.endswith("_per_s") or not ref:
+                continue
+            ratio = value / ref / scale
+            rows.append({"key": key, "metric": metric, "baseline": ref, "current": value, "ratio": ratio})
+            groups.setdefault((f"{bench}/{engine}", metric), []).append(ratio)
+    regressions = []
+    for (name, metric), ratios in sorted(groups.items()):
+        med = statistics.median(ratios)
+        if med < 1.0 - tolerance:
+            regressions.append(f"{name} {metric}: mediana {100.0 * (med - 1.0):+.1f}% en {len(ratios)} puntos")
+    return rows, regressions
+
+
+def format_results(results: Dict[str, Dict[str, float]]) -> str:
+    """Tabla por medición: curvas de rendimiento a lo largo de la matriz."""
+    lines = []
+    groups: Dict[str, List[Tuple[str, Dict[str, float]]]] = {}
+    for key, metrics in results.items():
+        bench, engine, point = key.split("/", 2)
+        groups.setdefault(f"{bench} [{engine}]", []).append((point, metrics))
+    for title, rows in groups.items():
+        cols = list(rows[0][1])
+        lines.append(title)
+        lines.append(f"  {'punto':<34}" + "".join(f"{c:>24}" for c in cols))
+        for point, metrics in rows:
+            lines.append(f"  {point:<34}" + "".join(f"{metrics.get(c, float('nan')):>24.6g}" for c in cols))
+    return "\n".join(lines)
@@ -0,0 +1,269 @@
+"""
+Fuentes de llegadas precalculadas para Lane (alternativa al sorteo de Knuth por paso).
+
+Todas exponen la misma interfaz:
+    next_time() -> float   instante de la próxima llegada (inf si no hay más)
+    take(t_end) -> int     cuántas llegadas hay antes de t_end; avanza el puntero
+
+- PoissonSchedule: tiempos entre llegadas exponenciales sorteados en bloques.
+- ProfileSchedule: Poisson no homogéneo con tasa variable en el tiempo (adelgazamiento).
+- TraceSource: repetición de un registro de llegadas en disco, mapeado en memoria.
+
+Un registro de texto se convierte una vez a .npy:
+    python -m src.arrivals detector_A.csv trace_A.npy
+"""
+import argparse
+import csv
+import os
+import sys
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_BLOCK = 4096
+
+
+class _BufferedSchedule:
+    """
+    Cronograma en un búfer que se rellena por bloques cuando se agota. El próximo
+    instante se guarda como float: en la mayoría de los pasos no hay llegadas y
+    take() se resuelve con una comparación.
+    """
+    def __init__(self, block: int):
+        self.block = block
+        self.times = np.empty(0)
+        self.pos = 0
+        self.t_last = 0.0
+        self._next = -np.inf
+        self._block_start = None  # (estado del generador, t_last) antes del bloque actual
+
+    def _refill(self):
+        """Carga el siguiente bloque (al menos un elemento) en times y pone pos = 0."""
+        raise NotImplementedError
+
+    def _load(self):
+        self._block_start = (self.rng.bit_generator.state, self.t_last)
+        self._refill()
+        self._next = float(self.times[0])
+
+    def next_time(self) -> float:
+        if self.pos >= len(self.times):
+            self._load()
+        return self._next
+
+    def reseed(self, seed: int, now: float):
+        """
+        Descarta el búfer y sigue desde `now` con otra semilla. Como el proceso de
+        Poisson no tiene memoria, la distribución de las llegadas futuras no cambia.
+        """
+        self.rng = np.random.default_rng(seed)
+        self.times = np.empty(0)
+        self.pos = 0
+        self.t_last = now
+        self._next = -np.inf
+        self._block_start = None
+
+    def take(self, t_end: float) -> int:
+        if t_end <= self._next:
+            return 0
+        count = 0
+        while True:
+            if self.pos >= len(self.times):
+                self._load()
+            i = int(np.searchsorted(self.times, t_end, side="left"))
+            count += i - self.pos
+            self.pos = i
+            if i < len(self.times):
+                self._next = float(self.times[i])
+                return count
+
+    def take_times(self, t_end: float) -> List[float]:
+        """Como take(), pero devuelve los instantes de las llegadas (integrator="exact")."""
+        if t_end <= self._next:
+            return []
+        out: List[float] = []
+        while True:
+            if self.pos >= len(self.times):
+                self._load()
+            i = int(np.searchsorted(self.times, t_end, side="left"))
+            out.extend(self.times[self.pos:i].tolist())
+            self.pos = i
+            if i < len(self.times):
+                self._next = float(self.times[i])
+                return out
+
+
+class PoissonSchedule(_BufferedSchedule):
+    """Llegadas de Poisson con tasa constante `rate` [veh/s]."""
+    def __init__(self, rate: float, seed: int, block: int = DEFAULT_BLOCK):
+        super().__init__(block)
+        self.rate = rate
+        self.rng = np.random.default_rng(seed)
+
+    def _refill(self):
+        if self.rate <= 0:
+            self.times = np.array([np.inf])
+            self.pos = 0
+            return
+        gaps = self.rng.exponential(1.0 / self.rate, self.block)
+        self.times = self.t_last + np.cumsum(gaps)
+        self.t_last = float(self.times[-1])
+        self.pos = 0
+
+
+class RateProfile:
+    """
+    Factor multiplicativo de la tasa en función del tiempo, lineal por tramos entre
+    los puntos (t, factor). Con period > 0 se repite (p. ej. 86400 para un día).
+    """
+    def __init__(self, points: Sequence[Tuple[float, float]], period: float = 0.0):
+        pts = sorted((float(t), float(f)) for t, f in points)
+        if not pts:
+            raise ValueError("el perfil necesita al menos un punto (t, factor)")
+        if any(f < 0 for _, f in pts):
+            raise ValueError("los factores del perfil deben ser >= 0")
+        self.t = np.array([p[0] for p in pts])
+        self.f = np.array([p[1] for p in pts])
+        self.period = period
+
+    @property
+    def max_factor(self) -> float:
+        return float(self.f.max())
+
+    def exhausted_after(self, t: float) -> bool:
+        """True si a partir de t la tasa es nula para siempre (perfil no periódico)."""
+        return self.period <= 0 and t >= self.t[-1] and self.f[-1] == 0.0
+
+    def __call__(self, t):
+        t = np.asarray(t, dtype=float)
+        if self.period > 0:
+            t = np.mod(t, self.period)
+        return np.interp(t, self.t, self.f)
+
+
+class ProfileSchedule(_BufferedSchedule):
+    """
+    Poisson no homogéneo con tasa rate * profile(t), por adelgazamiento: candidatos
+    de un Poisson homogéneo a la tasa máxima, aceptados con probabilidad
+    profile(t) / max_factor. Todo vectorizado por bloques.
+    """
+    def __init__(self, rate: float, profile: RateProfile, seed: int, block: int = DEFAULT_BLOCK):
+        super().__init__(block)
+        self.rate = rate
+        self.profile = profile
+        self.rng = np.random.default_rng(seed)
+
+    def _refill(self):
+        rate_max = self.rate * self.profile.max_factor
+        if rate_max <= 0:
+            self.times = np.array([np.inf])
+            self.pos = 0
+            return
+        accepted = np.empty(0)
+        while not len(accepted):
+            if self.profile.exhausted_after(self.t_last):
+                accepted = np.array([np.inf])
+                break
+            cand = self.t_last + np.cumsum(self.rng.exponential(1.0 / rate_max, self.block))
+            self.t_last = float(cand[-1])
+            u = self.rng.random(self.block)
+            accepted = cand[u * self.profile.max_factor < self.profile(cand)]
+        self.times = accepted
+        self.pos = 0
+
+
+class TraceSource:
+    """
+    Llegadas registradas: tiempos en segundos, ordenados, en un .npy (float64) o en
+    un archivo binario crudo de float64. El archivo se abre con mapeo en memoria, de
+    modo que solo se leen de disco las páginas que se van recorriendo. `offset` se
+    resta a los tiempos (para empezar la simulación en otro instante del registro).
+    """
+    WINDOW = 256
+
+    def __init__(self, path: str, offset: float = 0.0):
+        if path.endswith(".npy"):
+            self.times = np.load(path, mmap_mode="r")
+        else:
+            self.times = np.memmap(path, dtype=np.float64, mode="r")
+        self.offset = offset
+        self.pos = int(np.searchsorted(self.times, offset, side="left"))
+        self._next = self._time_at(self.pos)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _time_at(self, i: int) -> float:
+        return float(self.times[i]) - self.offset if i < len(self.times) else float("inf")
+
+    def next_time(self) -> float:
+        return self._next
+
+    def take(self, t_end: float) -> int:
+        if t_end <= self._next:
+            return 0
+        t_abs = t_end + self.offset
+        start = self.pos
+        n = len(self.times)
+        while self.pos < n:
+            window = self.times[self.pos:self.pos + self.WINDOW]
+            i = int(np.searchsorted(window, t_abs, side="left"))
+            self.pos += i
+            if i < len(window):
+                break
+        self._next = self._time_at(self.pos)
+        return self.pos - start
+
+    def take_times(self, t_end: float) -> List[float]:
+        """Como take(), pero devuelve los instantes de las llegadas (integrator="exact")."""
+        start = self.pos
+        count = self.take(t_end)
+        return [float(t) - self.offset for t in self.times[start:start + count]]
+
+
+def convert_trace(csv_path: str, out_path: str, column: int = 0, skip_header: bool = True) -> int:
+    """
+    Convierte un registro de texto (una marca de tiempo en segundos por fila) a un
+    .npy float64 ordenado, apto para TraceSource. Devuelve el número de llegadas.
+    """
+    with open(csv_path, "r", newline="", encoding="utf-8") as fh:
+        reader = csv.reader(fh)
+        if skip_header:
+            next(reader, None)
+        times = np.fromiter((float(row[column]) for row in reader if row), dtype=np.float64)
+    times.sort()
+    np.save(out_path, times)
+    return len(times)
+
+
+def make_source(kind: str, rate: float, seed: int, profile: Optional[RateProfile] = None,
+                trace_path: str = "", trace_offset: float = 0.0):
+    """Fuente según SimConfig.arrivals; None para el sorteo de Knuth por paso."""
+    if kind == "knuth":
+        return None
+    if kind == "schedule":
+        if profile is not None:
+            return ProfileSchedule(rate, profile, seed)
+        return PoissonSchedule(rate, seed)
+    if kind == "trace":
+        if not trace_path or not os.path.exists(trace_path):
+            raise ValueError(f"registro de llegadas inexistente: {trace_path!r}")
+        return TraceSource(trace_path, trace_offset)
+    raise ValueError(f"arrivals desconocido: {kind!r}")
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.arrivals",
+                                description="Convierte un registro CSV de llegadas a .npy para arrivals=\"trace\".")
+    p.add_argument("csv", help="CSV con una marca de tiempo (s) por fila")
+    p.add_argument("out", help="archivo .npy de salida")
+    p.add_argument("--column", type=int, default=0, help="columna con el tiempo (por defecto: 0)")
+    p.add_argument("--no-header", action="store_true", help="el CSV no tiene fila de encabezado")
+    args = p.parse_args(argv)
+    n = convert_trace(args.csv, args.out, column=args.column, skip_header=not args.no_header)
+    print(f"{n} llegadas -> {args.out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Réplicas en paralelo "lockstep": N intersecciones independientes (misma configuración
+con distintas semillas, o configuraciones distintas con el mismo dt) avanzan juntas
+como una sola computación sobre arreglos.
+
+Cada réplica reproduce exactamente lo que daría un Simulation escalar con su semilla:
+las llegadas y los bloqueos usan los mismos generadores por carril y réplica, y el
+resto (sensores, controlador, dinámica) son operaciones vectorizadas elemento a elemento
+equivalentes a las del motor escalar.
+"""
+from dataclasses import replace
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from .controller import (ADDS_A, ADDS_B, GREEN_A, GREEN_B, MASK_BITS, NEXT_PHASE, RESET_A, RESET_B,
+                         RESET_COUNTER, predicate_mask)
+from .lanes import lane_rngs
+from .sim_core import SimConfig
+
+# Tablas de src/controller.py como arreglos (búsqueda con índices vectorizada)
+_ADDS_A = np.array(ADDS_A, dtype=np.int64)
+_ADDS_B = np.array(ADDS_B, dtype=np.int64)
+_NEXT_PHASE = np.array(NEXT_PHASE, dtype=np.int8)
+_RESET_COUNTER = np.array(RESET_COUNTER, dtype=np.int8)
+
+_VEH_LENGTH = 4.5  # igual al valor por defecto de Vehicle.length
+
+
+class BatchLane:
+    """
+    El mismo carril en N réplicas. Estado por vehículo en arreglos 2-D (N, capacidad)
+    con relleno: la fila i tiene n[i] vehículos válidos en las columnas [0, n[i]),
+    ordenados por x como en Lane.
+
+    A diferencia de ArrayLane, una llegada corre la fila un lugar (_prepend, O(n)).
+    Aquí no conviene reservar espacio adelante: todas las réplicas comparten el
+    ancho de los arreglos y cada paso (sensores, step, bloqueos, salidas) ya
+    recorre N x capacidad, así que duplicar el ancho para dejar lugar libre
+    encarece todo el paso más de lo que ahorra en las llegadas, que mueven a lo
+    sumo una fila de n vehículos.
+    """
+    _COLUMNS = ("x", "v", "stopped_for", "length", "entered_at", "vid")
+
+    def __init__(self, name: str, road_length, v_max, safe_gap, p_block, t_block, seeds: Sequence[int],
+                 streams: Sequence[str] = None, antithetic: Sequence[bool] = None, capacity: int = 32):
+        N = len(seeds)
+        self.name = name
+        self.road_length = np.asarray(road_length, dtype=float)
+        self.v_max = np.asarray(v_max, dtype=float)
+        self.safe_gap = np.asarray(safe_gap, dtype=float)
+        self.p_block = np.asarray(p_block, dtype=float)
+        self.t_block = np.asarray(t_block, dtype=float)
+        # Por réplica: generador de llegadas y de bloqueos (el mismo objeto en "shared")
+        streams = streams or ["shared"] * N
+        antithetic = antithetic or [False] * N
+        pairs = [lane_rngs(s, st, anti) for s, st, anti in zip(seeds, streams, antithetic)]
+        self.rngs = [p[0] for p in pairs]
+        self.block_rngs = [p[1] for p in pairs]
+        self.next_vid = np.ones(N, dtype=np.int64)
+
+        self.n = np.zeros(N, dtype=np.int64)
+        self.x = np.zeros((N, capacity))
+        self.v = np.zeros((N, capacity))
+        self.stopped_for = np.zeros((N, capacity))
+        self.length = np.zeros((N, capacity))
+        self.entered_at = np.zeros((N, capacity))
+        self.vid = np.zeros((N, capacity), dtype=np.int64)
+
+    def valid(self) -> np.ndarray:
+        return np.arange(self.x.shape[1]) < self.n[:, None]
+
+    def _grow(self):
+        N, cap = self.x.shape
+        for name in self._COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((N, 2 * cap), dtype=old.dtype)
+            new[:, :cap] = old
+            setattr(self, name, new)
+
+    def spawn_poisson(self, rate, dt: float, now: float):
+        # Knuth por réplica con su propio RNG (mismo consumo que Lane.spawn_poisson)
+        limits = np.exp(-np.asarray(rate, dtype=float) * dt)
+        for i, rng in enumerate(self.rngs):
+            L = limits[i]
+            k = 0
+            p = 1.0
+            while p > L:
+                k += 1
+                p *= rng.random()
+            for _ in range(k - 1):
+                self._prepend(i, now)
+
+    def _prepend(self, i: int, now: float):
+        n = self.n[i]
+        x0 = -self.road_length[i]
+        if n and (self.x[i, 0] - x0) < self.safe_gap[i]:
+            return
+        if n + 1 > self.x.shape[1]:
+            self._grow()
+        for name in self._COLUMNS:
+            arr = getattr(self, name)
+            arr[i, 1:n+1] = arr[i, :n]
+        self.x[i, 0] = x0
+        self.v[i, 0] = self.v_max[i] * 0.85
+        self.stopped_for[i, 0] = 0.0
+        self.length[i, 0] = _VEH_LENGTH
+        self.entered_at[i, 0] = now
+        self.vid[i, 0] = self.next_vid[i]
+        self.next_vid[i] += 1
+        self.n[i] = n + 1
+
+    def _count_in(self, valid, lo, hi) -> np.ndarray:
+        x = self.x
+        return np.count_nonzero(valid & (x >= lo[:, None]) & (x < hi[:, None]), axis=1)
+
+    def read_sensors(self, d, r, e, v_thresh: float = 0.1, min_time: float = 0.5):
+        """Arreglos (N,) equivalentes a los campos de LaneReading."""
+        valid = self.valid()
+        zero = np.zeros_like(d)
+        count_d = self._count_in(valid, -d, zero)
+        count_r = self._count_in(valid, -r, zero)
+        upstream = self._count_in(valid, -self.road_length, zero)
+        x = self.x
+        mask = valid & (x >= 0.0) & (x <= e[:, None]) & (np.abs(self.v) < v_thresh)
+        if min_time > 0.0:
+            mask &= self.stopped_for >= min_time
+        return count_d, count_r, count_d > 0, mask.any(axis=1), upstream
+
+    def step(self, dt: float, green: np.ndarray):
+        valid = self.valid()
+        x, v, sf = self.x, self.v, self.stopped_for
+
+        # Headway con el de adelante (posiciones al inicio del paso)
+        target = np.repeat(self.v_max[:, None], x.shape[1], axis=1)
+        gap = x[:, 1:] - x[:, :-1] - self.length[:, 1:]
+        target[:, :-1][valid[:, 1:] & (gap < self.safe_gap[:, None])] = 0.0
+
+        g = green[:, None]
+        # Sin verde: los que no han cruzado avanzan hasta la línea
+        up = valid & ~g & (x < 0)
+        if up.any():
+            max_adv = np.maximum(0.0, -x - self.safe_gap[:, None])
+            adv = np.minimum(target * dt, max_adv)
+            v[up] = (adv / dt)[up]
+        # Verde
+        gv = valid & g
+        v[gv] = np.where(sf < 0.0, 0.0, np.minimum(v + 2.0*dt, target))[gv]
+
+        # Integración
+        x[valid] += v[valid] * dt
+
+        # Tiempo detenido
+        stopped = valid & (np.abs(v) < 0.1)
+        sf[stopped] += dt
+        sf[valid & ~stopped & (sf > 0.0)] = 0.0
+
+        # Avance de bloqueos
+        blocked = valid & (sf < 0.0)
+        if blocked.any():
+            sf[blocked] += dt
+            sf[blocked & (sf >= 0.0)] = 0.0
+
+        # Mantener el orden por x dentro de cada fila
+        unsorted = (valid[:, 1:] & (x[:, 1:] < x[:, :-1])).any(axis=1)
+        if unsorted.any():
+            rows = np.flatnonzero(unsorted)
+            keyed = np.where(valid[rows], x[rows], np.inf)
+            order = np.argsort(keyed, axis=1, kind="stable")
+            for name in self._COLUMNS:
+                arr = getattr(self, name)
+                arr[rows] = np.take_along_axis(arr[rows], order, axis=1)
+
+    def maybe_induce_block(self, e, active: np.ndarray):
+        active = active & (self.p_block > 0)
+        if not active.any():
+            return
+        x = self.x
+        cand = self.valid() & (x >= 0.0) & (x <= e[:, None]) & (self.stopped_for == 0.0)
+        for i in np.flatnonzero(active & cand.any(axis=1)):
+            rng = self.block_rngs[i]
+            for j in np.flatnonzero(cand[i]):
+                if rng.random() < self.p_block[i]:
+                    self.stopped_for[i, j] = -self.t_block[i]
+                    break
+
+    def remove_completed(self, cutoff) -> np.ndarray:
+        # Las filas están ordenadas: los que salen son un sufijo de las columnas válidas
+        valid = self.valid()
+        keep = valid & ~(self.x > cutoff[:, None])
+        kept = np.count_nonzero(keep, axis=1)
+        out = self.n - kept
+        if out.any():
+            gone = valid & ~keep
+            for name in self._COLUMNS:
+                getattr(self, name)[gone] = 0
+            self.n = kept
+        return out
+
+
+class BatchController:
+    """Controller para N controladores a la vez: misma máscara de predicados y misma tabla, sobre arreglos."""
+    def __init__(self, n_threshold, u_min_green, y_yellow, m_small_platoon):
+        self.n_threshold = np.asarray(n_threshold, dtype=float)
+        self.u_min_green = np.asarray(u_min_green, dtype=float)
+        self.y_yellow = np.asarray(y_yellow, dtype=float)
+        self.m_small_platoon = np.asarray(m_small_platoon)
+        N = len(self.n_threshold)
+        self.phase = np.full(N, GREEN_A, dtype=np.int8)
+        self.t_in_phase = np.zeros(N)
+        self.red_counter_A = np.zeros(N)
+        self.red_counter_B = np.zeros(N)
+        self.switches = np.zeros(N, dtype=np.int64)
+
+    def is_green(self, for_A: bool) -> np.ndarray:
+        return self.phase == (GREEN_A if for_A else GREEN_B)
+
+    def step(self, dt: float, count_A_red_zone, count_B_red_zone, count_A_close_green, count_B_close_green,
+             any_A_d, any_B_d, stopped_A_after, stopped_B_after):
+        ph = self.phase
+        self.t_in_phase += dt
+        t = self.t_in_phase
+
+        # Contador en rojo (regla 1): sumar 0 deja el valor intacto
+        self.red_counter_B = self.red_counter_B + count_B_red_zone * _ADDS_B[ph]
+        self.red_counter_A = self.red_counter_A + count_A_red_zone * _ADDS_A[ph]
+
+        mask = predicate_mask(t, self.red_counter_A, self.red_counter_B, count_A_close_green, count_B_close_green,
+                              any_A_d, any_B_d, stopped_A_after, stopped_B_after,
+                              self.u_min_green, self.y_yellow, self.n_threshold, self.m_small_platoon)
+        i = (ph.astype(np.int64) << MASK_BITS) | mask
+        new = _NEXT_PHASE[i]
+        reset = _RESET_COUNTER[i]
+        changed = new != ph
+        self.phase = new
+        self.t_in_phase = np.where(changed, 0.0, t)
+        self.switches += changed
+        self.red_counter_A = np.where(reset == RESET_A, 0.0, self.red_counter_A)
+        self.red_counter_B = np.where(reset == RESET_B, 0.0, self.red_counter_B)
+
+
+class BatchSimulation:
+    """
+    N réplicas de Simulation avanzando juntas. Todas deben compartir dt;
+    el resto de los parámetros puede variar por réplica.
+    """
+    def __init__(self, cfgs: Sequence[SimConfig]):
+        if not cfgs:
+            raise ValueError("BatchSimulation necesita al menos una configuración")
+        dts = {c.dt for c in cfgs}
+        if len(dts) != 1:
+            raise ValueError("todas las réplicas deben usar el mismo dt")
+        if any(c.arrivals != "knuth" for c in cfgs):
+            raise ValueError("BatchSimulation solo admite arrivals=\"knuth\"")
+        if any(c.integrator != "euler" for c in cfgs):
+            raise ValueError("BatchSimulation solo admite integrator=\"euler\"")
+        self.cfgs = list(cfgs)
+        self.dt = cfgs[0].dt
+
+        def col(name):
+            return np.array([getattr(c, name) for c in cfgs], dtype=float)
+
+        self.lambda_a = col("lambda_a")
+        self.lambda_b = col("lambda_b")
+        self.d_detect = col("d_detect")
+        self.r_close = col("r_close")
+        self.e_after = col("e_after")
+        self.cutoff = self.e_after + col("intersection_len") + 25.0
+
+        lane_args = [col(name) for name in ("road_length", "v_max", "safe_gap", "p_block", "t_block")]
+        streams = [c.rng_streams for c in cfgs]
+        antithetic = [c.antithetic for c in cfgs]
+        self.lane_A = BatchLane("A", *lane_args, seeds=[c.seed + 1 for c in cfgs], streams=streams, antithetic=antithetic)
+        self.lane_B = BatchLane("B", *lane_args, seeds=[c.seed + 2 for c in cfgs], streams=streams, antithetic=antithetic)
+        self.ctrl = BatchController(col("n_threshold"), col("u_min_green"), col("y_yellow"),
+                                    np.array([c.m_small_platoon for c in cfgs]))
+
+        self.time = 0.0
+        self.completed_A = np.zeros(len(cfgs), dtype=np.int64)
+        self.completed_B = np.zeros(len(cfgs), dtype=np.int64)
+
+    @classmethod
+    def replications(cls, cfg: SimConfig, seeds: Sequence[int]) -> "BatchSimulation":
+        return cls([replace(cfg, seed=s) for s in seeds])
+
+    def __len__(self) -> int:
+        return len(self.cfgs)
+
+    def step_once(self):
+        dt = self.dt
+
+        # Llegadas
+        self.lane_A.spawn_poisson(self.lambda_a, dt, self.time)
+        self.lane_B.spawn_poisson(self.lambda_b, dt, self.time)
+
+        # Sensores
+        cA, rA, anyA, sA, _ = self.lane_A.read_sensors(self.d_detect, self.r_close, self.e_after)
+        cB, rB, anyB, sB, _ = self.lane_B.read_sensors(self.d_detect, self.r_close, self.e_after)
+
+        # Controlador
+        self.ctrl.step(dt, cA, cB, rA, rB, anyA, anyB, sA, sB)
+        green_A = self.ctrl.is_green(True)
+        green_B = self.ctrl.is_green(False)
+
+        # Bloqueos intencionales ocasionales
+        self.lane_A.maybe_induce_block(self.e_after, green_A)
+        self.lane_B.maybe_induce_block(self.e_after, green_B)
+
+        # Movimiento
+        self.lane_A.step(dt, green_A)
+        self.lane_B.step(dt, green_B)
+
+        # Salidas
+        self.completed_A += self.lane_A.remove_completed(self.cutoff)
+        self.completed_B += self.lane_B.remove_completed(self.cutoff)
+
+        self.time += dt
+
+    def run_for(self, duration: float) -> List[Dict[str, int]]:
+        steps = int(duration / self.dt)
+        for _ in range(steps):
+            self.step_once()
+        return self.results()
+
+    def results(self) -> List[Dict[str, int]]:
+        """Un diccionario por réplica, con las mismas claves que Simulation.run_for."""
+        return [{"completed_A": int(a), "completed_B": int(b), "switches": int(s)}
+                for a, b, s in zip(self.completed_A, self.completed_B, self.ctrl.switches)]
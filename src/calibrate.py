@@ -0,0 +1,295 @@
+"""
+Calibración de parámetros del controlador: búsqueda aleatoria + successive halving.
+
+Archivo de calibración (JSON o TOML):
+    {
+      "base": {"lambda_a": 0.5, "lambda_b": 0.3},         # escenario (demanda fija)
+      "space": {"n_threshold": [2, 40],                   # rangos [mín, máx]
+                "u_min_green": [2, 20],
+                "m_small_platoon": [0, 6],                # campo int de SimConfig: enteros
+                "d_detect": [20, 90],
+                "r_close": [2, 25]},
+      "objective": "delay",                               # ver OBJECTIVES
+      "candidates": 81,
+      "eta": 3,                                           # se queda 1 de cada eta por ronda
+      "min_duration": 600,                                # horizonte de la primera ronda (s)
+      "max_duration": 3600,                               # horizonte final (por defecto base.duration)
+      "replications": 3,
+      "seed": 1234,
+      "warmup": 0                                         # opcional
+    }
+
+Cada ronda evalúa a los sobrevivientes con un horizonte eta veces más largo que
+la anterior (hasta max_duration) y conserva el mejor 1/eta según el promedio del
+objetivo en las réplicas; así los candidatos malos se descartan con corridas
+cortas. El candidato 0 son los valores de "base" (o los por defecto), como
+referencia: aunque se descarte antes, se evalúa también en la ronda final (mismo
+horizonte y semillas que el mejor) para que ambos puntajes sean comparables; no
+compite en esa ronda. Todas las evaluaciones de una ronda corren en paralelo
+(ProcessPoolExecutor).
+
+La réplica k usa la misma semilla en todos los candidatos (números aleatorios
+comunes) y generadores separados para llegadas y bloqueos (rng_streams="split",
+salvo que "base" diga otra cosa, como en src/compare.py): las diferencias entre
+candidatos se deben a los parámetros y no al azar, así que alcanzan menos
+réplicas para ordenarlos. Con "warmup" (s), cada
+réplica se calienta una vez con "base" y los candidatos son ramas de ese
+checkpoint (src/checkpoint.py), como en src/sweep.py; solo se pueden calibrar
+campos de ControllerConfig.
+
+Resultado: la mejor configuración completa (--out, JSON que acepta
+`python -m src.run --config`) y el registro de todas las evaluaciones (--log, una
+línea JSON por evaluación).
+
+    python -m src.calibrate calib.json --out mejor.json --log evaluaciones.jsonl --workers 8
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from . import checkpoint
+from .config import config_to_dict, load_params, make_config
+from .metrics import Metrics
+from .sim_core import SimConfig, Simulation
+from .sweep import derive_seed, warm_up
+
+_INT_FIELDS = {f.name for f in fields(SimConfig) if f.type is int}
+
+
+def _pooled_delay(m: Metrics, sim: Simulation) -> float:
+    """
+    Demora media por vehículo, incluyendo a los que siguen en el sistema con la
+    demora acumulada hasta el final (si no, un controlador que deja una cola
+    detenida parecería bueno porque esos vehículos nunca salen).
+    """
+    total = 0.0
+    n = 0
+    for d in m.directions.values():
+        total += d.delay.acc.mean * d.delay.acc.n
+        n += d.delay.acc.n
+    for lane in (sim.lane_A, sim.lane_B):
+        for entered_at in lane.snapshot_vehicles()["entered_at"]:
+            total += max(0.0, sim.time - entered_at - m.free_flow)
+            n += 1
+    return total / n if n else 0.0
+
+
+def _exited(m: Metrics) -> int:
+    return sum(d.exited for d in m.directions.values())
+
+
+def _hours(m: Metrics) -> float:
+    return m.steps * m.dt / 3600.0
+
+
+# Objetivos a minimizar: f(métricas, simulación al final) -> valor
+OBJECTIVES: Dict[str, Callable[[Metrics, Simulation], float]] = {
+    "delay": _pooled_delay,
+    "stops": lambda m, sim: (sum(d.stops.acc.mean * d.stops.acc.n for d in m.directions.values())
+                             / max(1, _exited(m))),
+    "queue": lambda m, sim: sum(d.queue.mean() for d in m.directions.values() if d.queue.n),
+    "switches": lambda m, sim: sum(s.acc.n for s in m.phases.values()) / max(_hours(m), 1e-9),
+    "throughput": lambda m, sim: -_exited(m) / max(_hours(m), 1e-9),
+}
+
+
+def sample_candidates(space: Dict[str, Sequence[float]], count: int, seed: int,
+                      base: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """`count` candidatos uniformes en los rangos; el primero son los valores de base."""
+    for name, bounds in space.items():
+        if len(bounds) != 2 or bounds[0] > bounds[1]:
+            raise ValueError(f"rango inválido para {name}: {bounds!r} (se espera [mín, máx])")
+    rng = random.Random(seed)
+    ref = config_to_dict(make_config(base))
+    out = [{name: ref[name] for name in space}]
+    while len(out) < count:
+        cand = {}
+        for name, (lo, hi) in space.items():
+            cand[name] = rng.randint(int(lo), int(hi)) if name in _INT_FIELDS else rng.uniform(lo, hi)
+        out.append(cand)
+    return out[:count]
+
+
+def rungs(min_duration: float, max_duration: float, eta: int) -> List[float]:
+    """Horizontes de cada ronda: min_duration * eta^k, el último exactamente max_duration."""
+    if eta < 2:
+        raise ValueError("eta debe ser >= 2")
+    out = []
+    d = min(min_duration, max_duration)
+    while d < max_duration:
+        out.append(d)
+        d *= eta
+    out.append(max_duration)
+    return out
+
+
+def evaluate(base: Dict[str, Any], params: Dict[str, Any], seed: int, duration: float, objective: str,
+             warmup: float = 0.0, snapshot: Optional[bytes] = None) -> Dict[str, Any]:
+    """Una evaluación: corre `duration` s (tras el calentamiento) y mide el objetivo."""
+    if snapshot is None:
+        sim = Simulation(make_config(base, **dict(params, seed=seed, duration=duration)))
+        if warmup > 0:
+            sim.run_for(warmup)
+    else:
+        sim = checkpoint.fork(snapshot, reset_counters=True, **params)
+    m = Metrics(sim)
+    t0 = time.perf_counter()
+    result = sim.run_for(duration)
+    value = OBJECTIVES[objective](m, sim)
+    report = m.report()
+    return {
+        "objective": value,
+        "exited": _exited(m),
+        "switches": result["switches"],
+        "delay_mean": {k: report[k]["delay"].get("mean") for k in ("A", "B")},
+        "wall_s": time.perf_counter() - t0,
+    }
+
+
+def _evaluate_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    row = {k: task[k] for k in ("candidate", "rung", "duration", "rep", "seed")}
+    row["params"] = task["params"]
+    row.update(evaluate(task["base"], task["params"], task["seed"], task["duration"], task["objective"],
+                        task["warmup"], task.get("snapshot")))
+    return row
+
+
+def calibrate(spec: Dict[str, Any], workers: Optional[int] = None, log: Optional[Callable] = None,
+              progress: Optional[Callable] = None) -> Dict[str, Any]:
+    """
+    Corre la calibración. `log(row)` recibe cada evaluación al terminar su ronda;
+    `progress(rung, duration, n_candidates)` se llama al empezar cada ronda.
+    """
+    base = dict({"rng_streams": "split"}, **(spec.get("base") or {}))
+    space = dict(spec.get("space") or {})
+    if not space:
+        raise ValueError("la calibración necesita un \"space\" con al menos un parámetro")
+    unknown = sorted(set(space) - set(f.name for f in fields(SimConfig)))
+    if unknown:
+        raise ValueError(f"parámetros desconocidos en space: {', '.join(unknown)}")
+    objective = spec.get("objective", "delay")
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objetivo desconocido: {objective!r} (válidos: {', '.join(OBJECTIVES)})")
+    seed = int(spec.get("seed", 0))
+    eta = int(spec.get("eta", 3))
+    reps = int(spec.get("replications", 3))
+    warmup = float(spec.get("warmup", 0.0))
+    max_duration = float(spec.get("max_duration", make_config(base).duration))
+    horizons = rungs(float(spec.get("min_duration", max_duration)), max_duration, eta)
+    if warmup > 0:
+        not_ctrl = sorted(set(space) - set(checkpoint.CONTROLLER_FIELDS))
+        if not_ctrl:
+            raise ValueError(f"con warmup solo se pueden calibrar parámetros del controlador: {', '.join(not_ctrl)}")
+
+    candidates = sample_candidates(space, int(spec.get("candidates", eta ** len(horizons))), seed, base)
+    # Números aleatorios comunes: la semilla depende solo de la réplica
+    seeds = [derive_seed(seed, "rep", rep) for rep in range(reps)]
+    alive = list(range(len(candidates)))
+    scores: Dict[int, float] = {}
+    reached: Dict[int, Dict[str, float]] = {}   # última ronda evaluada de cada candidato
+    reference = None                            # candidato 0 en la ronda final
+    evaluations = 0
+    t0 = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        snapshots = None
+        if warmup > 0:
+            snapshots = list(pool.map(warm_up, [base] * reps, seeds, [warmup] * reps))
+        for k, duration in enumerate(horizons):
+            if progress is not None:
+                progress(k, duration, len(alive))
+            final = k + 1 == len(horizons)
+            # En la ronda final se evalúa también la referencia, aunque ya se haya descartado
+            evaluated = alive + [0] if final and 0 not in alive else alive
+            tasks = [{"candidate": c, "rung": k, "duration": duration, "rep": rep, "seed": seeds[rep],
+                      "params": candidates[c], "base": base, "objective": objective, "warmup": warmup,
+                      "snapshot": None if snapshots is None else snapshots[rep]}
+                     for c in evaluated for rep in range(reps)]
+            rows = list(pool.map(_evaluate_task, tasks))
+            evaluations += len(rows)
+            totals = {c: 0.0 for c in evaluated}
+            for row in rows:
+                totals[row["candidate"]] += row["objective"]
+                if log is not None:
+                    log(row)
+            if final:
+                reference = {"rung": k, "duration": duration, "score": totals[0] / reps,
+                             "eliminated_at_rung": reached[0]["rung"] if 0 not in alive else None}
+            scores = {c: totals[c] / reps for c in alive}
+            for c in alive:
+                reached[c] = {"rung": k, "duration": duration, "score": scores[c]}
+            ranked = sorted(alive, key=lambda c: (scores[c], c))
+            if k + 1 < len(horizons):
+                alive = ranked[:max(1, math.ceil(len(alive) / eta))]
+            else:
+                alive = ranked
+
+    best = alive[0]
+    return {
+        "objective": objective,
+        "best_candidate": best,
+        "best_score": scores[best],
+        "best_params": candidates[best],
+        "best_config": config_to_dict(make_config(base, **dict(candidates[best], duration=max_duration))),
+        "reference": reference,
+        "final_ranking": [{"candidate": c, "score": scores[c], "params": candidates[c]} for c in alive],
+        "rungs": horizons,
+        "evaluations": evaluations,
+        "wall_s": time.perf_counter() - t0,
+    }
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.calibrate",
+                                description="Calibra parámetros del controlador (búsqueda aleatoria + successive halving).")
+    p.add_argument("spec", help="archivo JSON/TOML con base, space, objective, candidates, eta, ...")
+    p.add_argument("--out", required=True, help="JSON con la mejor configuración completa")
+    p.add_argument("--log", default=None, help="registro de evaluaciones (una línea JSON por evaluación)")
+    p.add_argument("--workers", type=int, default=None, help="procesos (por defecto: todos los núcleos)")
+    p.add_argument("--objective", default=None, choices=sorted(OBJECTIVES), help="sobrescribe el del archivo")
+    args = p.parse_args(argv)
+
+    try:
+        spec = load_params(args.spec)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    if args.objective:
+        spec["objective"] = args.objective
+
+    log_fh = open(args.log, "w", encoding="utf-8") if args.log else None
+
+    def log(row):
+        if log_fh is not None:
+            log_fh.write(json.dumps(row) + "\n")
+            log_fh.flush()
+
+    def progress(k, duration, n):
+        print(f"ronda {k}: {n} candidatos x {spec.get('replications', 3)} réplicas, {duration:g} s",
+              file=sys.stderr, flush=True)
+
+    try:
+        result = calibrate(spec, workers=args.workers, log=log, progress=progress)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if log_fh is not None:
+            log_fh.close()
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(result["best_config"], fh, indent=1)
+        fh.write("\n")
+    summary = {k: v for k, v in result.items() if k not in ("best_config", "final_ranking")}
+    print(json.dumps(summary, indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+Checkpoints binarios del estado completo de una Simulation, y ramas a partir de ellos.
+
+Formato (versión 1):
+    cabecera  <8s H H I I>: MAGIC, versión, banderas (0), largo y CRC32 del contenido
+    contenido comprimido con zlib:
+        <I> largo del JSON de metadatos, JSON (configuración, reloj, contadores,
+        controlador, estado escalar de cada carril y del RNG) y, a continuación,
+        los bloques binarios little-endian listados en meta["blobs"]: columnas de
+        vehículos y estado de Mersenne Twister de cada carril. De los cronogramas
+        de llegadas se guarda el estado del generador al inicio del bloque en uso y
+        la posición dentro de él; el bloque se regenera al restaurar.
+
+    sim = Simulation(make_config(duration=1800))
+    sim.run_for(1800)
+    snap = checkpoint.dumps(sim)                       # calentamiento una sola vez
+    ramas = [checkpoint.fork(snap, n_threshold=n) for n in (5, 10, 20)]
+"""
+import json
+import random
+import struct
+import sys
+import zlib
+from array import array
+from dataclasses import asdict, fields, replace
+from typing import Any, Dict, List, Optional
+
+from .controller import ControllerConfig, Phase
+from .lanes import VEHICLE_COLUMNS, LaneReading, block_seed
+from .sim_core import SimConfig, Simulation
+
+MAGIC = b"SSIMCKPT"
+VERSION = 1
+_HEADER = struct.Struct("<8sHHII")
+_LEN = struct.Struct("<I")
+
+_COLUMN_TYPES = {"vid": "q", "stops": "q"}  # el resto, float64
+CONTROLLER_FIELDS = tuple(f.name for f in fields(ControllerConfig))
+
+
+def _pack(typecode: str, values) -> bytes:
+    arr = array(typecode, values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _unpack(typecode: str, data: bytes) -> list:
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tolist()
+
+
+def _rng_state(rng: random.Random, name: str, blobs: List[tuple]) -> Dict[str, Any]:
+    version, internal, gauss_next = rng.getstate()
+    blobs.append((name, "I", internal))
+    return {"version": version, "gauss_next": gauss_next}
+
+
+def _set_rng_state(rng: random.Random, meta: Dict[str, Any], internal: list):
+    rng.setstate((meta["version"], tuple(internal), meta["gauss_next"]))
+
+
+def _source_state(src) -> Optional[Dict[str, Any]]:
+    from .arrivals import TraceSource
+    if src is None:
+        return None
+    if isinstance(src, TraceSource) or src._block_start is None:
+        return {"pos": src.pos}
+    rng_state, t_start = src._block_start
+    return {"pos": src.pos, "block_rng": rng_state, "block_t": t_start}
+
+
+def _set_source_state(src, meta: Optional[Dict[str, Any]]):
+    from .arrivals import TraceSource
+    if meta is None:
+        return
+    if isinstance(src, TraceSource):
+        src.pos = meta["pos"]
+        src._next = src._time_at(src.pos)
+        return
+    if "block_rng" in meta:
+        src.rng.bit_generator.state = meta["block_rng"]
+        src.t_last = meta["block_t"]
+        src._load()
+        src.pos = meta["pos"]
+        if src.pos < len(src.times):
+            src._next = float(src.times[src.pos])
+
+
+def dumps(sim: Simulation) -> bytes:
+    """Serializa el estado completo de sim (configuración incluida)."""
+    blobs: List[tuple] = []
+    lanes = {}
+    for lane in (sim.lane_A, sim.lane_B):
+        key = lane.name
+        cols = lane.snapshot_vehicles()
+        for col in VEHICLE_COLUMNS:
+            blobs.append((f"{key}.{col}", _COLUMN_TYPES.get(col, "d"), cols[col]))
+        lanes[key] = {
+            "next_vid": lane.next_vid,
+            "pending_u": lane._pending_u,
+            "rng": _rng_state(lane.rng, f"{key}.rng", blobs),
+            "arrivals": _source_state(lane.arrivals),
+        }
+        if lane.block_rng is not lane.rng:
+            lanes[key]["block_rng"] = _rng_state(lane.block_rng, f"{key}.block_rng", blobs)
+        if getattr(lane, "block_left", None):
+            # Exposición al bloqueo que les queda (integrator="exact")
+            lanes[key]["block_left"] = [[vid, left] for vid, left in lane.block_left.items()]
+    ctrl = sim.ctrl
+    meta = {
+        "config": asdict(sim.cfg),
+        "time": sim.time,
+        "completed_A": sim.completed_A,
+        "completed_B": sim.completed_B,
+        "jump_backoff": sim._jump_backoff,
+        "jump_wait": sim._jump_wait,
+        "readings_A": list(sim.readings_A),
+        "readings_B": list(sim.readings_B),
+        "rng": _rng_state(sim.rng, "sim.rng", blobs),
+        "controller": {
+            "phase": ctrl.phase.name,
+            "t_in_phase": ctrl.t_in_phase,
+            "red_counter_A": ctrl.red_counter_A,
+            "red_counter_B": ctrl.red_counter_B,
+            "switches": ctrl.switches,
+        },
+        "lanes": lanes,
+    }
+    data = [_pack(tc, values) for _, tc, values in blobs]
+    meta["blobs"] = [[name, tc, len(d)] for (name, tc, _), d in zip(blobs, data)]
+    head = json.dumps(meta, separators=(",", ":")).encode()
+    raw = b"".join([_LEN.pack(len(head)), head] + data)
+    return _HEADER.pack(MAGIC, VERSION, 0, len(raw), zlib.crc32(raw)) + zlib.compress(raw, 6)
+
+
+def _parse(data: bytes):
+    if len(data) < _HEADER.size:
+        raise ValueError("checkpoint truncado")
+    magic, version, _flags, size, crc = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("no es un checkpoint de simulación")
+    if version != VERSION:
+        raise ValueError(f"versión de checkpoint no soportada: {version}")
+    try:
+        raw = zlib.decompress(data[_HEADER.size:])
+    except zlib.error as e:
+        raise ValueError(f"checkpoint dañado: {e}") from None
+    if len(raw) != size or zlib.crc32(raw) != crc:
+        raise ValueError("checkpoint dañado (largo o CRC no coinciden)")
+    (head_len,) = _LEN.unpack_from(raw)
+    pos = _LEN.size + head_len
+    meta = json.loads(raw[_LEN.size:pos])
+    blobs = {}
+    for name, tc, nbytes in meta["blobs"]:
+        blobs[name] = _unpack(tc, raw[pos:pos + nbytes])
+        pos += nbytes
+    return meta, blobs
+
+
+def _restore(meta: Dict[str, Any], blobs: Dict[str, list], cfg: SimConfig) -> Simulation:
+    sim = Simulation(cfg)
+    sim.time = meta["time"]
+    sim.completed_A = meta["completed_A"]
+    sim.completed_B = meta["completed_B"]
+    sim._jump_backoff = meta["jump_backoff"]
+    sim._jump_wait = meta["jump_wait"]
+    sim.readings_A = LaneReading(*meta["readings_A"])
+    sim.readings_B = LaneReading(*meta["readings_B"])
+    _set_rng_state(sim.rng, meta["rng"], blobs["sim.rng"])
+    c = meta["controller"]
+    sim.ctrl.phase = Phase[c["phase"]]
+    sim.ctrl.t_in_phase = c["t_in_phase"]
+    sim.ctrl.red_counter_A = c["red_counter_A"]
+    sim.ctrl.red_counter_B = c["red_counter_B"]
+    sim.ctrl.switches = c["switches"]
+    for lane in (sim.lane_A, sim.lane_B):
+        key = lane.name
+        state = meta["lanes"][key]
+        n = len(blobs[f"{key}.x"])
+        # Checkpoints anteriores a la columna stops: cero detenciones
+        lane.restore_vehicles({col: blobs.get(f"{key}.{col}", [0] * n) for col in VEHICLE_COLUMNS})
+        lane.next_vid = state["next_vid"]
+        lane._pending_u = state["pending_u"]
+        _set_rng_state(lane.rng, state["rng"], blobs[f"{key}.rng"])
+        if "block_rng" in state:
+            _set_rng_state(lane.block_rng, state["block_rng"], blobs[f"{key}.block_rng"])
+        if "block_left" in state:
+            lane.block_left = {vid: left for vid, left in state["block_left"]}
+        _set_source_state(lane.arrivals, state["arrivals"])
+    return sim
+
+
+def loads(data: bytes) -> Simulation:
+    """Reconstruye una Simulation que continúa exactamente donde quedó la original."""
+    meta, blobs = _parse(data)
+    return _restore(meta, blobs, SimConfig(**meta["config"]))
+
+
+def save(sim: Simulation, path: str):
+    with open(path, "wb") as fh:
+        fh.write(dumps(sim))
+
+
+def load(path: str) -> Simulation:
+    with open(path, "rb") as fh:
+        return loads(fh.read())
+
+
+def fork(data: bytes, reseed: Optional[int] = None, reset_counters: bool = False, **overrides) -> Simulation:
+    """
+    Rama a partir de un checkpoint con otros parámetros del controlador
+    (campos de ControllerConfig). Sin `reseed`, todas las ramas continúan con los
+    mismos números aleatorios (comparación con números aleatorios comunes); con
+    `reseed`, los RNG de los carriles se reinician con esa semilla. Con
+    reset_counters=True los completados y los cambios de fase empiezan en cero.
+    """
+    unknown = sorted(set(overrides) - set(CONTROLLER_FIELDS))
+    if unknown:
+        raise ValueError(f"solo se pueden cambiar parámetros del controlador en una rama: {', '.join(unknown)}")
+    meta, blobs = _parse(data)
+    cfg = replace(SimConfig(**meta["config"]), **overrides)
+    sim = _restore(meta, blobs, cfg)
+    if reseed is not None:
+        for lane, offset in ((sim.lane_A, 1), (sim.lane_B, 2)):
+            lane.rng.seed(reseed + offset)
+            if lane.block_rng is not lane.rng:
+                lane.block_rng.seed(block_seed(reseed + offset))
+            lane._pending_u = None
+            if getattr(lane, "block_left", None):
+                lane.block_left.clear()
+            if lane.arrivals is not None and hasattr(lane.arrivals, "reseed"):
+                lane.arrivals.reseed(reseed + offset, sim.time)
+    if reset_counters:
+        sim.completed_A = sim.completed_B = 0
+        sim.ctrl.switches = 0
+    return sim
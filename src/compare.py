@@ -0,0 +1,196 @@
+"""
+Comparación pareada de dos configuraciones con intervalos de confianza.
+
+Archivo de comparación (JSON o TOML):
+    {
+      "base": {"duration": 3600, "lambda_a": 0.5},        # común a ambas
+      "a": {"n_threshold": 10},                           # lo que cambia
+      "b": {"n_threshold": 20},
+      "replications": 10,
+      "seed": 1234,
+      "warmup": 0,                                        # opcional (s)
+      "antithetic": false,                                # opcional
+      "level": 0.95
+    }
+
+La réplica k corre A y B con la misma semilla (números aleatorios comunes) y con
+generadores separados para llegadas y bloqueos (rng_streams="split", salvo que
+"base" diga otra cosa): ambas ven las mismas llegadas y las diferencias se deben
+a los parámetros. Con "antithetic", cada réplica es además el promedio de la
+corrida normal y la antitética (mismos sorteos u reemplazados por 1 - u).
+
+Para cada métrica se informa la media de A, de B y de la diferencia B - A por
+réplica, con su intervalo de confianza t, y cuánto se ganó frente a corridas
+independientes: var(A) + var(B) sobre var(B - A). Ese factor es también cuántas
+veces más réplicas harían falta sin números comunes para el mismo ancho.
+
+    python -m src.compare comparacion.json --workers 8
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+from .calibrate import OBJECTIVES
+from .config import load_params, make_config
+from .metrics import Metrics
+from .sim_core import Simulation
+from .sweep import derive_seed
+
+# Métricas de cada corrida (las de src/calibrate.py, con las salidas por hora en positivo)
+METRICS = dict(OBJECTIVES, throughput=lambda m, sim: -OBJECTIVES["throughput"](m, sim))
+
+
+def t_critical(level: float, df: int) -> float:
+    """t tal que P(|T| < t) = level para T de Student con df grados de libertad."""
+    if df < 1:
+        return math.inf
+
+    def central(t):
+        # P(|T| < t), forma cerrada para df entero (Abramowitz y Stegun 26.7.3-4)
+        theta = math.atan(t / math.sqrt(df))
+        c2 = math.cos(theta) ** 2
+        if df % 2:
+            if df == 1:
+                return 2.0 * theta / math.pi
+            term = s = 1.0
+            for k in range(1, (df - 3) // 2 + 1):
+                term *= c2 * (2 * k) / (2 * k + 1)
+                s += term
+            return 2.0 / math.pi * (theta + math.sin(theta) * math.cos(theta) * s)
+        term = s = 1.0
+        for k in range(1, (df - 2) // 2 + 1):
+            term *= c2 * (2 * k - 1) / (2 * k)
+            s += term
+        return math.sin(theta) * s
+
+    lo, hi = 0.0, 1.0
+    while central(hi) < level:
+        hi *= 2.0
+    for _ in range(100):
+        mid = 0.5 * (lo + hi)
+        if central(mid) < level:
+            lo = mid
+        else:
+            hi = mid
+    return 0.5 * (lo + hi)
+
+
+def mean_ci(values: Sequence[float], level: float = 0.95) -> Dict[str, float]:
+    """Media, varianza muestral e intervalo t de la media."""
+    n = len(values)
+    mean = sum(values) / n if n else math.nan
+    var = sum((v - mean) ** 2 for v in values) / (n - 1) if n > 1 else math.nan
+    half = t_critical(level, n - 1) * math.sqrt(var / n) if n > 1 else math.inf
+    return {"n": n, "mean": mean, "var": var, "half_width": half, "lo": mean - half, "hi": mean + half}
+
+
+def measure(params: Dict[str, Any], warmup: float = 0.0) -> Dict[str, float]:
+    """Métricas de una corrida (`duration` s tras `warmup` s)."""
+    cfg = make_config(params)
+    sim = Simulation(cfg)
+    if warmup > 0:
+        sim.run_for(warmup)
+    m = Metrics(sim)
+    sim.run_for(cfg.duration)
+    return {name: f(m, sim) for name, f in METRICS.items()}
+
+
+def _run(args) -> Dict[str, float]:
+    return measure(*args)
+
+
+def compare(spec: Dict[str, Any], workers: Optional[int] = None, common: bool = True) -> Dict[str, Any]:
+    """
+    Corre las réplicas en paralelo y devuelve el resumen por métrica. Con
+    common=False cada configuración usa sus propias semillas (para comparar).
+    """
+    base = dict({"rng_streams": "split"}, **(spec.get("base") or {}))
+    params = {"a": dict(base, **(spec.get("a") or {})), "b": dict(base, **(spec.get("b") or {}))}
+    make_config(params["a"]), make_config(params["b"])  # validar antes de lanzar procesos
+    reps = int(spec.get("replications", 10))
+    seed = int(spec.get("seed", 0))
+    warmup = float(spec.get("warmup", 0.0))
+    level = float(spec.get("level", 0.95))
+    antithetic = bool(spec.get("antithetic", False))
+    variants = (False, True) if antithetic else (False,)
+
+    jobs = []
+    for rep in range(reps):
+        for side in ("a", "b"):
+            s = derive_seed(seed, rep) if common else derive_seed(seed, side, rep)
+            for anti in variants:
+                jobs.append(((rep, side), (dict(params[side], seed=s, antithetic=anti), warmup)))
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        results = list(pool.map(_run, [args for _, args in jobs]))
+
+    # Por réplica y lado: promedio de las variantes (normal y antitética)
+    per: Dict[tuple, Dict[str, float]] = {}
+    for (key, _), res in zip(jobs, results):
+        acc = per.setdefault(key, {name: 0.0 for name in METRICS})
+        for name, v in res.items():
+            acc[name] += v / len(variants)
+
+    summary: Dict[str, Any] = {}
+    for name in METRICS:
+        a = [per[(rep, "a")][name] for rep in range(reps)]
+        b = [per[(rep, "b")][name] for rep in range(reps)]
+        ca, cb = mean_ci(a, level), mean_ci(b, level)
+        diff = mean_ci([y - x for x, y in zip(a, b)], level)
+        gain = (ca["var"] + cb["var"]) / diff["var"] if reps > 1 and diff["var"] > 0 else math.nan
+        summary[name] = {
+            "a": ca["mean"], "b": cb["mean"],
+            "diff": diff["mean"], "diff_lo": diff["lo"], "diff_hi": diff["hi"], "half_width": diff["half_width"],
+            "significant": reps > 1 and not (diff["lo"] <= 0.0 <= diff["hi"]),
+            "variance_reduction": gain,
+        }
+    return {
+        "replications": reps, "runs": len(jobs), "level": level, "common_random_numbers": common,
+        "antithetic": antithetic, "wall_s": time.perf_counter() - t0, "metrics": summary,
+    }
+
+
+def format_summary(result: Dict[str, Any]) -> str:
+    lines = [f"{result['replications']} réplicas ({result['runs']} corridas), IC {100 * result['level']:g} % de B - A"]
+    lines.append(f"  {'métrica':<11}{'A':>12}{'B':>12}{'B - A':>12}{'intervalo':>26}{'var. ind./par':>15}")
+    for name, s in result["metrics"].items():
+        ci = f"[{s['diff_lo']:.4g}, {s['diff_hi']:.4g}]" + (" *" if s["significant"] else "  ")
+        lines.append(f"  {name:<11}{s['a']:>12.4g}{s['b']:>12.4g}{s['diff']:>12.4g}{ci:>26}"
+                     f"{s['variance_reduction']:>15.3g}")
+    lines.append("  * el intervalo no contiene 0")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.compare",
+                                description="Compara dos configuraciones con réplicas pareadas.")
+    p.add_argument("spec", help="archivo JSON/TOML con base, a, b, replications y seed")
+    p.add_argument("--replications", type=int, default=None, help="sobrescribe la del archivo")
+    p.add_argument("--workers", type=int, default=None, help="procesos (por defecto: todos los núcleos)")
+    p.add_argument("--antithetic", action="store_true", help="promediar cada réplica con su corrida antitética")
+    p.add_argument("--independent", action="store_true", help="semillas distintas para A y B (sin pareo)")
+    p.add_argument("--indent", type=int, default=None, help="indentación del JSON de salida")
+    args = p.parse_args(argv)
+
+    try:
+        spec = load_params(args.spec)
+        if args.replications is not None:
+            spec["replications"] = args.replications
+        if args.antithetic:
+            spec["antithetic"] = True
+        result = compare(spec, workers=args.workers, common=not args.independent)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(result, indent=args.indent))
+    print(format_summary(result), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
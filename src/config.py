@@ -0,0 +1,71 @@
+import json
+import os
+from dataclasses import asdict, fields
+from typing import Any, Dict, Optional
+
+from .sim_core import SimConfig
+
+# Valores por defecto: los mismos del escenario de app.py, con un horizonte finito
+DEFAULTS: Dict[str, Any] = dict(
+    duration=3600.0,
+    dt=0.2,
+    seed=42,
+    n_threshold=10.0,
+    u_min_green=8.0,
+    y_yellow=2.5,
+    m_small_platoon=2,
+    d_detect=45.0,
+    r_close=8.0,
+    e_after=14.0,
+    lambda_a=0.35,
+    lambda_b=0.25,
+    v_max=12.0,
+    safe_gap=5.0,
+    intersection_len=10.0,
+    road_length=180.0,
+    p_block=0.02,
+    t_block=6.0,
+    log_every=9999.0,
+)
+
+FIELD_NAMES = tuple(f.name for f in fields(SimConfig))
+
+
+def load_params(path: str) -> Dict[str, Any]:
+    """
+    Lee parámetros de un archivo JSON o TOML (según la extensión).
+    En TOML se aceptan las claves en la raíz o dentro de una tabla [sim].
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".toml":
+        try:
+            import tomllib
+        except ImportError:  # Python 3.10
+            import tomli as tomllib
+        with open(path, "rb") as fh:
+            data = tomllib.load(fh)
+    else:
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: se esperaba un objeto de parámetros, no {type(data).__name__}")
+    if "sim" in data and isinstance(data["sim"], dict):
+        data = data["sim"]
+    return dict(data)
+
+
+def make_config(params: Optional[Dict[str, Any]] = None, **overrides) -> SimConfig:
+    """Construye un SimConfig a partir de DEFAULTS + params + overrides."""
+    merged = dict(DEFAULTS)
+    merged.update(params or {})
+    merged.update(overrides)
+    unknown = sorted(set(merged) - set(FIELD_NAMES))
+    if unknown:
+        raise ValueError(f"Parámetros desconocidos para SimConfig: {', '.join(unknown)}")
+    if not merged["dt"] > 0:
+        raise ValueError(f"dt debe ser > 0 (dt={merged['dt']!r})")
+    return SimConfig(**merged)
+
+
+def config_to_dict(cfg: SimConfig) -> Dict[str, Any]:
+    return asdict(cfg)
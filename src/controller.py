@@ -1,3 +1,15 @@
+"""
+Controlador auto-organizante (reglas 1–6) como máquina de estados por tabla.
+
+Las reglas solo dependen de la fase y de once predicados booleanos sobre los
+sensores, el temporizador y los contadores (ver predicate_mask). La tabla
+NEXT_PHASE / RESET_COUNTER, compilada una vez a partir de _rules, da para cada
+(fase, máscara) la fase siguiente y qué contador en rojo se reinicia; cada paso
+es entonces sumar los contadores, armar la máscara y una búsqueda en la tabla.
+BatchController (src/batch.py) usa la misma máscara y la misma tabla sobre
+arreglos de NumPy.
+"""
+import math
 from dataclasses import dataclass
 from enum import Enum, auto
 
@@ -18,21 +30,134 @@ class ControllerConfig:
     r_close: float
     e_after: float
 
+# Códigos de fase (índice en el Enum)
+PHASES = tuple(Phase)
+PHASE_CODE = {p: i for i, p in enumerate(PHASES)}
+GREEN_A, YELLOW_A, GREEN_B, YELLOW_B, ALL_RED = (PHASE_CODE[p] for p in
+                                                 (Phase.GREEN_A, Phase.YELLOW_A, Phase.GREEN_B, Phase.YELLOW_B, Phase.ALL_RED))
+
+# Contador en rojo (regla 1): qué contadores suman en cada fase
+ADDS_A = tuple(int(c in (GREEN_B, YELLOW_B, ALL_RED)) for c in range(len(PHASES)))
+ADDS_B = tuple(int(c in (GREEN_A, YELLOW_A, ALL_RED)) for c in range(len(PHASES)))
+
+# Con integrator="exact" el contador en rojo suma vehículo-segundos / COUNTER_DT
+# (el paso con el que se calibró n_threshold) en lugar de vehículos por paso
+# (p_block, análogamente, por lanes.BLOCK_DT s)
+COUNTER_DT = 0.2
+
+# Bits de la máscara de predicados
+STOPPED_A = 1 << 0     # detenido en [0, e] del carril A
+STOPPED_B = 1 << 1
+ANY_A = 1 << 2         # alguien en [-d, 0) de A
+ANY_B = 1 << 3
+PLATOON_A = 1 << 4     # 0 < count_r de A <= m (pelotón pequeño)
+PLATOON_B = 1 << 5
+MIN_GREEN = 1 << 6     # t_in_phase >= u
+YELLOW_DONE = 1 << 7   # t_in_phase >= y
+OVER_A = 1 << 8        # red_counter_A > n
+OVER_B = 1 << 9        # red_counter_B > n
+A_AHEAD = 1 << 10      # red_counter_A >= red_counter_B
+MASK_BITS = 11
+
+# Reinicio de contadores al conmutar
+RESET_NONE, RESET_A, RESET_B = 0, 1, 2
+
+
+def predicate_mask(t, red_A, red_B, close_A, close_B, any_A, any_B, stopped_A, stopped_B, u, y, n, m):
+    """Máscara de predicados; sirve igual con escalares que con arreglos de NumPy (elemento a elemento)."""
+    return (stopped_A * STOPPED_A | stopped_B * STOPPED_B | any_A * ANY_A | any_B * ANY_B
+            | ((close_A > 0) & (close_A <= m)) * PLATOON_A | ((close_B > 0) & (close_B <= m)) * PLATOON_B
+            | (t >= u) * MIN_GREEN | (t >= y) * YELLOW_DONE
+            | (red_A > n) * OVER_A | (red_B > n) * OVER_B | (red_A >= red_B) * A_AHEAD)
+
+
+def _rules(phase: int, mask: int):
+    """Reglas 1–6 para una fase y una máscara: (fase siguiente, contador a reiniciar)."""
+    sA, sB = mask & STOPPED_A, mask & STOPPED_B
+    green = phase in (GREEN_A, GREEN_B)
+
+    # Regla 6: ambos bloqueados -> ALL_RED, desbloquear cuando una dirección se libere
+    if phase == ALL_RED:
+        if sA and sB:
+            return ALL_RED, RESET_NONE
+        if sB:
+            return GREEN_A, RESET_NONE
+        if sA:
+            return GREEN_B, RESET_NONE
+        # ambos libres: elegir por demanda
+        return (GREEN_A if mask & A_AHEAD else GREEN_B), RESET_NONE
+    if sA and sB:
+        return ALL_RED, RESET_NONE
+
+    # Regla 2: mínimo verde
+    min_green_ok = not green or mask & MIN_GREEN
+
+    # Regla 5: si verde bloqueado aguas abajo -> cambiar (respetando u)
+    if phase == GREEN_A and sA and min_green_ok:
+        return YELLOW_A, RESET_NONE
+    if phase == GREEN_B and sB and min_green_ok:
+        return YELLOW_B, RESET_NONE
+
+    # Regla 3: no cortar pelotón pequeño en r
+    hold = (phase == GREEN_A and mask & PLATOON_A) or (phase == GREEN_B and mask & PLATOON_B)
+    if min_green_ok and not hold:
+        # Regla 4: sin demanda en verde a d y hay en rojo a d
+        if phase == GREEN_A and not mask & ANY_A and mask & ANY_B:
+            return YELLOW_A, RESET_NONE
+        if phase == GREEN_B and not mask & ANY_B and mask & ANY_A:
+            return YELLOW_B, RESET_NONE
+        # Regla 1: umbral en rojo
+        if phase == GREEN_A and mask & OVER_B:
+            return YELLOW_A, RESET_NONE
+        if phase == GREEN_B and mask & OVER_A:
+            return YELLOW_B, RESET_NONE
+
+    # Final de amarillos -> conmutar
+    if phase == YELLOW_A and mask & YELLOW_DONE:
+        return GREEN_B, RESET_B
+    if phase == YELLOW_B and mask & YELLOW_DONE:
+        return GREEN_A, RESET_A
+    return phase, RESET_NONE
+
+
+def compile_table():
+    """(NEXT_PHASE, RESET_COUNTER) indexadas por (fase << MASK_BITS) | máscara."""
+    rows = [_rules(phase, mask) for phase in range(len(PHASES)) for mask in range(1 << MASK_BITS)]
+    return tuple(r[0] for r in rows), tuple(r[1] for r in rows)
+
+
+NEXT_PHASE, RESET_COUNTER = compile_table()
+IS_GREEN_A = tuple(c == GREEN_A for c in range(len(PHASES)))
+IS_GREEN_B = tuple(c == GREEN_B for c in range(len(PHASES)))
+
+
 class Controller:
     def __init__(self, cfg: ControllerConfig):
         self.cfg = cfg
-        self.phase = Phase.GREEN_A
+        self._code = GREEN_A
         self.t_in_phase = 0.0
         self.red_counter_A = 0.0
         self.red_counter_B = 0.0
         self.switches = 0
+        self._pending = None  # cambio dentro del paso (step_within): (índice en la tabla, instante)
+        # Umbrales de los predicados, fijos durante la corrida
+        self._limits = (cfg.u_min_green, cfg.y_yellow, cfg.n_threshold, cfg.m_small_platoon)
+
+    @property
+    def phase(self) -> Phase:
+        return PHASES[self._code]
+
+    @phase.setter
+    def phase(self, phase: Phase):
+        self._code = PHASE_CODE[phase]
 
     def is_green(self, for_A: bool) -> bool:
-        if self.phase == Phase.GREEN_A:
-            return for_A
-        if self.phase == Phase.GREEN_B:
-            return not for_A
-        return False
+        return IS_GREEN_A[self._code] if for_A else IS_GREEN_B[self._code]
+
+    def step_readings(self, dt: float, reading_A, reading_B):
+        """Igual que step(), tomando las lecturas LaneReading de cada carril."""
+        self.step(dt, reading_A.count_d, reading_B.count_d, reading_A.count_r, reading_B.count_r,
+                  reading_A.any_d, reading_B.any_d, reading_A.blocked, reading_B.blocked)
 
     def step(self, dt: float,
              count_A_red_zone: int,
@@ -43,77 +168,133 @@ class Controller:
              any_B_d: bool,
              stopped_A_after: bool,
              stopped_B_after: bool):
-        c = self.cfg
-        self.t_in_phase += dt
+        code = self._code
+        t = self.t_in_phase = self.t_in_phase + dt
 
         # Contador en rojo (regla 1)
-        if self.phase in (Phase.GREEN_A, Phase.YELLOW_A, Phase.ALL_RED):
+        if ADDS_B[code]:
             self.red_counter_B += count_B_red_zone
-        if self.phase in (Phase.GREEN_B, Phase.YELLOW_B, Phase.ALL_RED):
+        if ADDS_A[code]:
             self.red_counter_A += count_A_red_zone
 
-        # Regla 6: ambos bloqueados -> ALL_RED, desbloquear cuando una dirección se libere
-        if self.phase == Phase.ALL_RED:
-            if stopped_A_after and stopped_B_after:
-                return
-            if not stopped_A_after and stopped_B_after:
-                self._to(Phase.GREEN_A); return
-            if stopped_A_after and not stopped_B_after:
-                self._to(Phase.GREEN_B); return
-            # ambos libres: elegir por demanda
-            if self.red_counter_A >= self.red_counter_B:
-                self._to(Phase.GREEN_A)
-            else:
-                self._to(Phase.GREEN_B)
-            return
-
-        if stopped_A_after and stopped_B_after:
-            self._to(Phase.ALL_RED); return
-
-        # Regla 5: si verde bloqueado aguas abajo -> cambiar (respetando u)
-        if stopped_A_after and self.phase == Phase.GREEN_A and self._min_green_ok():
-            self._start_yellow(Phase.YELLOW_A); return
-        if stopped_B_after and self.phase == Phase.GREEN_B and self._min_green_ok():
-            self._start_yellow(Phase.YELLOW_B); return
-
-        # Regla 2: mínimo verde
-        if not self._min_green_ok():
-            pass  # no se permite cambiar aún
-        else:
-            # Regla 3: no cortar pelotón pequeño en r
-            if self.phase == Phase.GREEN_A and 0 < count_A_close_green <= c.m_small_platoon:
-                pass
-            elif self.phase == Phase.GREEN_B and 0 < count_B_close_green <= c.m_small_platoon:
-                pass
-            else:
-                # Regla 4: sin demanda en verde a d y hay en rojo a d
-                if self.phase == Phase.GREEN_A and (not any_A_d) and any_B_d:
-                    self._start_yellow(Phase.YELLOW_A); return
-                if self.phase == Phase.GREEN_B and (not any_B_d) and any_A_d:
-                    self._start_yellow(Phase.YELLOW_B); return
-                # Regla 1: umbral en rojo
-                if self.phase == Phase.GREEN_A and self.red_counter_B > c.n_threshold:
-                    self._start_yellow(Phase.YELLOW_A); return
-                if self.phase == Phase.GREEN_B and self.red_counter_A > c.n_threshold:
-                    self._start_yellow(Phase.YELLOW_B); return
-
-        # Final de amarillos -> conmutar
-        if self.phase == Phase.YELLOW_A and self.t_in_phase >= c.y_yellow:
-            self._to(Phase.GREEN_B); self.red_counter_B = 0.0; return
-        if self.phase == Phase.YELLOW_B and self.t_in_phase >= c.y_yellow:
-            self._to(Phase.GREEN_A); self.red_counter_A = 0.0; return
-
-    def _min_green_ok(self) -> bool:
-        return (self.phase not in (Phase.GREEN_A, Phase.GREEN_B)) or (self.t_in_phase >= self.cfg.u_min_green)
-
-    def _start_yellow(self, yphase: Phase):
-        if self.phase != yphase:
-            self.phase = yphase
+        u, y, n, m = self._limits
+        mask = predicate_mask(t, self.red_counter_A, self.red_counter_B, count_A_close_green, count_B_close_green,
+                              any_A_d, any_B_d, stopped_A_after, stopped_B_after, u, y, n, m)
+        i = code << MASK_BITS | mask
+        nxt = NEXT_PHASE[i]
+        if nxt != code:
+            self._code = nxt
             self.t_in_phase = 0.0
             self.switches += 1
+            reset = RESET_COUNTER[i]
+            if reset == RESET_A:
+                self.red_counter_A = 0.0
+            elif reset == RESET_B:
+                self.red_counter_B = 0.0
 
-    def _to(self, phase: Phase):
-        if self.phase != phase:
-            self.phase = phase
-            self.t_in_phase = 0.0
-            self.switches += 1
\ No newline at end of file
+    # Integración exacta (integrator="exact")
+    def add_red_time(self, time_A: float, time_B: float):
+        """Suma a los contadores en rojo los vehículo-segundos en la zona d de un tramo movido con la fase actual."""
+        code = self._code
+        if ADDS_A[code]:
+            self.red_counter_A += time_A / COUNTER_DT
+        if ADDS_B[code]:
+            self.red_counter_B += time_B / COUNTER_DT
+
+    def step_within(self, dt: float,
+                    count_A_red_zone: int,
+                    count_B_red_zone: int,
+                    count_A_close_green: int,
+                    count_B_close_green: int,
+                    stopped_A_after: bool,
+                    stopped_B_after: bool,
+                    events_A=(), events_B=()) -> float:
+        """
+        Como step(), pero el cambio de fase puede caer dentro del paso. events_A/B
+        son los cruces del paso con la fase actual (Lane.sensor_events: instante,
+        Δ en [-d, 0), Δ en [-r, 0)) y los contadores ya vienen sumados
+        (add_red_time). El paso se recorre por tramos entre cruces: las reglas se
+        evalúan al inicio, tras cada cruce y, dentro de cada tramo, cuando
+        t_in_phase alcanza u o y o un contador cruza n (crece a razón de count_d /
+        COUNTER_DT). Un cambio al inicio se aplica enseguida; uno dentro del paso
+        queda pendiente hasta switch_pending(), que se llama tras mover los
+        carriles hasta ese instante. Devuelve el instante del cambio pendiente
+        desde el inicio del paso, o dt si no hay.
+        """
+        code = self._code
+        t = self.t_in_phase = self.t_in_phase + dt
+        u, y, n, m = self._limits
+        red_A, red_B = self.red_counter_A, self.red_counter_B
+        cd_A, cr_A = count_A_red_zone, count_A_close_green
+        cd_B, cr_B = count_B_red_zone, count_B_close_green
+
+        def decide(tau, t_at, at_A, at_B):
+            """Índice en la tabla si las reglas cambian de fase en tau; si no, None."""
+            mask = predicate_mask(t_at, at_A, at_B, cr_A, cr_B, cd_A > 0, cd_B > 0,
+                                  stopped_A_after, stopped_B_after, u, y, n, m)
+            i = code << MASK_BITS | mask
+            return i if NEXT_PHASE[i] != code else None
+
+        found = decide(0.0, t, red_A, red_B)
+        tau = 0.0
+        if found is None:
+            changes = sorted([(tau, True, dd, dr) for tau, dd, dr in events_A]
+                             + [(tau, False, dd, dr) for tau, dd, dr in events_B])
+            changes.append((dt, None, 0, 0))
+            over = math.nextafter(n, math.inf)
+            start = 0.0
+            for end, is_A, dd, dr in changes:
+                # En [start, end) solo cambian t_in_phase y los contadores
+                rate_A = cd_A / COUNTER_DT if ADDS_A[code] else 0.0
+                rate_B = cd_B / COUNTER_DT if ADDS_B[code] else 0.0
+                checks = []
+                for limit in (u, y):
+                    if t + start < limit < t + end:
+                        tau = limit - t
+                        checks.append((tau, limit, red_A + rate_A * (tau - start), red_B + rate_B * (tau - start)))
+                if rate_A > 0.0 and red_A <= n < red_A + rate_A * (end - start):
+                    tau = start + (n - red_A) / rate_A
+                    checks.append((tau, t + tau, over, red_B + rate_B * (tau - start)))
+                if rate_B > 0.0 and red_B <= n < red_B + rate_B * (end - start):
+                    tau = start + (n - red_B) / rate_B
+                    checks.append((tau, t + tau, red_A + rate_A * (tau - start), over))
+                for check in sorted(checks):
+                    found = decide(*check)
+                    if found is not None:
+                        tau = check[0]
+                        break
+                if found is not None or is_A is None:
+                    break
+                red_A += rate_A * (end - start)
+                red_B += rate_B * (end - start)
+                if is_A:
+                    cd_A += dd
+                    cr_A += dr
+                else:
+                    cd_B += dd
+                    cr_B += dr
+                found = decide(end, t + end, red_A, red_B)
+                if found is not None:
+                    tau = end
+                    break
+                start = end
+        if found is None:
+            return dt
+        self._pending = (found, tau)
+        if tau > 0.0:
+            return tau
+        self.switch_pending()
+        return dt
+
+    def switch_pending(self):
+        """Aplica el cambio de fase que step_within dejó pendiente."""
+        i, tau = self._pending
+        self._pending = None
+        self._code = NEXT_PHASE[i]
+        self.t_in_phase = -tau
+        self.switches += 1
+        reset = RESET_COUNTER[i]
+        if reset == RESET_A:
+            self.red_counter_A = 0.0
+        elif reset == RESET_B:
+            self.red_counter_B = 0.0
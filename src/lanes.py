@@ -1,45 +1,345 @@
 import math
 import random
-from typing import List
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import chain, islice
+from operator import attrgetter
+from typing import Deque, Dict, List, NamedTuple, Optional
 from .vehicle import Vehicle
 
+_by_x = attrgetter("x")
+# Vehicles reciclados que se conservan por carril (más allá se dejan al recolector)
+POOL_MAX = 256
+# Columnas del estado de los vehículos (checkpoints)
+VEHICLE_COLUMNS = ("vid", "x", "v", "entered_at", "stopped_for", "length", "stops")
+
+# Holgura (m) para decidir que un vehículo no cruza un límite durante un salto
+EVENT_MARGIN = 1e-6
+
+# Generadores por carril: "shared" (llegadas y bloqueos del mismo) o "split" (uno para cada cosa)
+RNG_STREAMS = ("shared", "split")
+
+# Integración del movimiento: "euler" (actualización explícita al final de cada paso)
+# o "exact" (aceleración constante por tramos resuelta dentro del paso)
+INTEGRATORS = ("euler", "exact")
+# Aceleración en verde (m/s^2)
+ACCEL = 2.0
+# Con integrator="exact", p_block es la probabilidad de bloqueo por cada BLOCK_DT s
+# que un vehículo pasa en [0, e] con verde (el paso con el que se calibró)
+BLOCK_DT = 0.2
+
+
+class AntitheticRandom(random.Random):
+    """random.Random que entrega 1 - u en lugar de cada u (variable antitética)."""
+    def random(self) -> float:
+        return 1.0 - super().random()
+
+
+def block_seed(seed: int) -> str:
+    """Semilla del generador de bloqueos en modo "split" (independiente de la de llegadas)."""
+    return f"{seed}:block"
+
+
+def lane_rngs(seed: int, streams: str = "shared", antithetic: bool = False):
+    """(generador de llegadas, generador de bloqueos) de un carril; en "shared" son el mismo objeto."""
+    if streams not in RNG_STREAMS:
+        raise ValueError(f"rng_streams desconocido: {streams!r} (válidos: {', '.join(RNG_STREAMS)})")
+    cls = AntitheticRandom if antithetic else random.Random
+    rng = cls(seed)
+    return rng, (rng if streams == "shared" else cls(block_seed(seed)))
+
+class LaneReading(NamedTuple):
+    """Lecturas de todos los detectores de un carril en un paso."""
+    count_d: int    # vehículos en [-d, 0)
+    count_r: int    # vehículos en [-r, 0)
+    any_d: bool     # hay alguien en [-d, 0)
+    blocked: bool   # hay un vehículo detenido en [0, e]
+    upstream: int   # vehículos en [-road_length, 0) (cola mostrada en el HUD)
+
+def _time_to(dist: float, v: float, a: float, t_acc: float, d_acc: float) -> float:
+    """
+    Tiempo hasta recorrer dist acelerando a `a` desde v durante t_acc (d_acc
+    metros) y siguiendo luego a velocidad constante; inf si no llega.
+    """
+    if dist <= 0.0:
+        return 0.0
+    if dist <= d_acc:
+        # Raíz de a/2 t^2 + v t = dist (forma estable)
+        return 2.0 * dist / (v + math.sqrt(v * v + 2.0 * a * dist))
+    v_c = v + a * t_acc
+    return t_acc + (dist - d_acc) / v_c if v_c > 0.0 else math.inf
+
+
 class Lane:
     """
     Un carril unidimensional con x=0 en la línea de alto.
     name "A": horizontal (izq->der). name "B": vertical (arriba->abajo).
+
+    Los vehículos están en una deque ordenada por x: las llegadas entran por la
+    izquierda (cola del carril) y los que salen se retiran por la derecha (cabeza).
+    Los objetos Vehicle retirados se reciclan en un pool para las próximas llegadas.
+
+    Zonas de detección: por cada límite registrado se lleva cuántos vehículos están
+    por debajo (x < límite). Como x nunca decrece y la deque está ordenada, ese
+    número solo sube con una llegada y, al final de cada paso, baja por los que
+    acaban de cruzar el límite, así que mantenerlo cuesta O(límites + cruces) por
+    paso y el conteo de una zona [lo, hi) es una resta. set_sensors() registra las
+    zonas del controlador (read_sensors pasa a ser O(1)); add_zone() agrega lazos
+    virtuales en cualquier momento.
     """
-    def __init__(self, name: str, road_length: float, v_max: float, safe_gap: float, p_block: float, t_block: float, seed: int):
+    def __init__(self, name: str, road_length: float, v_max: float, safe_gap: float, p_block: float, t_block: float, seed: int,
+                 streams: str = "shared", antithetic: bool = False, integrator: str = "euler"):
+        if integrator not in INTEGRATORS:
+            raise ValueError(f"integrator desconocido: {integrator!r} (válidos: {', '.join(INTEGRATORS)})")
         self.name = name
         self.road_length = road_length
         self.v_max = v_max
         self.safe_gap = safe_gap
         self.p_block = p_block
         self.t_block = t_block
-        self.vehicles: List[Vehicle] = []
+        self.vehicles: Deque[Vehicle] = deque()   # ordenados por x (de atrás hacia adelante)
         self.next_vid = 1
-        self.rng = random.Random(seed)
+        self.rng, self.block_rng = lane_rngs(seed, streams, antithetic)  # llegadas, bloqueos
+        self._xs = None  # posiciones ordenadas (caché para read_sensors)
+        self._pending_u = None  # primer sorteo de Knuth ya extraído por arrival_due
+        self._cruise_parked = []  # clasificación hecha por cruise_steps
+        self.arrivals = None  # fuente precalculada (src/arrivals.py); None: Knuth paso a paso
+        self._pool: List[Vehicle] = []
+        # Contadores para src/memreport.py
+        self.allocated = 0  # Vehicle creados
+        self.recycled = 0   # llegadas servidas desde el pool
+        self.resorts = 0    # pasos en que hubo que reordenar (adelantamientos)
+        # Zonas de detección incrementales
+        self._bounds: List[float] = []     # límites registrados
+        self._below: List[int] = []        # por límite: vehículos con x < límite
+        self._zones: Dict[str, tuple] = {}  # nombre -> (índice del límite inferior, del superior)
+        self._sensor_key = None             # (d, r, e, v_thresh, min_time) de set_sensors
+        self._sensor_idx = None             # índices de los límites -d, -r, 0, e+ y -road_length
+        self._stopped_after = 0             # detenidos en [0, e] (v < v_thresh y stopped_for >= min_time)
+        # Integración exacta: vehículo-segundos en la zona d durante el último paso
+        self.exact = integrator == "exact"
+        self.red_zone_time = 0.0
+        self.block_left: Dict[int, float] = {}  # vid -> exposición al bloqueo que le queda
+
+    def spawn(self, rate: float, dt: float, now: float):
+        """Llegadas del paso [now, now+dt): de la fuente precalculada o por sorteo."""
+        if self.exact:
+            self._spawn_exact(rate, dt, now)
+        elif self.arrivals is None:
+            self.spawn_poisson(rate, dt, now)
+        else:
+            self._admit(self.arrivals.take(now + dt), now)
+
+    def _spawn_exact(self, rate: float, dt: float, now: float):
+        """
+        Llegadas con su instante dentro del paso: el vehículo se ubica detrás de la
+        entrada, a la distancia que recorre hasta llegar a ella en ese instante.
+        Con Knuth los instantes son uniformes en el paso (sorteos extra del generador).
+        """
+        if self.arrivals is None:
+            k = self._poisson_knuth(rate * dt)
+            times = sorted(now + dt * self.rng.random() for _ in range(k)) if k else ()
+        else:
+            times = self.arrivals.take_times(now + dt)
+        v0 = self.v_max * 0.85
+        for t in times:
+            self.enter(now, entered_at=t, behind=v0 * (t - now))
 
     def spawn_poisson(self, rate: float, dt: float, now: float):
         lam = rate * dt
-        arrivals = self._poisson_knuth(lam)
+        self._admit(self._poisson_knuth(lam), now)
+
+    def _admit(self, arrivals: int, now: float):
         for _ in range(arrivals):
-            x0 = -self.road_length
-            if self.vehicles and (self.vehicles[0].x - x0) < self.safe_gap:
-                continue
-            v0 = self.v_max * 0.85
-            self.vehicles.insert(0, Vehicle(self.next_vid, x0, v0, now))
-            self.next_vid += 1
+            self.enter(now)
+
+    def enter(self, now: float, entered_at: Optional[float] = None, stops: int = 0, behind: float = 0.0) -> bool:
+        """
+        Un vehículo entra en x = -road_length (- behind); False si no hay lugar (el
+        último está a menos de safe_gap). Con entered_at y stops continúa uno que
+        viene de otro carril (src/network.py).
+        """
+        x0 = -self.road_length
+        v0 = self.v_max * 0.85
+        if self.vehicles:
+            ahead = self.vehicles[0]
+            # Llegada dentro del paso: el de adelante se proyecta al instante de la llegada
+            ahead_x = ahead.x + ahead.v * behind / v0 if behind else ahead.x
+            if ahead_x - x0 < self.safe_gap:
+                return False
+        x0 -= behind
+        if self._pool:
+            veh = self._pool.pop()
+            veh.reset(self.next_vid, x0, v0, now)
+            self.recycled += 1
+        else:
+            veh = Vehicle(self.next_vid, x0, v0, now)
+            self.allocated += 1
+        if entered_at is not None:
+            veh.entered_at = entered_at
+            veh.stops = stops
+        self.vehicles.appendleft(veh)
+        self.next_vid += 1
+        self._xs = None
+        below = self._below
+        for j, b in enumerate(self._bounds):
+            if x0 < b:
+                below[j] += 1
+        return True
 
     def _poisson_knuth(self, lam: float) -> int:
         L = math.exp(-lam)
         k = 0
         p = 1.0
+        if self._pending_u is not None and p > L:
+            k = 1
+            p = self._pending_u
+            self._pending_u = None
         while p > L:
             k += 1
             p *= self.rng.random()
         return max(0, k-1)
 
+    def arrival_due(self, rate: float, dt: float, now: float) -> bool:
+        """
+        ¿Habrá al menos una llegada en el próximo paso? Con una fuente precalculada
+        basta mirar su próximo instante. Con Knuth extrae el primer sorteo y lo deja
+        pendiente para spawn_poisson, así el RNG se consume igual que en el avance
+        paso a paso. Si no hay llegada, discard_pending() descarta el sorteo
+        (equivale a un paso con cero llegadas).
+        """
+        if self.arrivals is not None:
+            return self.arrivals.next_time() < now + dt
+        lam = rate * dt
+        if lam <= 0.0:
+            return False
+        if self._pending_u is None:
+            self._pending_u = self.rng.random()
+        return self._pending_u > math.exp(-lam)
+
+    def discard_pending(self):
+        self._pending_u = None
+
+    def front_x(self) -> float:
+        """Posición del de más adelante (-inf si no hay vehículos)."""
+        return self.vehicles[-1].x if self.vehicles else -math.inf
+
+    # Estado (checkpoints)
+    def snapshot_vehicles(self) -> Dict[str, list]:
+        """Vehículos como columnas (VEHICLE_COLUMNS), ordenados por x."""
+        vehicles = self.vehicles
+        return {name: [getattr(v, name) for v in vehicles] for name in VEHICLE_COLUMNS}
+
+    def restore_vehicles(self, cols: Dict[str, list]):
+        self.vehicles = deque(Vehicle(int(vid), x, v, t0, sf, ln, int(st)) for vid, x, v, t0, sf, ln, st
+                              in zip(*(cols[name] for name in VEHICLE_COLUMNS)))
+        self._xs = None
+        xs = [v.x for v in self.vehicles]
+        self._below = [bisect_left(xs, b) for b in self._bounds]
+        self._count_stopped()
+
+    # Zonas de detección
+    def _bound(self, b: float) -> int:
+        """Índice del límite b; si es nuevo lo registra contando los vehículos actuales."""
+        try:
+            return self._bounds.index(b)
+        except ValueError:
+            pass
+        self._bounds.append(b)
+        self._below.append(bisect_left([v.x for v in self.vehicles], b))
+        return len(self._bounds) - 1
+
+    def add_zone(self, name: str, lo: float, hi: float, include_hi: bool = False):
+        """Registra la zona [lo, hi) ([lo, hi] con include_hi); zone_count(name) la lee en O(1)."""
+        if not lo < hi:
+            raise ValueError(f"zona vacía: [{lo}, {hi})")
+        if include_hi:
+            hi = math.nextafter(hi, math.inf)
+        self._zones[name] = (self._bound(lo), self._bound(hi))
+
+    def zone_count(self, name: str) -> int:
+        lo, hi = self._zones[name]
+        return self._below[hi] - self._below[lo]
+
+    def zone_counts(self) -> Dict[str, int]:
+        below = self._below
+        return {name: below[hi] - below[lo] for name, (lo, hi) in self._zones.items()}
+
+    def set_sensors(self, d: float, r: float, e: float, v_thresh: float = 0.1, min_time: float = 0.5):
+        """
+        Zonas del controlador: "d" [-d, 0), "r" [-r, 0), "after" [0, e] y "upstream"
+        [-road_length, 0). read_sensors con estos mismos parámetros no recorre los
+        vehículos; con otros, calcula como antes.
+        """
+        self.add_zone("d", -d, 0.0)
+        self.add_zone("r", -r, 0.0)
+        self.add_zone("after", 0.0, e, include_hi=True)
+        self.add_zone("upstream", -self.road_length, 0.0)
+        zones = self._zones
+        self._sensor_idx = (zones["d"][0], zones["r"][0], zones["after"][0], zones["after"][1], zones["upstream"][0])
+        self._sensor_key = (d, r, e, v_thresh, min_time)
+        self._count_stopped()
+
+    def _update_zones(self):
+        """Tras mover los vehículos: descuenta de cada límite a los que lo cruzaron."""
+        vehicles = self.vehicles
+        below = self._below
+        for j, (b, i) in enumerate(zip(self._bounds, below)):
+            if i and vehicles[i - 1].x >= b:
+                i -= 1
+                while i and vehicles[i - 1].x >= b:
+                    i -= 1
+                below[j] = i
+        self._count_stopped()
+
+    def _count_stopped(self):
+        """Detenidos en [0, e]: recorre solo los vehículos de esa zona."""
+        if self._sensor_key is None:
+            return
+        _, _, i0, ie, _ = self._sensor_idx
+        lo = self._below[i0]
+        hi = self._below[ie]
+        if lo == hi:
+            self._stopped_after = 0
+            return
+        _, _, _, v_thresh, min_time = self._sensor_key
+        vehicles = self.vehicles
+        n = len(vehicles)
+        count = 0
+        for v in islice(reversed(vehicles), n - hi, n - lo):
+            if abs(v.v) < v_thresh and (min_time <= 0.0 or v.stopped_for >= min_time):
+                count += 1
+        self._stopped_after = count
+
     # Sensores
+    def read_sensors(self, d: float, r: float, e: float, v_thresh: float = 0.1, min_time: float = 0.5) -> LaneReading:
+        """
+        Todas las lecturas del carril en una sola llamada. Con las zonas de
+        set_sensors son restas de contadores; si no, los conteos por zona usan
+        búsqueda binaria sobre las posiciones (la lista está ordenada por x).
+        """
+        if (d, r, e, v_thresh, min_time) == self._sensor_key:
+            below = self._below
+            i_d, i_r, i0, _, i_up = self._sensor_idx
+            n0 = below[i0]
+            count_d = n0 - below[i_d]
+            return LaneReading(count_d, n0 - below[i_r], count_d > 0, self._stopped_after > 0, n0 - below[i_up])
+        xs = self._xs
+        if xs is None:
+            xs = self._xs = [v.x for v in self.vehicles]
+        i0 = bisect_left(xs, 0.0)
+        count_d = i0 - bisect_left(xs, -d)
+        count_r = i0 - bisect_left(xs, -r)
+        upstream = i0 - bisect_left(xs, -self.road_length)
+        blocked = False
+        # [i0, ie) está cerca de la cabeza: recorrerlo desde la derecha
+        n = len(xs)
+        for v in islice(reversed(self.vehicles), n - bisect_right(xs, e), n - i0):
+            if abs(v.v) < v_thresh and (min_time <= 0.0 or v.stopped_for >= min_time):
+                blocked = True
+                break
+        return LaneReading(count_d, count_r, count_d > 0, blocked, upstream)
+
     def count_in_range_upstream(self, a: float, b: float = 0.0) -> int:
         lo = -a
         hi = -b
@@ -67,24 +367,40 @@ class Lane:
         return self.count_in_range_upstream(d, 0.0)
 
     # Dinámica
-    def step(self, dt: float, green: bool):
-        if not self.vehicles:
+    def step(self, dt: float, green: bool, hold_at: Optional[float] = None, room: int = 0):
+        """
+        Avanza dt. Con hold_at (salida hacia un enlace lleno, src/network.py), solo
+        los `room` de más adelante pueden pasar de hold_at: el siguiente para a
+        safe_gap de él, como ante la línea en rojo, y los de atrás hacen cola.
+        """
+        if self.exact:
+            self._step_exact(dt, green)
+            return
+        vehicles = self.vehicles
+        if not vehicles:
             return
-        self.vehicles.sort(key=lambda vv: vv.x)
-        for i, v in enumerate(self.vehicles):
-            target_v = self.v_max
+        self._xs = None
+        v_max = self.v_max
+        safe_gap = self.safe_gap
+        held = vehicles[-1 - room] if hold_at is not None and room < len(vehicles) else None
+        prev_x = -math.inf
+        inverted = False
+        it = iter(vehicles)
+        v = next(it)
+        # Recorrido de atrás hacia adelante; `ahead` todavía tiene la posición del inicio del paso
+        for ahead in chain(it, (None,)):
+            target_v = v_max
 
             # Headway con el de adelante
-            if i+1 < len(self.vehicles):
-                ahead = self.vehicles[i+1]
+            if ahead is not None:
                 gap = ahead.x - v.x - ahead.length
-                if gap < self.safe_gap:
+                if gap < safe_gap:
                     target_v = 0.0
 
             if not green:
                 if v.x < 0:
                     dist_to_line = -v.x
-                    max_adv = max(0.0, dist_to_line - self.safe_gap)
+                    max_adv = max(0.0, dist_to_line - safe_gap)
                     adv = min(target_v*dt, max_adv)
                     v.v = adv/dt if dt>0 else 0.0
                 # Si ya cruzó (x>=0), continúa
@@ -95,39 +411,376 @@ class Lane:
                 else:
                     v.v = min(v.v + 2.0*dt, target_v)  # ligera aceleración
 
+            # Salida llena: no pasa de hold_at - safe_gap
+            if v is held:
+                max_adv = max(0.0, hold_at - safe_gap - v.x)
+                if v.v * dt > max_adv:
+                    v.v = max_adv / dt
+
             # Integración
             v.x += v.v * dt
+            if v.x < prev_x:
+                inverted = True
+            prev_x = v.x
 
-            # Tiempo detenido
+            # Tiempo detenido (una detención empieza con stopped_for == 0)
             if abs(v.v) < 0.1:
+                if v.stopped_for == 0.0:
+                    v.stops += 1
                 v.stopped_for += dt
             elif v.stopped_for > 0.0:
                 v.stopped_for = 0.0
 
-        # avance de bloqueos (si hay temporizador negativo)
-        for v in self.vehicles:
+            # avance de bloqueos (si hay temporizador negativo)
             if v.stopped_for < 0.0:
                 v.stopped_for += dt
                 if v.stopped_for >= 0.0:
                     v.stopped_for = 0.0
+            v = ahead
+
+        # Mantener el orden por x (los sensores dependen de él). Solo hace falta si
+        # alguien adelantó (en rojo, pasada la línea, los vehículos no frenan)
+        if inverted:
+            self.vehicles = deque(sorted(vehicles, key=_by_x))
+            self.resorts += 1
+        self._update_zones()
+
+    def _step_exact(self, dt: float, green: bool, events: Optional[list] = None):
+        """
+        Paso con integración exacta (integrator="exact"). Dentro del paso cada
+        vehículo sigue una aceleración constante por tramos: en verde acelera a
+        ACCEL hasta v_max; en rojo antes de la línea va a v_max y para en seco a
+        safe_gap de ella; pasada la línea mantiene su velocidad. La trayectoria
+        libre se recorta analíticamente en la línea y detrás de la posición del de
+        adelante al final del paso (se recorre de adelante hacia atrás), así que el
+        orden por x se conserva. Un bloqueo retiene al vehículo detenido y su
+        temporizador corre al doble, como en step(). Los instantes de cruce dentro
+        del paso dan el tiempo pasado en la zona d (red_zone_time) y el comienzo de
+        cada detención (stopped_for cuenta desde ahí). En verde, los bloqueos ocurren
+        en tiempo continuo: riesgo constante (p_block por BLOCK_DT s) mientras el
+        vehículo está en [0, e], con un sorteo por vehículo y no por paso, así que
+        los mismos sorteos valen con cualquier dt (block_left).
+
+        Con `events` (una lista) no mueve nada: agrega (instante, Δ en [-d, 0),
+        Δ en [-r, 0)) por cada cruce de -d, -r y 0 que ocurriría en el paso.
+        """
+        vehicles = self.vehicles
+        commit = events is None
+        if commit:
+            self.red_zone_time = 0.0
+        if not vehicles:
+            return
+        v_max = self.v_max
+        safe_gap = self.safe_gap
+        d, r, e = self._sensor_key[:3] if self._sensor_key is not None else (0.0, 0.0, 0.0)
+        # Riesgo de bloqueo por segundo en [0, e]; 0 si no se sortean bloqueos
+        hazard = 0.0
+        if commit and green and self.p_block > 0 and self._sensor_key is not None:
+            hazard = -math.log1p(-min(self.p_block, 1.0 - 1e-12)) / BLOCK_DT
+        block_left = self.block_left
+        occupancy = 0.0
+        lead_x = math.inf
+        lead_len = 0.0
+        lead_v = v_max
+        for veh in reversed(vehicles):
+            x = veh.x
+            sf = veh.stopped_for
+            t0 = 0.0  # desde cuándo puede moverse en este paso
+            v = veh.v
+            if sf < 0.0:
+                t0 = -sf / 2.0
+                if t0 >= dt:
+                    # Bloqueado todo el paso
+                    if commit:
+                        sf += 2.0 * dt
+                        veh.v = 0.0
+                        veh.stopped_for = sf if sf < 0.0 else 0.0
+                    lead_x, lead_len, lead_v = x, veh.length, 0.0
+                    continue
+                sf = 0.0
+                v = 0.0
+            span = dt - t0
+
+            # Trayectoria libre: velocidad inicial v, aceleración a hasta v_cap
+            limit = math.inf
+            if green:
+                a = ACCEL
+                v_cap = v_max
+            elif x < 0.0:
+                a = 0.0
+                v = v_cap = v_max
+                limit = max(x, -safe_gap)
+            else:
+                a = 0.0
+                v_cap = v
+            t_acc = min(span, max(0.0, (v_cap - v) / a)) if a > 0.0 else 0.0
+            d_acc = v * t_acc + 0.5 * a * t_acc * t_acc
+            v_end = v + a * t_acc
+            x_end = x + d_acc + v_end * (span - t_acc)
+
+            # Recorte en la línea (rojo) y detrás del de adelante
+            by_lead = False
+            behind_lead = lead_x - lead_len - safe_gap
+            if behind_lead < limit:
+                limit = behind_lead
+                by_lead = True
+            t_stop = t0  # desde cuándo está en reposo si termina detenido
+            if x_end > limit:
+                x_end = max(x, limit)
+                t_stop = t0 + _time_to(x_end - x, v, a, t_acc, d_acc)
+                v_end = min(v_end, lead_v) if by_lead else 0.0
+
+            if not commit:
+                # Cruces de los límites de los sensores; los de atrás no llegan a -d
+                if x_end < -d:
+                    break
+                if x < 0.0 <= x_end:
+                    events.append((t0 + _time_to(-x, v, a, t_acc, d_acc), -1, -1))
+                if x < -r <= x_end:
+                    events.append((t0 + _time_to(-r - x, v, a, t_acc, d_acc), 0, 1))
+                if x < -d <= x_end:
+                    events.append((t0 + _time_to(-d - x, v, a, t_acc, d_acc), 1, 0))
+                lead_x, lead_len, lead_v = x_end, veh.length, v_end
+                continue
+
+            # Bloqueo: cada vehículo lleva una exposición Exp(1) que se consume a
+            # razón `hazard` mientras circula por [0, e] (si no empezó el paso
+            # bloqueado); se bloquea en el instante en que se agota
+            blocked_at = None
+            if hazard > 0.0 and veh.stopped_for >= 0.0 and x <= e and x_end >= 0.0:
+                t_in = _time_to(-x, v, a, t_acc, d_acc) if x < 0.0 else 0.0
+                if x_end > e:
+                    t_out = _time_to(e - x, v, a, t_acc, d_acc)
+                else:
+                    t_out = t_stop if abs(v_end) < 0.1 else dt
+                if t_out > t_in:
+                    left = block_left.pop(veh.vid, None)
+                    if left is None:
+                        left = -math.log1p(-self.block_rng.random())
+                    left -= hazard * (t_out - t_in)
+                    if left < 0.0:
+                        blocked_at = t_out + left / hazard
+                        tau = min(blocked_at, t_acc)
+                        x_at = x + v * tau + 0.5 * a * tau * tau + (v + a * t_acc) * max(0.0, blocked_at - t_acc)
+                        x_end = min(x_end, x_at)
+                    elif x_end <= e:
+                        block_left[veh.vid] = left
+            elif block_left and x <= e < x_end:
+                block_left.pop(veh.vid, None)
+
+            # Tiempo en la zona d [-d, 0)
+            if x < 0.0 and x_end >= -d:
+                t_in = t0 + _time_to(-d - x, v, a, t_acc, d_acc) if x < -d else 0.0
+                t_out = t0 + _time_to(-x, v, a, t_acc, d_acc) if x_end >= 0.0 else dt
+                occupancy += t_out - t_in
+
+            if blocked_at is not None:
+                # Retenido desde blocked_at; el temporizador corre al doble, como en step()
+                release = blocked_at + 0.5 * self.t_block
+                if release >= dt:
+                    veh.x = x_end
+                    veh.v = 0.0
+                    veh.stopped_for = -self.t_block + 2.0 * (dt - blocked_at)
+                    lead_x, lead_len, lead_v = x_end, veh.length, 0.0
+                    continue
+                # Liberado dentro del paso: arranca desde el reposo (en verde)
+                x, v, t0 = x_end, 0.0, release
+                span = dt - release
+                t_acc = min(span, v_max / ACCEL)
+                d_acc = 0.5 * ACCEL * t_acc * t_acc
+                v_end = ACCEL * t_acc
+                x_end = x + d_acc + v_end * (span - t_acc)
+                t_stop = t0
+                if x_end > behind_lead:
+                    x_end = max(x, behind_lead)
+                    t_stop = t0 + _time_to(x_end - x, 0.0, ACCEL, t_acc, d_acc)
+                    v_end = min(v_end, lead_v)
+
+            # Detenciones: empiezan cuando el vehículo llega al reposo
+            if abs(v_end) < 0.1:
+                if sf > 0.0 and x_end - x < 0.1 * dt:
+                    sf += dt
+                else:
+                    veh.stops += 1
+                    sf = dt - t_stop
+            else:
+                sf = 0.0
+            veh.x = x_end
+            veh.v = v_end
+            veh.stopped_for = sf
+            lead_x, lead_len, lead_v = x_end, veh.length, v_end
+        if commit:
+            self._xs = None
+            self.red_zone_time = occupancy
+            self._update_zones()
+
+    def sensor_events(self, dt: float, green: bool) -> list:
+        """
+        Cruces de -d, -r y 0 que ocurrirían en el próximo paso con esta fase
+        (integrator="exact"; ver _step_exact), sin mover a nadie.
+        """
+        events: list = []
+        self._step_exact(dt, green, events)
+        return events
 
     def maybe_induce_block(self, e: float):
         # Aleatoriamente "atasca" un vehículo en [0,e] durante t_block (parcial implementación de reglas 5–6)
-        if self.p_block <= 0:
+        # Con integrator="exact" los bloqueos se sortean dentro de _step_exact
+        if self.p_block <= 0 or self.exact:
             return
         for v in self.vehicles:
             if 0.0 <= v.x <= e and v.stopped_for == 0.0:
-                if self.rng.random() < self.p_block:
+                if self.block_rng.random() < self.p_block:
                     v.stopped_for = -self.t_block
                     break  # bloquear a lo sumo uno por paso para claridad
 
-    def remove_completed(self, cutoff_x: float) -> int:
-        out = 0
-        keep = []
-        for v in self.vehicles:
-            if v.x > cutoff_x:
-                out += 1
+    # Avance por eventos
+    def cruise_steps(self, dt: float, bounds, e: float, limit: int, min_time: float = 0.5):
+        """
+        Cuántos pasos (hasta `limit`) puede avanzar el carril sin interacciones ni
+        cruces de límites. Devuelve (k, solo_en_rojo): k = 0 si no es posible
+        saltar; solo_en_rojo indica que el tramo solo vale mientras el carril no
+        tenga verde.
+
+        Cada vehículo debe estar en una de estas situaciones durante todo el tramo:
+        - detenido ante el rojo antes de la línea (sin poder avanzar por la línea o
+          por un líder también detenido) o después de ella (v == 0 y ya detectado
+          como bloqueo, stopped_for >= min_time): no se mueve sin verde;
+        - libre: sin bloqueo, sin acercarse al de adelante a menos de safe_gap ni a
+          la zona donde frenaría ante el rojo, y sin cruzar ninguno de los límites
+          `bounds` (ordenados; zonas de sensores y salida). Aguas abajo debe ir a
+          >= 0.1 m/s; si p_block > 0 y está en [0, e], solo vale sin verde (en
+          verde se sortearía un bloqueo).
+        Así las lecturas de sensores no cambian durante el tramo.
+        """
+        vehicles = self.vehicles
+        flags = self._cruise_parked = []
+        if not vehicles:
+            return limit, False
+        v_max = self.v_max
+        safe_gap = self.safe_gap
+        c_hi = max(v_max, (v_max * dt) / dt) * dt   # desplazamiento máximo por paso
+        stop_x = -(safe_gap + c_hi) - EVENT_MARGIN
+        n_bounds = len(bounds)
+        k = limit
+        red_only = False
+        leader = None
+        leader_parked = False
+        for v in reversed(vehicles):
+            x = v.x
+            sf = v.stopped_for
+            if sf < 0.0:
+                return 0, False
+            gap = leader.x - x - leader.length if leader is not None else math.inf
+            if x < 0.0:
+                parked = max(0.0, -x - safe_gap) == 0.0 or (leader_parked and gap < safe_gap)
             else:
-                keep.append(v)
-        self.vehicles = keep
-        return out
\ No newline at end of file
+                parked = v.v == 0.0 and sf >= min_time
+            if parked:
+                red_only = True
+            else:
+                if x >= 0.0:
+                    if v.v < 0.1:
+                        return 0, False
+                    if self.p_block > 0 and x <= e:
+                        red_only = True
+                elif x > stop_x:
+                    return 0, False
+                if leader is not None:
+                    # El líder avanza al menos min(v, v_max) por paso (nada si está detenido)
+                    excess = gap - safe_gap - EVENT_MARGIN
+                    if excess < 0.0:
+                        return 0, False
+                    closing = c_hi - (0.0 if leader_parked else min(leader.v, v_max) * dt)
+                    if closing > 0.0:
+                        k = min(k, int(excess / closing))
+                limit_x = stop_x if x < 0.0 else math.inf
+                j = bisect_right(bounds, x)
+                if j == n_bounds:
+                    return 0, False
+                limit_x = min(limit_x, bounds[j] - EVENT_MARGIN)
+                k = min(k, int((limit_x - x) / c_hi))
+                if k < 1:
+                    return 0, False
+            flags.append(parked)
+            leader = v
+            leader_parked = parked
+        flags.reverse()
+        return k, red_only
+
+    def cruise(self, dt: float, greens):
+        """
+        Aplica de una vez los pasos validados por cruise_steps; `greens` es el estado
+        del semáforo en cada paso. Repite las mismas operaciones que step() para cada
+        vehículo, así que el resultado es idéntico bit a bit.
+        """
+        if not greens:
+            return
+        v_max = self.v_max
+        v_red = (v_max * dt) / dt
+        acc = 2.0*dt
+        for veh, parked in zip(self.vehicles, self._cruise_parked):
+            sf = veh.stopped_for
+            if parked:
+                # Solo sin verde (con verde el salto termina antes): v queda en 0
+                if sf == 0.0:
+                    veh.stops += 1
+                for _ in greens:
+                    sf += dt
+                veh.v = 0.0
+                veh.stopped_for = sf
+                continue
+            x = veh.x
+            v = veh.v
+            for g in greens:
+                if g:
+                    v = min(v + acc, v_max)
+                elif x < 0:
+                    v = v_red
+                x += v * dt
+                if abs(v) < 0.1:
+                    if sf == 0.0:
+                        veh.stops += 1
+                    sf += dt
+                elif sf > 0.0:
+                    sf = 0.0
+            veh.x = x
+            veh.v = v
+            veh.stopped_for = sf
+        self._xs = None
+        self._update_zones()
+
+    def remove_completed(self, cutoff_x: float, on_exit=None, limit: Optional[int] = None) -> int:
+        """
+        Retira los que pasaron el corte; on_exit(entered_at, stops) se llama por cada
+        uno. Con `limit`, a lo sumo esa cantidad (los de más adelante); el resto
+        espera más allá del corte.
+        """
+        # Los que pasaron el corte son los últimos de la deque (orden por x)
+        vehicles = self.vehicles
+        pool = self._pool
+        exact = self.exact
+        out = 0
+        if limit is None:
+            limit = len(vehicles)
+        while out < limit and vehicles and vehicles[-1].x > cutoff_x:
+            veh = vehicles.pop()
+            if on_exit is not None:
+                if exact and veh.v > 0.0:
+                    # Cruzó el corte (x - corte) / v antes del final del paso: se corre
+                    # la entrada en ese lapso para que el viaje termine en el cruce
+                    on_exit(veh.entered_at + (veh.x - cutoff_x) / veh.v, veh.stops)
+                else:
+                    on_exit(veh.entered_at, veh.stops)
+            if len(pool) < POOL_MAX:
+                pool.append(veh)
+            out += 1
+        if out:
+            self._xs = None
+            # Límites más allá del corte: los que salieron estaban por debajo
+            n = len(vehicles)
+            below = self._below
+            if any(c > n for c in below):
+                self._below = [min(c, n) for c in below]
+                self._count_stopped()
+        return out
@@ -0,0 +1,410 @@
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .lanes import EVENT_MARGIN, VEHICLE_COLUMNS, LaneReading, lane_rngs
+from .vehicle import Vehicle
+
+# Igual al valor por defecto de Vehicle.length
+_VEH_LENGTH = 4.5
+
+
+class ArrayLane:
+    """
+    Variante de Lane con el estado de los vehículos en arreglos contiguos de NumPy
+    (estructura de arreglos): x, v, stopped_for, length, vid, entered_at y stops.
+
+    Mantiene la misma interfaz y el mismo orden de operaciones (y de consumo del RNG)
+    que Lane, de modo que con la misma semilla produce las mismas trayectorias.
+    Los vehículos ocupan las posiciones [0, n) de cada arreglo, ordenados por x.
+
+    Cada arreglo (self.x, ...) es una vista de un búfer más largo que empieza en
+    self._lo: los vehículos entran adelante (x mínima) y salen por el final, así
+    que el espacio libre se reserva al principio y una llegada solo corre _lo un
+    lugar (O(1)). Cuando se acaba, se copian los vehículos al final de un búfer con
+    al menos tantos lugares libres como vehículos (O(n) amortizado en n llegadas).
+    """
+    def __init__(self, name: str, road_length: float, v_max: float, safe_gap: float, p_block: float, t_block: float, seed: int,
+                 streams: str = "shared", antithetic: bool = False, capacity: int = 64, integrator: str = "euler"):
+        if integrator != "euler":
+            raise ValueError("lane_backend=\"numpy\" solo admite integrator=\"euler\"")
+        self.name = name
+        self.road_length = road_length
+        self.v_max = v_max
+        self.safe_gap = safe_gap
+        self.p_block = p_block
+        self.t_block = t_block
+        self.next_vid = 1
+        self.rng, self.block_rng = lane_rngs(seed, streams, antithetic)  # llegadas, bloqueos
+        self._pending_u = None
+        self._cruise_parked = np.zeros(0, dtype=bool)
+        self.arrivals = None
+        self.resorts = 0  # pasos en que hubo que reordenar
+        self._zones: Dict[str, tuple] = {}
+
+        self.n = 0
+        self._buf = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self._DTYPES.items()}
+        self._lo = capacity
+        self._rebind()
+
+    _COLUMNS = ("x", "v", "stopped_for", "length", "entered_at", "vid", "stops")
+    _DTYPES = {"x": np.float64, "v": np.float64, "stopped_for": np.float64, "length": np.float64,
+               "entered_at": np.float64, "vid": np.int64, "stops": np.int64}
+
+    def __len__(self) -> int:
+        return self.n
+
+    def front_x(self) -> float:
+        return float(self.x[self.n - 1]) if self.n else -math.inf
+
+    @property
+    def vehicles(self) -> List[Vehicle]:
+        """Copia de los vehículos como objetos Vehicle (para el HUD y el dibujo)."""
+        n = self.n
+        return [Vehicle(int(vid), float(x), float(v), float(t0), float(sf), float(ln), int(st))
+                for vid, x, v, t0, sf, ln, st in zip(self.vid[:n], self.x[:n], self.v[:n], self.entered_at[:n],
+                                                      self.stopped_for[:n], self.length[:n], self.stops[:n])]
+
+    def _rebind(self):
+        lo = self._lo
+        for name in self._COLUMNS:
+            setattr(self, name, self._buf[name][lo:])
+
+    def _make_room(self):
+        """Lugar libre adelante: los n vehículos al final de un búfer con capacidad >= 2(n+1)."""
+        n = self.n
+        cap = len(self._buf["x"])
+        while cap < 2 * (n + 1):
+            cap *= 2
+        lo = cap - n
+        for name in self._COLUMNS:
+            new = np.zeros(cap, dtype=self._DTYPES[name])
+            new[lo:] = getattr(self, name)[:n]
+            self._buf[name] = new
+        self._lo = lo
+        self._rebind()
+
+    def _prepend(self, vid: int, x0: float, v0: float, now: float):
+        if self._lo == 0:
+            self._make_room()
+        self._lo -= 1
+        self._rebind()
+        self.x[0] = x0
+        self.v[0] = v0
+        self.stopped_for[0] = 0.0
+        self.length[0] = _VEH_LENGTH
+        self.entered_at[0] = now
+        self.vid[0] = vid
+        self.stops[0] = 0
+        self.n += 1
+
+    # Estado (checkpoints)
+    def snapshot_vehicles(self) -> Dict[str, list]:
+        n = self.n
+        return {name: getattr(self, name)[:n].tolist() for name in VEHICLE_COLUMNS}
+
+    def restore_vehicles(self, cols: Dict[str, list]):
+        n = len(cols["x"])
+        cap = len(self._buf["x"])
+        while cap < 2 * (n + 1):
+            cap *= 2
+        lo = cap - n
+        for name in self._COLUMNS:
+            arr = np.zeros(cap, dtype=self._DTYPES[name])
+            arr[lo:] = cols[name]
+            self._buf[name] = arr
+        self._lo = lo
+        self.n = n
+        self._rebind()
+
+    def spawn(self, rate: float, dt: float, now: float):
+        if self.arrivals is None:
+            self.spawn_poisson(rate, dt, now)
+        else:
+            self._admit(self.arrivals.take(now + dt), now)
+
+    def spawn_poisson(self, rate: float, dt: float, now: float):
+        lam = rate * dt
+        self._admit(self._poisson_knuth(lam), now)
+
+    def _admit(self, arrivals: int, now: float):
+        for _ in range(arrivals):
+            self.enter(now)
+
+    def enter(self, now: float, entered_at: Optional[float] = None, stops: int = 0) -> bool:
+        """Ver Lane.enter."""
+        x0 = -self.road_length
+        if self.n and (self.x[0] - x0) < self.safe_gap:
+            return False
+        self._prepend(self.next_vid, x0, self.v_max * 0.85, now if entered_at is None else entered_at)
+        self.stops[0] = stops
+        self.next_vid += 1
+        return True
+
+    def _poisson_knuth(self, lam: float) -> int:
+        L = math.exp(-lam)
+        k = 0
+        p = 1.0
+        if self._pending_u is not None and p > L:
+            k = 1
+            p = self._pending_u
+            self._pending_u = None
+        while p > L:
+            k += 1
+            p *= self.rng.random()
+        return max(0, k-1)
+
+    def arrival_due(self, rate: float, dt: float, now: float) -> bool:
+        """Ver Lane.arrival_due."""
+        if self.arrivals is not None:
+            return self.arrivals.next_time() < now + dt
+        lam = rate * dt
+        if lam <= 0.0:
+            return False
+        if self._pending_u is None:
+            self._pending_u = self.rng.random()
+        return self._pending_u > math.exp(-lam)
+
+    def discard_pending(self):
+        self._pending_u = None
+
+    # Sensores (vectorizados)
+    def read_sensors(self, d: float, r: float, e: float, v_thresh: float = 0.1, min_time: float = 0.5) -> LaneReading:
+        """Todas las lecturas del carril; los conteos por zona con searchsorted (x está ordenado)."""
+        n = self.n
+        x = self.x[:n]
+        i0, id_, ir, iu = np.searchsorted(x, (0.0, -d, -r, -self.road_length), side="left")
+        ie = np.searchsorted(x, e, side="right")
+        count_d = int(i0 - id_)
+        count_r = int(i0 - ir)
+        mask = np.abs(self.v[i0:ie]) < v_thresh
+        if min_time > 0.0:
+            mask &= self.stopped_for[i0:ie] >= min_time
+        return LaneReading(count_d, count_r, count_d > 0, bool(mask.any()), int(i0 - iu))
+
+    # Zonas de detección (misma interfaz que Lane; aquí se cuentan con searchsorted al leer)
+    def add_zone(self, name: str, lo: float, hi: float, include_hi: bool = False):
+        if not lo < hi:
+            raise ValueError(f"zona vacía: [{lo}, {hi})")
+        self._zones[name] = (lo, math.nextafter(hi, math.inf) if include_hi else hi)
+
+    def zone_count(self, name: str) -> int:
+        lo, hi = self._zones[name]
+        i, j = np.searchsorted(self.x[:self.n], (lo, hi), side="left")
+        return int(j - i)
+
+    def zone_counts(self) -> Dict[str, int]:
+        return {name: self.zone_count(name) for name in self._zones}
+
+    def set_sensors(self, d: float, r: float, e: float, v_thresh: float = 0.1, min_time: float = 0.5):
+        self.add_zone("d", -d, 0.0)
+        self.add_zone("r", -r, 0.0)
+        self.add_zone("after", 0.0, e, include_hi=True)
+        self.add_zone("upstream", -self.road_length, 0.0)
+
+    def count_in_range_upstream(self, a: float, b: float = 0.0) -> int:
+        x = self.x[:self.n]
+        return int(np.count_nonzero((x >= -a) & (x < -b)))
+
+    def any_in_range_upstream(self, a: float) -> bool:
+        return self.count_in_range_upstream(a, 0.0) > 0
+
+    def count_close_to_line(self, r: float) -> int:
+        return self.count_in_range_upstream(r, 0.0)
+
+    def has_stopped_downstream(self, e: float, v_thresh: float = 0.1, min_time: float = 0.5) -> bool:
+        n = self.n
+        x = self.x[:n]
+        mask = (x >= 0.0) & (x <= e) & (np.abs(self.v[:n]) < v_thresh)
+        if min_time > 0.0:
+            mask &= self.stopped_for[:n] >= min_time
+        return bool(mask.any())
+
+    def count_red_zone(self, d: float) -> int:
+        return self.count_in_range_upstream(d, 0.0)
+
+    # Dinámica
+    def step(self, dt: float, green: bool, hold_at: Optional[float] = None, room: int = 0):
+        """Como Lane.step (hold_at: salida hacia un enlace lleno)."""
+        n = self.n
+        if not n:
+            return
+        x = self.x[:n]
+        v = self.v[:n]
+        sf = self.stopped_for[:n]
+
+        # Headway con el de adelante (posiciones al inicio del paso)
+        target = np.full(n, self.v_max)
+        if n > 1:
+            gap = x[1:] - x[:-1] - self.length[1:n]
+            target[:-1][gap < self.safe_gap] = 0.0
+
+        if not green:
+            up = x < 0
+            if up.any():
+                max_adv = np.maximum(0.0, -x[up] - self.safe_gap)
+                adv = np.minimum(target[up] * dt, max_adv)
+                v[up] = adv / dt if dt > 0 else 0.0
+            # Si ya cruzó (x>=0), continúa
+        else:
+            v[:] = np.where(sf < 0.0, 0.0, np.minimum(v + 2.0*dt, target))
+
+        # Salida llena: el (room + 1)-ésimo desde adelante no pasa de hold_at - safe_gap
+        if hold_at is not None and room < n:
+            i = n - 1 - room
+            max_adv = max(0.0, hold_at - self.safe_gap - x[i])
+            if v[i] * dt > max_adv:
+                v[i] = max_adv / dt
+
+        # Integración
+        x += v * dt
+
+        # Tiempo detenido (una detención empieza con stopped_for == 0)
+        stopped = np.abs(v) < 0.1
+        self.stops[:n][stopped & (sf == 0.0)] += 1
+        sf[stopped] += dt
+        sf[~stopped & (sf > 0.0)] = 0.0
+
+        # avance de bloqueos (si hay temporizador negativo)
+        blocked = sf < 0.0
+        if blocked.any():
+            sf[blocked] += dt
+            sf[blocked & (sf >= 0.0)] = 0.0
+
+        # Mantener el orden por x (los sensores dependen de él)
+        if n > 1 and np.any(x[1:] < x[:-1]):
+            order = np.argsort(x, kind="stable")
+            for name in self._COLUMNS:
+                arr = getattr(self, name)
+                arr[:n] = arr[:n][order]
+            self.resorts += 1
+
+    def maybe_induce_block(self, e: float):
+        if self.p_block <= 0:
+            return
+        n = self.n
+        x = self.x[:n]
+        candidates = np.flatnonzero((x >= 0.0) & (x <= e) & (self.stopped_for[:n] == 0.0))
+        for i in candidates:
+            if self.block_rng.random() < self.p_block:
+                self.stopped_for[i] = -self.t_block
+                break
+
+    # Avance por eventos (ver Lane.cruise_steps y Lane.cruise)
+    def cruise_steps(self, dt: float, bounds, e: float, limit: int, min_time: float = 0.5):
+        n = self.n
+        if not n:
+            self._cruise_parked = np.zeros(0, dtype=bool)
+            return limit, False
+        x = self.x[:n]
+        v = self.v[:n]
+        sf = self.stopped_for[:n]
+        safe_gap = self.safe_gap
+        v_max = self.v_max
+        c_hi = max(v_max, (v_max * dt) / dt) * dt
+        stop_x = -(safe_gap + c_hi) - EVENT_MARGIN
+        if np.any(sf < 0.0):
+            return 0, False
+
+        # Detenidos sin verde: antes de la línea (en ella, o tras un líder detenido a
+        # menos de safe_gap) o después (v == 0 y bloqueo ya detectado)
+        gap = np.full(n, np.inf)
+        gap[:-1] = x[1:] - x[:-1] - self.length[1:n]
+        up = x < 0.0
+        down = ~up
+        anchor = (up & (np.maximum(0.0, -x - safe_gap) == 0.0)) | (down & (v == 0.0) & (sf >= min_time))
+        behind = up & (gap < safe_gap)
+        ends = anchor | ~behind
+        nxt = np.minimum.accumulate(np.where(ends, np.arange(n), n)[::-1])[::-1]
+        parked = anchor[nxt]
+        free = ~parked
+
+        if np.any(free & down & (v < 0.1)):
+            return 0, False
+        if np.any(free & up & (x > stop_x)) or np.any(free & (gap < safe_gap + EVENT_MARGIN)):
+            return 0, False
+        red_only = bool(parked.any())
+        if self.p_block > 0 and np.any(free & down & (x <= e)):
+            red_only = True
+
+        # Acercamiento máximo por paso al líder (que avanza al menos min(v, v_max) si no está detenido)
+        k = limit
+        if n > 1:
+            lead_min = np.where(parked[1:], 0.0, np.minimum(v[1:], v_max) * dt)
+            closing = c_hi - lead_min
+            hw = free[:-1] & (closing > 0.0)
+            if hw.any():
+                excess = gap[:-1] - safe_gap - EVENT_MARGIN
+                k = min(k, int(np.min(excess[hw] / closing[hw])))
+        limit_x = np.where(up, stop_x, np.inf)
+        b = np.asarray(bounds, dtype=float)
+        j = np.searchsorted(b, x, side="right")
+        if np.any(free & (j == len(b))):
+            return 0, False
+        limit_x = np.minimum(limit_x, b[np.minimum(j, len(b) - 1)] - EVENT_MARGIN)
+        if free.any():
+            k = min(k, int(np.min((limit_x[free] - x[free]) / c_hi)))
+        if k < 1:
+            return 0, False
+        self._cruise_parked = parked
+        return k, red_only
+
+    def cruise(self, dt: float, greens):
+        if not greens:
+            return
+        n = self.n
+        v_max = self.v_max
+        v_red = (v_max * dt) / dt
+        acc = 2.0*dt
+        parked = self._cruise_parked
+        free = ~parked
+        x = self.x[:n][free]
+        v = self.v[:n][free]
+        sf = self.stopped_for[:n][free]
+        stops = self.stops[:n][free]
+        up = x < 0.0
+        for g in greens:
+            if g:
+                v = np.minimum(v + acc, v_max)
+            else:
+                v = np.where(up, v_red, v)
+            x = x + v * dt
+            stopped = np.abs(v) < 0.1
+            stops = stops + (stopped & (sf == 0.0))
+            sf = np.where(stopped, sf + dt, np.where(sf > 0.0, 0.0, sf))
+        self.x[:n][free] = x
+        self.v[:n][free] = v
+        self.stopped_for[:n][free] = sf
+        self.stops[:n][free] = stops
+        if parked.any():
+            sfp = self.stopped_for[:n][parked]
+            self.stops[:n][parked & (self.stopped_for[:n] == 0.0)] += 1
+            for _ in greens:
+                sfp = sfp + dt
+            self.stopped_for[:n][parked] = sfp
+            self.v[:n][parked] = 0.0
+
+    def remove_completed(self, cutoff_x: float, on_exit=None, limit: Optional[int] = None) -> int:
+        n = self.n
+        if not n or not self.x[n - 1] > cutoff_x:
+            return 0  # x está ordenado: nadie pasó el corte
+        keep = ~(self.x[:n] > cutoff_x)
+        kept = int(np.count_nonzero(keep))
+        out = n - kept
+        if limit is not None and out > limit:
+            # x está ordenado: los que salen son los últimos `limit`
+            keep[:n - limit] = True
+            kept, out = n - limit, limit
+        if out:
+            if on_exit is not None:
+                # Mismo orden que Lane: de adelante hacia atrás
+                gone = ~keep
+                for entered_at, stops in zip(self.entered_at[:n][gone][::-1].tolist(),
+                                             self.stops[:n][gone][::-1].tolist()):
+                    on_exit(entered_at, stops)
+            for name in self._COLUMNS:
+                arr = getattr(self, name)
+                arr[:kept] = arr[:n][keep]
+            self.n = kept
+        return out
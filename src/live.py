@@ -0,0 +1,159 @@
+"""
+Simulación en un hilo propio para la interfaz (app.py), desacoplada del dibujo.
+
+El hilo avanza la simulación a `speed` veces el tiempo real (None: lo más rápido
+posible) y publica instantáneas inmutables en un doble búfer: escribe en la ranura
+libre y luego cambia el índice de la vigente, de modo que el lector nunca espera
+ni ve una instantánea a medio armar. El dibujo interpola entre las dos últimas.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from .controller import Phase
+from .sim_core import Simulation
+
+# Publicar como mucho cada tanto (s de reloj) cuando se corre sin límite de velocidad
+PUBLISH_EVERY = 1.0 / 120.0
+# Pasos máximos por tramo; evita que un atraso largo congele la publicación
+MAX_STEPS_PER_CHUNK = 5000
+
+VehicleState = Tuple[int, float, float]  # (vid, x, stopped_for)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Estado publicado por el hilo de simulación (solo lectura)."""
+    wall: float            # time.perf_counter() al publicar
+    steps: int
+    time: float
+    phase: Phase
+    t_in_phase: float
+    red_counter_A: float
+    red_counter_B: float
+    switches: int
+    completed_A: int
+    completed_B: int
+    upstream_A: int        # vehículos antes de la línea (x < 0) al terminar el paso
+    upstream_B: int
+    vehicles_A: Tuple[VehicleState, ...]
+    vehicles_B: Tuple[VehicleState, ...]
+    sim_rate: float        # pasos/s logrados
+
+
+def queue_count(vehicles: Tuple[VehicleState, ...]) -> int:
+    """
+    Cola del HUD: vehículos con x < 0, incluidos los que con integrator="exact"
+    entran detrás de -road_length. Se cuenta sobre los vehículos de la instantánea
+    (después del paso), no con la lectura de sensores del principio del paso.
+    """
+    return sum(1 for _, x, _ in vehicles if x < 0.0)
+
+
+def take_snapshot(sim: Simulation, steps: int, sim_rate: float) -> Snapshot:
+    ctrl = sim.ctrl
+    vehicles_A = tuple((v.vid, v.x, v.stopped_for) for v in sim.lane_A.vehicles)
+    vehicles_B = tuple((v.vid, v.x, v.stopped_for) for v in sim.lane_B.vehicles)
+    return Snapshot(
+        wall=time.perf_counter(),
+        steps=steps,
+        time=sim.time,
+        phase=ctrl.phase,
+        t_in_phase=ctrl.t_in_phase,
+        red_counter_A=ctrl.red_counter_A,
+        red_counter_B=ctrl.red_counter_B,
+        switches=ctrl.switches,
+        completed_A=sim.completed_A,
+        completed_B=sim.completed_B,
+        upstream_A=queue_count(vehicles_A),
+        upstream_B=queue_count(vehicles_B),
+        vehicles_A=vehicles_A,
+        vehicles_B=vehicles_B,
+        sim_rate=sim_rate,
+    )
+
+
+class LiveSimulation:
+    def __init__(self, sim: Simulation, speed: Optional[float] = 10.0):
+        self.sim = sim
+        self.speed = speed       # múltiplo del tiempo real; None = sin límite
+        self.paused = False
+        self.steps = 0
+        self._slots = [take_snapshot(sim, 0, 0.0), None]
+        self._front = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="simulacion", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+    def latest(self) -> Tuple[Optional[Snapshot], Snapshot]:
+        """(anterior, vigente); la anterior es None hasta la segunda publicación."""
+        front = self._front
+        return self._slots[1 - front], self._slots[front]
+
+    def _publish(self, rate: float):
+        back = 1 - self._front
+        self._slots[back] = take_snapshot(self.sim, self.steps, rate)
+        self._front = back
+
+    def _run(self):
+        sim = self.sim
+        dt = sim.cfg.dt
+        budget = 0.0
+        last = time.perf_counter()
+        rate = 0.0
+        rate_t0, rate_steps = last, 0
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            if self.paused:
+                budget = 0.0
+                time.sleep(0.01)
+                continue
+            if self.speed is None:
+                deadline = now + PUBLISH_EVERY
+                todo = MAX_STEPS_PER_CHUNK
+            else:
+                budget = min(budget + elapsed * self.speed / dt, float(MAX_STEPS_PER_CHUNK))
+                todo = int(budget)
+                if todo == 0:
+                    time.sleep(min(PUBLISH_EVERY, (1.0 - budget) * dt / self.speed))
+                    continue
+                budget -= todo
+                deadline = None
+            done = 0
+            while done < todo:
+                done += sim.advance(todo - done)
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+            self.steps += done
+            rate_steps += done
+            t = time.perf_counter()
+            if t - rate_t0 >= 0.5:
+                rate = rate_steps / (t - rate_t0)
+                rate_t0, rate_steps = t, 0
+            self._publish(rate)
+
+
+def interpolate(prev: Optional[Snapshot], cur: Snapshot, now: float) -> Dict[str, Tuple[VehicleState, ...]]:
+    """
+    Posiciones para dibujar en `now` (reloj): avanza de `prev` a `cur` en el mismo
+    tiempo que tardó en llegar `cur`, así el movimiento es continuo aunque las
+    publicaciones sean irregulares. Los vehículos nuevos aparecen donde están en
+    `cur`; los que ya salieron no se dibujan.
+    """
+    if prev is None or cur.wall <= prev.wall:
+        return {"A": cur.vehicles_A, "B": cur.vehicles_B}
+    alpha = min(1.0, max(0.0, (now - cur.wall) / (cur.wall - prev.wall)))
+    out = {}
+    for name, before, after in (("A", prev.vehicles_A, cur.vehicles_A), ("B", prev.vehicles_B, cur.vehicles_B)):
+        x0 = {vid: x for vid, x, _ in before}
+        out[name] = tuple((vid, x0[vid] + alpha * (x - x0[vid]) if vid in x0 else x, sf) for vid, x, sf in after)
+    return out
@@ -0,0 +1,429 @@
+"""
+Métricas de desempeño en streaming, con memoria constante y combinables.
+
+    sim = Simulation(cfg)
+    m = Metrics(sim)            # se engancha en sim.metrics
+    sim.run_for(7 * 86400)
+    print(json.dumps(m.report(), indent=2))
+
+Se actualizan al retirar cada vehículo (Lane.remove_completed) y al final de cada
+paso; nada crece con la cantidad de vehículos:
+
+- Por dirección: tiempo de viaje (salida - Vehicle.entered_at), demora (viaje menos
+  el de flujo libre, medido una vez con un vehículo solo y siempre en verde),
+  detenciones por vehículo, cola (vehículos en [-road_length, 0), promedio en el
+  tiempo) y vehículos salidos por ventana de `window` s.
+- Por fase: duración de cada intervalo completo en esa fase.
+
+Media y varianza con el acumulador de Welford; p50/p90/p99 con LogSketch (cubetas
+logarítmicas, error relativo acotado) o IntHistogram (valores enteros, exacto).
+Todo se puede combinar con merge() y serializar con to_dict()/from_dict(), así que
+las métricas de varios procesos se juntan sin perder nada:
+
+    total = Metrics.merged(dicts)    # dicts = [m.to_dict() de cada proceso]
+"""
+import math
+from typing import Any, Dict, Iterable, List, Optional
+
+from .controller import Phase
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Welford:
+    """Cantidad, media, varianza, mínimo y máximo en una pasada."""
+    __slots__ = ("n", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x: float):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def merge(self, other: "Welford"):
+        """Combinación de Chan et al.: igual que haber agregado todos los valores aquí."""
+        if not other.n:
+            return
+        if not self.n:
+            self.n, self.mean, self.m2, self.min, self.max = other.n, other.mean, other.m2, other.min, other.max
+            return
+        n = self.n + other.n
+        d = other.mean - self.mean
+        self.mean += d * other.n / n
+        self.m2 += other.m2 + d * d * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.n:
+            return {"n": 0}
+        return {"n": self.n, "mean": self.mean, "std": math.sqrt(self.variance), "min": self.min, "max": self.max}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"n": self.n, "mean": self.mean, "m2": self.m2,
+                "min": self.min if self.n else None, "max": self.max if self.n else None}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Welford":
+        w = cls()
+        w.n, w.mean, w.m2 = d["n"], d["mean"], d["m2"]
+        if w.n:
+            w.min, w.max = d["min"], d["max"]
+        return w
+
+
+class LogSketch:
+    """
+    Cuantiles aproximados con error relativo `alpha`: cada valor positivo cae en la
+    cubeta ceil(log_gamma(x)), gamma = (1 + alpha) / (1 - alpha). Los valores
+    <= min_value se cuentan aparte (como cero). Si hay más de max_buckets cubetas se
+    juntan las más bajas, así que la memoria está acotada.
+    """
+    __slots__ = ("alpha", "min_value", "max_buckets", "_log_gamma", "buckets", "zeros", "n")
+
+    def __init__(self, alpha: float = 0.01, min_value: float = 1e-6, max_buckets: int = 2048):
+        self.alpha = alpha
+        self.min_value = min_value
+        self.max_buckets = max_buckets
+        self._log_gamma = math.log((1.0 + alpha) / (1.0 - alpha))
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.n = 0
+
+    def add(self, x: float):
+        self.n += 1
+        if x <= self.min_value:
+            self.zeros += 1
+            return
+        k = math.ceil(math.log(x) / self._log_gamma)
+        buckets = self.buckets
+        buckets[k] = buckets.get(k, 0) + 1
+        if len(buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        keys = sorted(self.buckets)
+        extra = keys[:len(keys) - self.max_buckets + 1]
+        target = keys[len(extra)]
+        self.buckets[target] += sum(self.buckets.pop(k) for k in extra)
+
+    def merge(self, other: "LogSketch"):
+        if other.alpha != self.alpha:
+            raise ValueError("no se pueden combinar LogSketch con distinto alpha")
+        for k, c in other.buckets.items():
+            self.buckets[k] = self.buckets.get(k, 0) + c
+        self.zeros += other.zeros
+        self.n += other.n
+        while len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def quantile(self, q: float) -> float:
+        if not self.n:
+            return math.nan
+        rank = q * (self.n - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for k in sorted(self.buckets):
+            seen += self.buckets[k]
+            if seen > rank:
+                # Centro de la cubeta (gamma^(k-1), gamma^k] en escala relativa
+                return 2.0 * math.exp(k * self._log_gamma) / (1.0 + math.exp(self._log_gamma))
+        return 2.0 * math.exp(max(self.buckets) * self._log_gamma) / (1.0 + math.exp(self._log_gamma))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"alpha": self.alpha, "min_value": self.min_value, "max_buckets": self.max_buckets,
+                "zeros": self.zeros, "n": self.n, "buckets": [[k, c] for k, c in sorted(self.buckets.items())]}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "LogSketch":
+        s = cls(d["alpha"], d["min_value"], d["max_buckets"])
+        s.zeros, s.n = d["zeros"], d["n"]
+        s.buckets = {int(k): int(c) for k, c in d["buckets"]}
+        return s
+
+
+class IntHistogram:
+    """Histograma exacto de enteros no negativos (conteos chicos: colas, detenciones, salidas por ventana)."""
+    __slots__ = ("counts", "n")
+
+    def __init__(self):
+        self.counts: List[int] = []
+        self.n = 0
+
+    def add(self, k: int, weight: int = 1):
+        counts = self.counts
+        if k >= len(counts):
+            counts.extend([0] * (k + 1 - len(counts)))
+        counts[k] += weight
+        self.n += weight
+
+    def merge(self, other: "IntHistogram"):
+        for k, c in enumerate(other.counts):
+            if c:
+                self.add(k, c)
+
+    def quantile(self, q: float) -> float:
+        if not self.n:
+            return math.nan
+        rank = q * (self.n - 1)
+        seen = 0
+        for k, c in enumerate(self.counts):
+            seen += c
+            if seen > rank:
+                return float(k)
+        return float(len(self.counts) - 1)
+
+    def mean(self) -> float:
+        return sum(k * c for k, c in enumerate(self.counts)) / self.n if self.n else math.nan
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"counts": list(self.counts)}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "IntHistogram":
+        h = cls()
+        for k, c in enumerate(d["counts"]):
+            if c:
+                h.add(k, c)
+        return h
+
+
+def _quantiles(dist) -> Dict[str, float]:
+    return {f"p{round(100 * q)}": dist.quantile(q) for q in QUANTILES}
+
+
+def _hist_summary(h: IntHistogram) -> Dict[str, Any]:
+    if not h.n:
+        return {"n": 0}
+    out = {"n": h.n, "mean": h.mean(), "max": len(h.counts) - 1}
+    out.update(_quantiles(h))
+    return out
+
+
+class Stat:
+    """Welford + distribución (LogSketch o IntHistogram) del mismo flujo de valores."""
+    __slots__ = ("acc", "dist")
+
+    def __init__(self, integer: bool = False):
+        self.acc = Welford()
+        self.dist = IntHistogram() if integer else LogSketch()
+
+    def add(self, x):
+        self.acc.add(x)
+        self.dist.add(x)
+
+    def merge(self, other: "Stat"):
+        self.acc.merge(other.acc)
+        self.dist.merge(other.dist)
+
+    def summary(self) -> Dict[str, Any]:
+        out = self.acc.summary()
+        if self.acc.n:
+            out.update(_quantiles(self.dist))
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"acc": self.acc.to_dict(), "dist": self.dist.to_dict(), "integer": isinstance(self.dist, IntHistogram)}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Stat":
+        s = cls(d["integer"])
+        s.acc = Welford.from_dict(d["acc"])
+        s.dist = (IntHistogram if d["integer"] else LogSketch).from_dict(d["dist"])
+        return s
+
+
+class DirectionMetrics:
+    """Acumuladores de una dirección (carril)."""
+    def __init__(self):
+        self.travel = Stat()
+        self.delay = Stat()
+        self.stops = Stat(integer=True)
+        self.queue = IntHistogram()       # cola en cada paso (pesos iguales: dt fijo)
+        self.per_window = IntHistogram()  # vehículos salidos por ventana completa
+        self.exited = 0
+        self._window_count = 0
+
+    def merge(self, other: "DirectionMetrics"):
+        self.travel.merge(other.travel)
+        self.delay.merge(other.delay)
+        self.stops.merge(other.stops)
+        self.queue.merge(other.queue)
+        self.per_window.merge(other.per_window)
+        self.exited += other.exited
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"travel": self.travel.to_dict(), "delay": self.delay.to_dict(), "stops": self.stops.to_dict(),
+                "queue": self.queue.to_dict(), "per_window": self.per_window.to_dict(), "exited": self.exited}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "DirectionMetrics":
+        m = cls()
+        m.travel = Stat.from_dict(d["travel"])
+        m.delay = Stat.from_dict(d["delay"])
+        m.stops = Stat.from_dict(d["stops"])
+        m.queue = IntHistogram.from_dict(d["queue"])
+        m.per_window = IntHistogram.from_dict(d["per_window"])
+        m.exited = d["exited"]
+        return m
+
+
+def free_flow_time(cfg) -> float:
+    """Tiempo de viaje de un vehículo solo, siempre en verde (mismo motor que la simulación)."""
+    from .lanes import Lane
+    lane = Lane("libre", cfg.road_length, cfg.v_max, cfg.safe_gap, 0.0, 0.0, seed=0, integrator=cfg.integrator)
+    lane._admit(1, 0.0)
+    cutoff = cfg.e_after + cfg.intersection_len + 25.0
+    steps = 0
+    # Con integrator="exact" la salida corre entered_at según el instante del cruce
+    exits = []
+    while True:
+        lane.step(cfg.dt, True)
+        steps += 1
+        if lane.remove_completed(cutoff, lambda entered_at, stops: exits.append(entered_at)):
+            return steps * cfg.dt - exits[0]
+
+
+class Metrics:
+    def __init__(self, sim=None, window: float = 60.0, free_flow: Optional[float] = None, dt: Optional[float] = None):
+        self.window = window
+        self.dt = dt if dt is not None else (sim.cfg.dt if sim is not None else 0.0)
+        self.free_flow = free_flow if free_flow is not None else (free_flow_time(sim.cfg) if sim is not None else 0.0)
+        self.directions = {"A": DirectionMetrics(), "B": DirectionMetrics()}
+        self.phases: Dict[str, Stat] = {p.name: Stat() for p in Phase}
+        self.steps = 0
+        self.sim = None
+        self._steps_per_window = max(1, round(window / self.dt)) if self.dt else 1
+        self._window_steps = 0
+        self._phase = None
+        self._phase_steps = 0
+        if sim is not None:
+            self.attach(sim)
+
+    # Enganche
+    def attach(self, sim):
+        if getattr(sim, "metrics", None) is not None:
+            raise ValueError("la simulación ya tiene métricas")
+        self.sim = sim
+        self._phase = sim.ctrl.phase
+        sim.metrics = self
+        return self
+
+    def detach(self):
+        if self.sim is not None and self.sim.metrics is self:
+            self.sim.metrics = None
+        self.sim = None
+
+    # Actualizaciones (las llama Simulation)
+    def exit_A(self, entered_at: float, stops: int):
+        self._exit(self.directions["A"], entered_at, stops)
+
+    def exit_B(self, entered_at: float, stops: int):
+        self._exit(self.directions["B"], entered_at, stops)
+
+    def _exit(self, d: DirectionMetrics, entered_at: float, stops: int):
+        # remove_completed corre antes de avanzar el reloj: la salida es al final del paso
+        sim = self.sim
+        travel = sim.time + self.dt - entered_at
+        delay = travel - self.free_flow
+        d.travel.add(travel)
+        d.delay.add(delay if delay > 1e-9 else 0.0)
+        d.stops.add(stops)
+        d.exited += 1
+        d._window_count += 1
+
+    def on_step(self, phase: Phase, queue_A: int, queue_B: int):
+        """Final de un paso: `phase` es la que rigió el paso; las colas, las leídas al inicio."""
+        self.steps += 1
+        dirs = self.directions
+        dA = dirs["A"]
+        dB = dirs["B"]
+        dA.queue.add(queue_A)
+        dB.queue.add(queue_B)
+        if phase is self._phase:
+            self._phase_steps += 1
+        else:
+            if self._phase_steps:
+                self.phases[self._phase.name].add(self._phase_steps * self.dt)
+            self._phase = phase
+            self._phase_steps = 1
+        self._window_steps += 1
+        if self._window_steps == self._steps_per_window:
+            self._window_steps = 0
+            for d in (dA, dB):
+                d.per_window.add(d._window_count)
+                d._window_count = 0
+
+    # Resultados y combinación
+    def report(self) -> Dict[str, Any]:
+        elapsed = self.steps * self.dt
+        out: Dict[str, Any] = {"steps": self.steps, "sim_time": elapsed, "free_flow_s": self.free_flow,
+                               "window_s": self.window}
+        for name, d in self.directions.items():
+            queue = _hist_summary(d.queue)
+            window = _hist_summary(d.per_window)
+            out[name] = {
+                "exited": d.exited,
+                "throughput_per_h": d.exited * 3600.0 / elapsed if elapsed else 0.0,
+                "travel_time": d.travel.summary(),
+                "delay": d.delay.summary(),
+                "stops": d.stops.summary(),
+                "queue": queue,
+                "exits_per_window": window,
+            }
+        out["phases"] = {name: s.summary() for name, s in self.phases.items() if s.acc.n}
+        return out
+
+    def merge(self, other: "Metrics"):
+        if other.dt != self.dt or other.window != self.window:
+            raise ValueError("solo se combinan métricas con el mismo dt y la misma ventana")
+        for name, d in self.directions.items():
+            d.merge(other.directions[name])
+        for name, s in self.phases.items():
+            s.merge(other.phases[name])
+        self.steps += other.steps
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "window": self.window, "dt": self.dt, "free_flow": self.free_flow, "steps": self.steps,
+            "directions": {name: d.to_dict() for name, d in self.directions.items()},
+            "phases": {name: s.to_dict() for name, s in self.phases.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Metrics":
+        m = cls(window=d["window"], free_flow=d["free_flow"], dt=d["dt"])
+        m.steps = d["steps"]
+        m.directions = {name: DirectionMetrics.from_dict(v) for name, v in d["directions"].items()}
+        m.phases = {name: Stat.from_dict(v) for name, v in d["phases"].items()}
+        return m
+
+    @classmethod
+    def merged(cls, dicts: Iterable[Dict[str, Any]]) -> "Metrics":
+        total = None
+        for d in dicts:
+            m = cls.from_dict(d)
+            if total is None:
+                total = m
+            else:
+                total.merge(m)
+        if total is None:
+            raise ValueError("no hay métricas para combinar")
+        return total
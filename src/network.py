@@ -0,0 +1,473 @@
+"""
+Redes de intersecciones (corredores y grillas) con avance paralelo por particiones.
+
+Una grilla de rows x cols nodos, cada uno como el cruce de src/sim_core.py: un
+carril A (hacia el este), un carril B (hacia el sur) y su propio Controller
+(reglas 1–6). Las calles son de sentido único y sin giros: al pasar el corte, un
+vehículo del carril A del nodo (r, c) sigue en el carril A de (r, c + 1) y uno de
+B en el carril B de (r + 1, c); desde la última columna o fila sale de la red.
+Las llegadas de Poisson (lambda_a, lambda_b) entran solo por el borde oeste (A) y
+el norte (B). Con rows=1 es un corredor arterial con sus calles transversales.
+
+Enlaces: cada conexión entre nodos es un búfer acotado de `buffer` vehículos. El
+nodo de arriba retira del carril solo tantos vehículos como lugares libres ve
+(Lane.remove_completed con limit); para los demás el corte es un obstáculo, como
+la línea en rojo (Lane.step con hold_at): paran a safe_gap de él y la cola crece
+hacia atrás, hasta el cruce y más allá (spillback). El de abajo
+los hace entrar en x = -road_length, en orden, cuando hay lugar (Lane.enter). Los
+vehículos conservan su hora de entrada a la red y sus detenciones.
+
+Particiones: la grilla se corta en franjas de columnas (de filas, si hay más
+filas) y cada franja corre en su proceso. Los enlaces se sincronizan cada
+`sync_every` pasos: lo que entra a un búfer se ve aguas abajo recién en la
+sincronización siguiente, y lo mismo los lugares liberados aguas arriba. La regla
+vale también para los enlaces internos de una partición, así que el resultado no
+depende de la cantidad de procesos (workers=1 da lo mismo que workers=8); sí
+depende de `sync_every`, que hace de demora del enlace. Entre sincronizaciones
+cada proceso avanza solo, y en cada una intercambia un mensaje con cada vecino
+(vehículos nuevos y lugares liberados de los enlaces de frontera).
+
+    python -m src.network --rows 10 --cols 20 --duration 3600 --workers 8
+    python -m src.network --rows 10 --cols 20 --duration 600 --scaling 1,2,4,8
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+import traceback
+from collections import deque
+from dataclasses import asdict, dataclass
+from multiprocessing.connection import wait
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from .controller import Controller
+from .metrics import Welford
+from .sim_core import SimConfig, controller_config, lane_class
+from .sweep import derive_seed
+
+DIRECTIONS = ("A", "B")
+
+
+@dataclass
+class NetworkConfig:
+    rows: int = 1
+    cols: int = 10
+    buffer: int = 8         # capacidad de cada enlace (vehículos)
+    sync_every: int = 5     # pasos entre sincronizaciones de los enlaces
+
+
+def downstream(net: NetworkConfig, idx: int, direction: str) -> Optional[int]:
+    """Nodo al que sigue el carril `direction` de `idx`; None si sale de la red."""
+    r, c = divmod(idx, net.cols)
+    if direction == "A":
+        return idx + 1 if c + 1 < net.cols else None
+    return idx + net.cols if r + 1 < net.rows else None
+
+
+def upstream(net: NetworkConfig, idx: int, direction: str) -> Optional[int]:
+    """Nodo del que viene el carril `direction` de `idx`; None si es un borde de entrada."""
+    r, c = divmod(idx, net.cols)
+    if direction == "A":
+        return idx - 1 if c > 0 else None
+    return idx - net.cols if r > 0 else None
+
+
+def partition(net: NetworkConfig, parts: int) -> List[int]:
+    """Partición de cada nodo: franjas parejas a lo largo del lado más largo de la grilla."""
+    if net.cols >= net.rows:
+        parts = max(1, min(parts, net.cols))
+        return [(idx % net.cols) * parts // net.cols for idx in range(net.rows * net.cols)]
+    parts = max(1, min(parts, net.rows))
+    return [(idx // net.cols) * parts // net.rows for idx in range(net.rows * net.cols)]
+
+
+class Link:
+    """
+    Búfer de un enlace. Del lado de arriba: `outgoing` (agregados desde la última
+    sincronización) e `in_flight` (ocupación que ve el de arriba). Del lado de
+    abajo: `queue` (visibles) y `consumed` (los que entraron desde la última
+    sincronización).
+    """
+    __slots__ = ("capacity", "queue", "consumed", "outgoing", "in_flight")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.queue: Deque[Tuple[float, int]] = deque()   # (entered_at, stops)
+        self.consumed = 0
+        self.outgoing: List[Tuple[float, int]] = []
+        self.in_flight = 0
+
+    def push(self, entered_at: float, stops: int):
+        self.outgoing.append((entered_at, stops))
+        self.in_flight += 1
+
+    def sync_local(self):
+        self.queue.extend(self.outgoing)
+        self.outgoing = []
+        self.in_flight -= self.consumed
+        self.consumed = 0
+
+
+class Node:
+    """Un cruce de la red: dos carriles, controlador y enlaces de entrada y salida."""
+
+    def __init__(self, net: NetworkConfig, cfg: SimConfig, idx: int):
+        self.idx = idx
+        lane_cls = lane_class(cfg.lane_backend)
+        self.lanes = {}
+        for direction in DIRECTIONS:
+            lane = lane_cls(direction, cfg.road_length, cfg.v_max, cfg.safe_gap, cfg.p_block, cfg.t_block,
+                            seed=derive_seed(cfg.seed, "node", idx, direction),
+                            streams=cfg.rng_streams, antithetic=cfg.antithetic)
+            lane.set_sensors(cfg.d_detect, cfg.r_close, cfg.e_after)
+            self.lanes[direction] = lane
+        self.lane_A, self.lane_B = self.lanes["A"], self.lanes["B"]
+        self.ctrl = Controller(controller_config(cfg))
+        self.inputs: Dict[str, Optional[Link]] = dict.fromkeys(DIRECTIONS)    # None: llegadas externas
+        self.outputs: Dict[str, Optional[Link]] = dict.fromkeys(DIRECTIONS)   # None: sale de la red
+        self.passed = dict.fromkeys(DIRECTIONS, 0)
+        self.travel = Welford()   # tiempo en la red de los que salen por este nodo
+        self.stops = Welford()
+        self.past_cutoff = 0.0    # cuánto llegó a pasar del corte el de más adelante (tras las salidas)
+        self._t_end = 0.0
+
+    def step(self, cfg: SimConfig, now: float, cutoff: float):
+        dt = cfg.dt
+        lane_A, lane_B = self.lane_A, self.lane_B
+
+        # Llegadas: externas en el borde, del búfer del enlace en el interior
+        for direction, rate in (("A", cfg.lambda_a), ("B", cfg.lambda_b)):
+            link = self.inputs[direction]
+            lane = self.lanes[direction]
+            if link is None:
+                lane.spawn(rate, dt, now)
+                continue
+            queue = link.queue
+            while queue and lane.enter(now, *queue[0]):
+                queue.popleft()
+                link.consumed += 1
+
+        readings_A = lane_A.read_sensors(cfg.d_detect, cfg.r_close, cfg.e_after)
+        readings_B = lane_B.read_sensors(cfg.d_detect, cfg.r_close, cfg.e_after)
+        self.ctrl.step_readings(dt, readings_A, readings_B)
+
+        green_A = self.ctrl.is_green(True)
+        green_B = self.ctrl.is_green(False)
+        if green_A:
+            lane_A.maybe_induce_block(cfg.e_after)
+        if green_B:
+            lane_B.maybe_induce_block(cfg.e_after)
+        # Con el enlace de salida lleno, el corte es un obstáculo: los que no tienen
+        # lugar paran antes y la cola se extiende hacia el cruce
+        for lane, green in ((lane_A, green_A), (lane_B, green_B)):
+            link = self.outputs[lane.name]
+            if link is None:
+                lane.step(dt, green)
+            else:
+                lane.step(dt, green, cutoff, link.capacity - link.in_flight)
+
+        self._t_end = now + dt
+        for direction in DIRECTIONS:
+            link = self.outputs[direction]
+            lane = self.lanes[direction]
+            if link is None:
+                self.passed[direction] += lane.remove_completed(cutoff, self._exit)
+            else:
+                self.passed[direction] += lane.remove_completed(cutoff, link.push, link.capacity - link.in_flight)
+            past = lane.front_x() - cutoff
+            if past > self.past_cutoff:
+                self.past_cutoff = past
+
+    def _exit(self, entered_at: float, stops: int):
+        self.travel.add(self._t_end - entered_at)
+        self.stops.add(stops)
+
+    def entered(self) -> int:
+        """Llegadas externas admitidas (carriles sin enlace de entrada)."""
+        return sum(self.lanes[d].next_vid - 1 for d in DIRECTIONS if self.inputs[d] is None)
+
+    def vehicles(self) -> int:
+        """Vehículos en los carriles de este nodo más los que esperan en sus búferes de entrada."""
+        n = sum(len(lane.snapshot_vehicles()["x"]) for lane in self.lanes.values())
+        return n + sum(len(link.queue) for link in self.inputs.values() if link is not None)
+
+
+class Partition:
+    """Los nodos de una partición y sus enlaces; `run` avanza y sincroniza con las vecinas."""
+
+    def __init__(self, net: NetworkConfig, cfg: SimConfig, part: int, owner: List[int]):
+        self.net = net
+        self.cfg = cfg
+        self.part = part
+        self.time = 0.0
+        self.cutoff = cfg.e_after + cfg.intersection_len + 25.0   # como Simulation._cutoff
+        self.nodes = [Node(net, cfg, idx) for idx in range(len(owner)) if owner[idx] == part]
+        links: Dict[Tuple[int, str], Link] = {}
+        self.internal: List[Link] = []
+        self.send_to: Dict[int, List[Tuple[int, str]]] = {}   # vecina -> enlaces que salen hacia ella
+        self.ack_to: Dict[int, List[Tuple[int, str]]] = {}    # vecina -> enlaces que llegan desde ella
+        for node in self.nodes:
+            for direction in DIRECTIONS:
+                down = downstream(net, node.idx, direction)
+                if down is not None:
+                    key = (node.idx, direction)
+                    link = links.setdefault(key, Link(net.buffer))
+                    node.outputs[direction] = link
+                    if owner[down] == part:
+                        self.internal.append(link)
+                    else:
+                        self.send_to.setdefault(owner[down], []).append(key)
+                up = upstream(net, node.idx, direction)
+                if up is not None:
+                    key = (up, direction)
+                    node.inputs[direction] = links.setdefault(key, Link(net.buffer))
+                    if owner[up] != part:
+                        self.ack_to.setdefault(owner[up], []).append(key)
+        self.links = links
+        self.neighbors = sorted(set(self.send_to) | set(self.ack_to))
+
+    def step(self):
+        for node in self.nodes:
+            node.step(self.cfg, self.time, self.cutoff)
+        self.time += self.cfg.dt
+
+    def outbox(self) -> Dict[int, tuple]:
+        """Por vecina: (vehículos nuevos por enlace, lugares liberados por enlace)."""
+        out = {}
+        for n in self.neighbors:
+            vehicles = []
+            for key in self.send_to.get(n, ()):
+                link = self.links[key]
+                vehicles.append((key, link.outgoing))
+                link.outgoing = []
+            acks = []
+            for key in self.ack_to.get(n, ()):
+                link = self.links[key]
+                acks.append((key, link.consumed))
+                link.consumed = 0
+            out[n] = (vehicles, acks)
+        return out
+
+    def sync(self, received: Dict[int, tuple]):
+        for link in self.internal:
+            link.sync_local()
+        for n in sorted(received):
+            vehicles, acks = received[n]
+            for key, items in vehicles:
+                self.links[key].queue.extend(items)
+            for key, count in acks:
+                self.links[key].in_flight -= count
+
+    def run(self, steps: int, exchange: Optional[Callable[[Dict[int, tuple]], Dict[int, tuple]]] = None):
+        done = 0
+        while done < steps:
+            k = min(self.net.sync_every, steps - done)
+            for _ in range(k):
+                self.step()
+            done += k
+            outbox = self.outbox()
+            self.sync(exchange(outbox) if self.neighbors else {})
+
+    def result(self) -> Dict[int, Dict[str, Any]]:
+        return {node.idx: {
+            "passed_A": node.passed["A"], "passed_B": node.passed["B"], "switches": node.ctrl.switches,
+            "entered": node.entered(), "vehicles": node.vehicles(), "travel": node.travel, "stops": node.stops,
+            "past_cutoff": node.past_cutoff,
+        } for node in self.nodes}
+
+
+def _worker(net: NetworkConfig, cfg: SimConfig, part: int, owner: List[int], steps: int,
+            conns: Dict[int, Any], result_conn):
+    try:
+        p = Partition(net, cfg, part, owner)
+
+        def exchange(outbox):
+            # Las vecinas son franjas contiguas, de paridad distinta: las pares envían
+            # y después reciben, las impares al revés. Si las dos enviaran primero, con
+            # mensajes más grandes que el búfer del Pipe ambas quedarían trabadas en send
+            if part % 2 == 0:
+                for n, msg in outbox.items():
+                    conns[n].send(msg)
+                return {n: conns[n].recv() for n in outbox}
+            received = {n: conns[n].recv() for n in outbox}
+            for n, msg in outbox.items():
+                conns[n].send(msg)
+            return received
+
+        p.run(steps, exchange)
+        result_conn.send(("ok", p.result()))
+    except BaseException:
+        result_conn.send(("error", traceback.format_exc()))
+    finally:
+        result_conn.close()
+
+
+def _run_parallel(net: NetworkConfig, cfg: SimConfig, owner: List[int], steps: int) -> Dict[int, Dict[str, Any]]:
+    parts = max(owner) + 1
+    # Un Pipe por par de particiones vecinas (franjas: la anterior y la siguiente)
+    pairs = {}
+    for idx in range(len(owner)):
+        for direction in DIRECTIONS:
+            down = downstream(net, idx, direction)
+            if down is not None and owner[down] != owner[idx]:
+                pairs.setdefault(tuple(sorted((owner[idx], owner[down]))), None)
+    ctx = multiprocessing.get_context()
+    conns: List[Dict[int, Any]] = [{} for _ in range(parts)]
+    for a, b in pairs:
+        conns[a][b], conns[b][a] = ctx.Pipe(duplex=True)
+    procs, results = [], []
+    for part in range(parts):
+        recv_end, send_end = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_worker, args=(net, cfg, part, owner, steps, conns[part], send_end),
+                           name=f"red-{part}", daemon=True)
+        proc.start()
+        send_end.close()
+        procs.append(proc)
+        results.append(recv_end)
+    for d in conns:
+        for c in d.values():
+            c.close()
+
+    merged: Dict[int, Dict[str, Any]] = {}
+    pending = {r: part for part, r in enumerate(results)}
+    try:
+        while pending:
+            for r in wait(list(pending)):
+                part = pending.pop(r)
+                try:
+                    status, payload = r.recv()
+                except EOFError:
+                    raise RuntimeError(f"la partición {part} terminó sin resultado "
+                                       f"(código {procs[part].exitcode})")
+                if status != "ok":
+                    raise RuntimeError(f"error en la partición {part}:\n{payload}")
+                merged.update(payload)
+    finally:
+        for proc in procs:
+            if pending:
+                proc.terminate()
+            proc.join()
+    return merged
+
+
+def run_network(net: NetworkConfig, cfg: SimConfig, duration: Optional[float] = None,
+                workers: int = 1) -> Dict[str, Any]:
+    """Corre la red `duration` s (por defecto cfg.duration) en `workers` procesos y resume."""
+    if net.rows < 1 or net.cols < 1 or net.buffer < 1 or net.sync_every < 1:
+        raise ValueError("se necesita rows, cols, buffer y sync_every >= 1")
+    if cfg.arrivals != "knuth" or cfg.time_advance != "fixed":
+        raise ValueError("la red usa llegadas \"knuth\" y paso fijo (time_advance=\"fixed\")")
+    if cfg.integrator != "euler":
+        raise ValueError("la red solo admite integrator=\"euler\"")
+    lane_class(cfg.lane_backend)
+    duration = cfg.duration if duration is None else duration
+    steps = int(duration / cfg.dt)
+    owner = partition(net, workers)
+    parts = max(owner) + 1
+    t0 = time.perf_counter()
+    if parts == 1:
+        p = Partition(net, cfg, 0, owner)
+        p.run(steps)
+        per_node = p.result()
+    else:
+        per_node = _run_parallel(net, cfg, owner, steps)
+    wall = time.perf_counter() - t0
+
+    # Se combina en orden de nodo: el resumen es el mismo con cualquier partición
+    n_nodes = net.rows * net.cols
+    travel, stops = Welford(), Welford()
+    for idx in range(n_nodes):
+        travel.merge(per_node[idx]["travel"])
+        stops.merge(per_node[idx]["stops"])
+    hours = steps * cfg.dt / 3600.0
+    switches = [per_node[idx]["switches"] for idx in range(n_nodes)]
+    return {
+        "network": asdict(net),
+        "nodes": n_nodes,
+        "partitions": parts,
+        "steps": steps,
+        "sim_time": steps * cfg.dt,
+        "entered": sum(per_node[idx]["entered"] for idx in range(n_nodes)),
+        "exited": travel.n,
+        "in_network": sum(per_node[idx]["vehicles"] for idx in range(n_nodes)),
+        "travel_time": travel.summary(),
+        "stops": stops.summary(),
+        "switches_per_node_hour": sum(switches) / n_nodes / hours if hours > 0 else 0.0,
+        "max_past_cutoff": max(per_node[idx]["past_cutoff"] for idx in range(n_nodes)),
+        "per_node": {
+            "passed_A": [per_node[idx]["passed_A"] for idx in range(n_nodes)],
+            "passed_B": [per_node[idx]["passed_B"] for idx in range(n_nodes)],
+            "switches": switches,
+        },
+        "wall_s": wall,
+        "node_steps_per_s": n_nodes * steps / wall if wall > 0 else float("inf"),
+    }
+
+
+def check(result: Dict[str, Any], cfg: SimConfig) -> List[str]:
+    """
+    Conservación (entradas = salidas + vehículos en la red) y spillback: ningún
+    vehículo pasa del corte más de safe_gap sin lugar en el enlace de salida.
+    """
+    problems = []
+    if result["entered"] != result["exited"] + result["in_network"]:
+        problems.append(f"entraron {result['entered']}, salieron {result['exited']} "
+                        f"y quedan {result['in_network']}")
+    if result["max_past_cutoff"] > cfg.safe_gap:
+        problems.append(f"un vehículo pasó {result['max_past_cutoff']:.1f} m del corte (máximo {cfg.safe_gap:g})")
+    return problems
+
+
+def _same_result(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    keys = ("entered", "exited", "in_network", "travel_time", "stops", "per_node")
+    return all(a[k] == b[k] for k in keys)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    from .run import add_config_args, config_from_args
+    p = argparse.ArgumentParser(prog="python -m src.network",
+                                description="Corredores y grillas de cruces auto-organizados, en paralelo.")
+    p.add_argument("--config", help="archivo JSON o TOML con parámetros de SimConfig (comunes a todos los nodos)")
+    p.add_argument("--rows", type=int, default=1, help="filas de la grilla (1: corredor)")
+    p.add_argument("--cols", type=int, default=10, help="columnas de la grilla")
+    p.add_argument("--buffer", type=int, default=8, help="capacidad de cada enlace (vehículos)")
+    p.add_argument("--sync-every", type=int, default=5, help="pasos entre sincronizaciones de enlaces")
+    p.add_argument("--workers", type=int, default=1, help="procesos (una franja de la grilla cada uno)")
+    p.add_argument("--scaling", default=None, metavar="1,2,4",
+                   help="correr con cada cantidad de procesos, comprobar que den lo mismo y reportar la aceleración")
+    p.add_argument("--indent", type=int, default=None, help="indentación del JSON de salida")
+    add_config_args(p)
+    args = p.parse_args(argv)
+    try:
+        cfg = config_from_args(args)
+        net = NetworkConfig(rows=args.rows, cols=args.cols, buffer=args.buffer, sync_every=args.sync_every)
+        if args.scaling:
+            counts = [int(s) for s in args.scaling.split(",") if s.strip()]
+            runs = [run_network(net, cfg, workers=w) for w in counts]
+            base = runs[0]
+            rows = [{"workers": w, "partitions": r["partitions"], "wall_s": r["wall_s"],
+                     "speedup": base["wall_s"] / r["wall_s"], "same_result": _same_result(base, r)}
+                    for w, r in zip(counts, runs)]
+            print(json.dumps({"network": asdict(net), "steps": base["steps"], "runs": rows}, indent=args.indent))
+            for row in rows:
+                print(f"{row['workers']:>3} procesos: {row['wall_s']:8.2f} s  x{row['speedup']:.2f}"
+                      + ("" if row["same_result"] else "  (resultado distinto)"), file=sys.stderr)
+            problems = check(base, cfg)
+            for problem in problems:
+                print(f"falla: {problem}", file=sys.stderr)
+            return 0 if all(row["same_result"] for row in rows) and not problems else 1
+        result = run_network(net, cfg, workers=args.workers)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(result, indent=args.indent))
+    print(f"{result['node_steps_per_s']:.0f} pasos-nodo/s", file=sys.stderr)
+    problems = check(result, cfg)
+    for problem in problems:
+        print(f"falla: {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
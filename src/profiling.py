@@ -0,0 +1,218 @@
+"""
+Cronometraje por etapa de Simulation.step_once, sin cProfile.
+
+    sim = Simulation(cfg)
+    prof = StageProfiler().attach(sim)
+    sim.run_for(cfg.duration)
+    prof.detach()
+    print(format_report(prof.report()))
+
+Con sim.profiler = None (lo normal) step_once solo paga una comparación por etapa.
+Con un perfilador enganchado, step_once llama a begin() al empezar el paso, a
+lap(i) al terminar cada etapa (las tres últimas desde _move) y a end() al final,
+así que lo que se mide es el paso real y no una copia:
+
+- arrivals: llegadas (spawn) de ambos carriles
+- sensors: lecturas de los detectores (las ocho consultas, fusionadas en una
+  read_sensors por carril)
+- controller: Controller.step
+- induce_block: maybe_induce_block del carril en verde
+- lane_step: Lane.step de ambos carriles (movimiento y reordenamiento)
+- remove_completed: salidas
+
+Contadores: vehículos procesados por Lane.step, reordenamientos y sorteos del RNG
+(se cuentan envolviendo random() de cada generador; la secuencia no cambia). El
+tiempo por etapa también se acumula por densidad (vehículos en el sistema, en
+tramos de potencias de 2) para ver qué etapa domina a medida que crece.
+
+En modo "event" los tramos saltados no pasan por step_once: advance() llama a
+jump() con el tiempo de cada parte del salto (planificación y lecturas como
+sensors, el controlador paso a paso como controller y Lane.cruise como
+lane_step). "steps" cuenta los pasos completos, "jumped_steps" los saltados, y
+los promedios por paso se toman sobre ambos (pasos simulados).
+"""
+import time
+from typing import Any, Dict, List
+
+STAGES = ("arrivals", "sensors", "controller", "induce_block", "lane_step", "remove_completed")
+
+_NAMES = {
+    "arrivals": "llegadas",
+    "sensors": "sensores",
+    "controller": "control",
+    "induce_block": "bloqueos",
+    "lane_step": "movimiento",
+    "remove_completed": "salidas",
+}
+
+
+def _count(lane) -> int:
+    return lane.n if hasattr(lane, "n") else len(lane.vehicles)
+
+
+class StageProfiler:
+    def __init__(self, clock=time.perf_counter_ns):
+        self.clock = clock
+        self.sim = None
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.jumped = 0     # pasos avanzados por saltos del modo "event"
+        self.ns = [0] * len(STAGES)
+        self.vehicles = 0   # vehículos procesados por Lane.step
+        self.sorts = 0      # pasos de carril con reordenamiento
+        self.rng_draws = 0
+        self.arrivals = 0
+        # densidad (bit_length de los vehículos en el sistema) -> [pasos, ns por etapa...]
+        self.by_density: Dict[int, List[int]] = {}
+
+    # Enganche
+    def attach(self, sim):
+        if getattr(sim, "profiler", None) is not None:
+            raise ValueError("la simulación ya tiene un perfilador")
+        self.sim = sim
+        for rng in self._rngs(sim):
+            rng.random = self._counting(rng.random)
+        sim.profiler = self
+        return self
+
+    def detach(self):
+        sim = self.sim
+        if sim is None:
+            return
+        if sim.profiler is self:
+            sim.profiler = None
+        for rng in self._rngs(sim):
+            if "random" in vars(rng):
+                del rng.random
+        self.sim = None
+
+    @staticmethod
+    def _rngs(sim):
+        rngs = [sim.rng]
+        for lane in (sim.lane_A, sim.lane_B):
+            rngs.append(lane.rng)
+            if lane.block_rng is not lane.rng:
+                rngs.append(lane.block_rng)
+        return rngs
+
+    def _counting(self, draw):
+        def random():
+            self.rng_draws += 1
+            return draw()
+        return random
+
+    # Marcas del paso (las llama Simulation.step_once)
+    def begin(self, sim):
+        lane_A, lane_B = sim.lane_A, sim.lane_B
+        self._vid0 = lane_A.next_vid + lane_B.next_vid
+        self._sorts0 = lane_A.resorts + lane_B.resorts
+        self._completed0 = sim.completed_A + sim.completed_B
+        self._laps = [0] * len(STAGES)
+        self._t = self.clock()
+
+    def lap(self, stage: int):
+        now = self.clock()
+        self._laps[stage] = now - self._t
+        self._t = now
+
+    def end(self, sim):
+        lane_A, lane_B = sim.lane_A, sim.lane_B
+        # Vehículos que movió Lane.step: los que quedan más los que salieron en el paso
+        n = _count(lane_A) + _count(lane_B) + sim.completed_A + sim.completed_B - self._completed0
+        ns = self.ns
+        row = self.by_density.get(n.bit_length())
+        if row is None:
+            row = self.by_density[n.bit_length()] = [0] * (len(STAGES) + 1)
+        row[0] += 1
+        for i, lap in enumerate(self._laps):
+            ns[i] += lap
+            row[i + 1] += lap
+        self.steps += 1
+        self.vehicles += n
+        self.sorts += lane_A.resorts + lane_B.resorts - self._sorts0
+        self.arrivals += lane_A.next_vid + lane_B.next_vid - self._vid0
+
+    def jump(self, sim, steps: int, sensors_ns: int, controller_ns: int, lane_ns: int):
+        """Un salto del modo "event" (Simulation.advance): steps pasos sin step_once."""
+        n = _count(sim.lane_A) + _count(sim.lane_B)
+        ns = self.ns
+        row = self.by_density.get(n.bit_length())
+        if row is None:
+            row = self.by_density[n.bit_length()] = [0] * (len(STAGES) + 1)
+        row[0] += steps
+        for i, lap in ((1, sensors_ns), (2, controller_ns), (4, lane_ns)):
+            ns[i] += lap
+            row[i + 1] += lap
+        self.jumped += steps
+        self.vehicles += n * steps
+
+    # Resultados
+    def report(self) -> Dict[str, Any]:
+        steps = max(self.steps + self.jumped, 1)
+        total = sum(self.ns) or 1
+        stages = {
+            name: {"total_s": ns / 1e9, "us_per_step": ns / steps / 1e3, "share": ns / total}
+            for name, ns in zip(STAGES, self.ns)
+        }
+        density = []
+        for b in sorted(self.by_density):
+            count, *ns = self.by_density[b]
+            lo, hi = (0, 0) if b == 0 else (1 << (b - 1), (1 << b) - 1)
+            density.append({
+                "vehicles": [lo, hi],
+                "steps": count,
+                "us_per_step": {name: v / count / 1e3 for name, v in zip(STAGES, ns)},
+            })
+        return {
+            "steps": self.steps,
+            "jumped_steps": self.jumped,
+            "us_per_step": total / steps / 1e3 if self.steps or self.jumped else 0.0,
+            "stages": stages,
+            "counters": {
+                "vehicles_processed": self.vehicles,
+                "vehicles_per_step": self.vehicles / steps,
+                "arrivals": self.arrivals,
+                "sorts": self.sorts,
+                "rng_draws": self.rng_draws,
+                "rng_draws_per_step": self.rng_draws / steps,
+            },
+            "by_density": density,
+        }
+
+    def overlay_lines(self) -> List[str]:
+        """Resumen corto para el HUD de app.py."""
+        if not self.steps and not self.jumped:
+            return ["perfil: midiendo..."]
+        steps = self.steps + self.jumped
+        total = sum(self.ns) or 1
+        parts = [f"{_NAMES[name]} {100.0 * ns / total:.0f}%" for name, ns in zip(STAGES, self.ns)]
+        return [
+            f"perfil ({total / steps / 1e3:.1f} us/paso): " + "  ".join(parts),
+            f"veh/paso={self.vehicles / steps:.1f}  reordenamientos={self.sorts}  "
+            f"sorteos RNG/paso={self.rng_draws / steps:.2f}  pasos medidos={self.steps}"
+            + (f"  saltados={self.jumped}" if self.jumped else ""),
+        ]
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Tabla de texto del reporte (para stderr)."""
+    lines = [f"{'etapa':<18}{'us/paso':>10}{'%':>7}"]
+    for name, st in report["stages"].items():
+        lines.append(f"{name:<18}{st['us_per_step']:>10.2f}{100.0 * st['share']:>7.1f}")
+    lines.append(f"{'total':<18}{report['us_per_step']:>10.2f}")
+    c = report["counters"]
+    jumped = report.get("jumped_steps", 0)
+    lines.append(f"pasos={report['steps']}" + (f"  saltados={jumped}" if jumped else "")
+                 + f"  veh/paso={c['vehicles_per_step']:.1f}  "
+                 f"reordenamientos={c['sorts']}  sorteos RNG/paso={c['rng_draws_per_step']:.2f}")
+    if report["by_density"]:
+        lines.append("us/paso por densidad (vehículos en el sistema):")
+        head = "".join(f"{name:>17}" for name in STAGES)
+        lines.append(f"{'vehículos':<12}{'pasos':>9}{head}")
+        for row in report["by_density"]:
+            lo, hi = row["vehicles"]
+            cells = "".join(f"{row['us_per_step'][name]:>17.2f}" for name in STAGES)
+            lines.append(f"{f'{lo}-{hi}':<12}{row['steps']:>9}{cells}")
+    return "\n".join(lines)
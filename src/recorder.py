@@ -0,0 +1,273 @@
+"""
+Registro de trayectorias en disco, opcional y por flujos.
+
+    sim = Simulation(cfg)
+    with Recorder(sim, "corrida/", vehicle_every=5):
+        sim.run_for(cfg.duration)
+    rec = open_recording("corrida/")
+    rec.ctrl["phase"], rec.vehicles["x"], rec.frames["start"]
+
+Cada paso de Simulation.step_once agrega una fila a cada flujo en búferes de
+tamaño fijo (arreglos de NumPy); al llenarse se vuelcan en bloque, una columna por
+archivo crudo (sin encabezado) que solo crece. meta.json guarda los tipos y las
+filas de cada columna (se reescribe, atómicamente, en cada volcado), así que se
+leen con numpy.memmap sin interpretar nada. Al abrir un registro las filas se
+deducen del tamaño de los archivos: una corrida interrumpida (kill, caída) se lee
+hasta el último volcado aunque meta.json haya quedado atrás.
+
+Flujos:
+- ctrl: un registro por paso (fase, temporizadores, contadores y lecturas).
+- vehicles: (lane, vid, x, v, stopped_for) de todos los vehículos, cada
+  `vehicle_every` pasos.
+- frames: índice de vehicles; por cada paso registrado, su primera fila y cuántas.
+"""
+import json
+import os
+from dataclasses import asdict
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from .controller import Phase
+
+FORMAT_VERSION = 1
+PHASES = list(Phase)
+_PHASE_CODE = {p: i for i, p in enumerate(PHASES)}
+
+_READING_COLUMNS = (("count_d", "i4"), ("count_r", "i4"), ("any_d", "u1"), ("blocked", "u1"), ("upstream", "i4"))
+
+STREAMS: Dict[str, Dict[str, str]] = {
+    "ctrl": dict(
+        [("step", "i8"), ("time", "f8"), ("phase", "u1"), ("t_in_phase", "f8"),
+         ("red_counter_A", "f8"), ("red_counter_B", "f8"), ("switches", "i4"),
+         ("completed_A", "i4"), ("completed_B", "i4")]
+        + [(f"{name}_{lane}", dt) for lane in "AB" for name, dt in _READING_COLUMNS]
+    ),
+    "vehicles": {"lane": "u1", "vid": "i8", "x": "f8", "v": "f8", "stopped_for": "f8"},
+    "frames": {"step": "i8", "time": "f8", "start": "i8", "count": "i4"},
+}
+
+
+class _ColumnBuffer:
+    """Búfer de tamaño fijo para un flujo; vuelca todas sus columnas juntas al llenarse."""
+    def __init__(self, directory: str, stream: str, columns: Dict[str, str], capacity: int,
+                 on_flush: Optional[Callable[[], None]] = None):
+        self.columns = columns
+        self.on_flush = on_flush  # tras cada volcado automático (búfer lleno)
+        self.capacity = capacity
+        self.n = 0
+        self.rows = 0  # filas ya escritas en disco
+        self.data = {name: np.empty(capacity, dtype=dt) for name, dt in columns.items()}
+        self.files = {name: open(os.path.join(directory, f"{stream}.{name}.bin"), "wb") for name in columns}
+
+    def row(self):
+        """Índice libre para una fila (vuelca antes si el búfer está lleno)."""
+        if self.n == self.capacity:
+            self._spill()
+        i = self.n
+        self.n += 1
+        return i
+
+    def extend(self, count: int, values: Dict[str, object]):
+        """Agrega `count` filas; values[col] es un escalar o un arreglo de largo count."""
+        start = 0
+        while start < count:
+            if self.n == self.capacity:
+                self._spill()
+            k = min(count - start, self.capacity - self.n)
+            for name, val in values.items():
+                col = self.data[name]
+                if isinstance(val, np.ndarray):
+                    col[self.n:self.n + k] = val[start:start + k]
+                else:
+                    col[self.n:self.n + k] = val
+            self.n += k
+            start += k
+
+    def _spill(self):
+        self.flush()
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def flush(self):
+        if not self.n:
+            return
+        for name, fh in self.files.items():
+            self.data[name][:self.n].tofile(fh)
+            fh.flush()
+        self.rows += self.n
+        self.n = 0
+
+    def close(self):
+        self.flush()
+        for fh in self.files.values():
+            fh.close()
+
+
+def _lane_columns(lane):
+    """(vid, x, v, stopped_for) del carril como arreglos."""
+    if hasattr(lane, "n"):  # ArrayLane
+        n = lane.n
+        return lane.vid[:n], lane.x[:n], lane.v[:n], lane.stopped_for[:n]
+    rows = np.array([(v.vid, v.x, v.v, v.stopped_for) for v in lane.vehicles], dtype=float).reshape(-1, 4)
+    return rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+
+
+class Recorder:
+    """
+    Se engancha en sim.recorder; Simulation.step_once llama a record() al final de
+    cada paso. Con un registrador activo el modo "event" avanza paso a paso.
+    """
+    def __init__(self, sim, directory: str, vehicle_every: int = 1, buffer_rows: int = 65536):
+        if vehicle_every < 1:
+            raise ValueError("vehicle_every debe ser >= 1")
+        os.makedirs(directory, exist_ok=True)
+        self.sim = sim
+        self.directory = directory
+        self.vehicle_every = vehicle_every
+        self.steps = 0
+        # Las filas de ctrl y frames son pocas por paso; vehicles, muchas
+        small = max(1024, buffer_rows // 16)
+        self.streams = {}
+        for name, capacity in (("ctrl", small), ("vehicles", buffer_rows), ("frames", small)):
+            self.streams[name] = _ColumnBuffer(directory, name, STREAMS[name], capacity, self._write_meta)
+        self._closed = False
+        sim.recorder = self
+        self._write_meta()
+
+    def record(self, sim):
+        step = self.steps
+        self.steps += 1
+        ctrl = sim.ctrl
+        buf = self.streams["ctrl"]
+        i = buf.row()
+        d = buf.data
+        d["step"][i] = step
+        d["time"][i] = sim.time
+        d["phase"][i] = _PHASE_CODE[ctrl.phase]
+        d["t_in_phase"][i] = ctrl.t_in_phase
+        d["red_counter_A"][i] = ctrl.red_counter_A
+        d["red_counter_B"][i] = ctrl.red_counter_B
+        d["switches"][i] = ctrl.switches
+        d["completed_A"][i] = sim.completed_A
+        d["completed_B"][i] = sim.completed_B
+        for lane, reading in (("A", sim.readings_A), ("B", sim.readings_B)):
+            for (name, _), value in zip(_READING_COLUMNS, reading):
+                d[f"{name}_{lane}"][i] = value
+
+        if step % self.vehicle_every:
+            return
+        vbuf = self.streams["vehicles"]
+        start = vbuf.rows + vbuf.n
+        count = 0
+        for code, lane in enumerate((sim.lane_A, sim.lane_B)):
+            vid, x, v, sf = _lane_columns(lane)
+            k = len(x)
+            if k:
+                vbuf.extend(k, {"lane": code, "vid": vid, "x": x, "v": v, "stopped_for": sf})
+                count += k
+        fbuf = self.streams["frames"]
+        j = fbuf.row()
+        f = fbuf.data
+        f["step"][j] = step
+        f["time"][j] = sim.time
+        f["start"][j] = start
+        f["count"][j] = count
+
+    def flush(self):
+        for buf in self.streams.values():
+            buf.flush()
+        self._write_meta()
+
+    def close(self):
+        if self._closed:
+            return
+        for buf in self.streams.values():
+            buf.close()
+        self._write_meta()
+        self._closed = True
+        if self.sim.recorder is self:
+            self.sim.recorder = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_meta(self):
+        meta = {
+            "version": FORMAT_VERSION,
+            "config": asdict(self.sim.cfg),
+            "vehicle_every": self.vehicle_every,
+            "phases": [p.name for p in PHASES],
+            "lanes": ["A", "B"],
+            "streams": {name: {"columns": STREAMS[name], "rows": buf.rows}
+                        for name, buf in self.streams.items()},
+        }
+        tmp = os.path.join(self.directory, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, indent=1)
+        os.replace(tmp, os.path.join(self.directory, "meta.json"))
+
+
+class Recording:
+    """
+    Lectura de un registro: cada flujo es un dict columna -> numpy.memmap (solo lectura).
+    Las filas de cada flujo son las que están completas en todas sus columnas según el
+    tamaño de los archivos, y se descartan los últimos cuadros cuyos vehículos no
+    llegaron a volcarse; sirve igual para un registro cerrado, en curso o interrumpido.
+    """
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as fh:
+            self.meta = json.load(fh)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"versión de registro no soportada: {self.meta.get('version')}")
+        self.directory = directory
+        for stream, info in self.meta["streams"].items():
+            dtypes = {name: np.dtype(dt) for name, dt in info["columns"].items()}
+            rows = min(self._rows_on_disk(stream, name, dtype) for name, dtype in dtypes.items())
+            if stream == "frames":
+                rows = self._complete_frames(rows)
+            setattr(self, stream, {name: self._map(stream, name, dtype, rows) for name, dtype in dtypes.items()})
+
+    def _path(self, stream: str, name: str) -> str:
+        return os.path.join(self.directory, f"{stream}.{name}.bin")
+
+    def _rows_on_disk(self, stream: str, name: str, dtype: np.dtype) -> int:
+        try:
+            return os.path.getsize(self._path(stream, name)) // dtype.itemsize
+        except OSError:
+            return 0
+
+    def _complete_frames(self, rows: int) -> int:
+        """Cuadros cuyas filas de vehículos están todas en disco (búsqueda binaria, sin leer todo)."""
+        if rows == 0:
+            return 0
+        vcols = self.meta["streams"]["vehicles"]["columns"]
+        vrows = min(self._rows_on_disk("vehicles", name, np.dtype(dt)) for name, dt in vcols.items())
+        start = self._map("frames", "start", np.dtype(STREAMS["frames"]["start"]), rows)
+        count = self._map("frames", "count", np.dtype(STREAMS["frames"]["count"]), rows)
+        k = int(np.searchsorted(start, vrows, side="right"))
+        while k > 0 and int(start[k - 1]) + int(count[k - 1]) > vrows:
+            k -= 1
+        return k
+
+    def _map(self, stream: str, name: str, dtype: np.dtype, rows: int):
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._path(stream, name), dtype=dtype, mode="r", shape=(rows,))
+
+    @property
+    def phases(self):
+        return [Phase[name] for name in self.meta["phases"]]
+
+    def frame(self, k: int) -> Dict[str, np.ndarray]:
+        """Vehículos del k-ésimo paso registrado (vistas sobre los memmap)."""
+        start = int(self.frames["start"][k])
+        end = start + int(self.frames["count"][k])
+        return {name: col[start:end] for name, col in self.vehicles.items()}
+
+
+def open_recording(directory: str) -> Recording:
+    return Recording(directory)
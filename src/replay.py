@@ -0,0 +1,153 @@
+"""
+Reproducción de un registro (src/recorder.py) para la ventana: `python app.py --replay DIR`.
+
+Los pasos se registran con dt fijo, así que el paso vigente en el instante t es
+(t - t0) / dt y su cuadro de vehículos, paso // vehicle_every; frames["start"] y
+frames["count"] dicen dónde están sus filas. Ir a cualquier instante cuesta lo
+mismo al principio que a las 72 h: se leen una fila de ctrl y las filas de dos
+cuadros (para interpolar) de los memmap, nunca el archivo entero.
+"""
+import time
+from dataclasses import fields
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .live import Snapshot, VehicleState, queue_count
+from .recorder import open_recording
+from .sim_core import SimConfig
+
+# Velocidades de reproducción (múltiplos del tiempo simulado por segundo de reloj)
+SPEEDS = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0)
+
+
+def parse_time(text: str) -> float:
+    """Segundos desde "5400", "1:30:00" o "90:00" (h:m:s o m:s)."""
+    parts = text.split(":")
+    if len(parts) > 3:
+        raise ValueError(f"instante inválido: {text!r}")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60.0 + float(part)
+    return seconds
+
+
+def format_time(t: float) -> str:
+    h, rest = divmod(int(t), 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}"
+
+
+class Replay:
+    """Acceso directo por instante a un registro; solo lee las filas que pide."""
+    def __init__(self, directory: str):
+        self.rec = open_recording(directory)
+        meta = self.rec.meta
+        known = {f.name for f in fields(SimConfig)}
+        self.cfg = SimConfig(**{k: v for k, v in meta["config"].items() if k in known})
+        self.dt = self.cfg.dt
+        self.vehicle_every = int(meta["vehicle_every"])
+        self.phases = self.rec.phases
+        self.steps = len(self.rec.ctrl["time"])
+        self.n_frames = len(self.rec.frames["time"])
+        if self.steps == 0 or self.n_frames == 0:
+            raise ValueError(f"registro vacío: {directory}")
+        # Instante del primer paso registrado (una corrida puede empezar desde un checkpoint)
+        self.t_start = float(self.rec.ctrl["time"][0])
+        # En un registro interrumpido los cuadros pueden terminar antes que ctrl
+        last_frame = float(self.rec.frames["time"][self.n_frames - 1]) + (self.vehicle_every - 1) * self.dt
+        self.t_end = min(float(self.rec.ctrl["time"][self.steps - 1]), last_frame)
+
+    def clamp(self, t: float) -> float:
+        return min(self.t_end, max(self.t_start, t))
+
+    def step_at(self, t: float) -> int:
+        """Último paso registrado con time <= t."""
+        k = int((t - self.t_start) / self.dt + 1e-6)
+        return min(self.steps - 1, max(0, k))
+
+    def frame_at(self, t: float) -> int:
+        """Último cuadro de vehículos con time <= t."""
+        return min(self.n_frames - 1, self.step_at(t) // self.vehicle_every)
+
+    def _vehicles(self, f: int) -> Tuple[Tuple[VehicleState, ...], Tuple[VehicleState, ...]]:
+        rows = self.rec.frame(f)
+        lane = np.asarray(rows["lane"])
+        out = []
+        for code in (0, 1):
+            sel = lane == code
+            out.append(tuple(zip(rows["vid"][sel].tolist(), rows["x"][sel].tolist(),
+                                 rows["stopped_for"][sel].tolist())))
+        return out[0], out[1]
+
+    def snapshot(self, t: float, sim_rate: float = 0.0) -> Snapshot:
+        """Instantánea del paso vigente en t, con los vehículos de su cuadro."""
+        k = self.step_at(t)
+        ctrl = self.rec.ctrl
+        vehicles_A, vehicles_B = self._vehicles(self.frame_at(t))
+        return Snapshot(
+            wall=time.perf_counter(),
+            steps=k + 1,
+            time=float(ctrl["time"][k]),
+            phase=self.phases[int(ctrl["phase"][k])],
+            t_in_phase=float(ctrl["t_in_phase"][k]),
+            red_counter_A=float(ctrl["red_counter_A"][k]),
+            red_counter_B=float(ctrl["red_counter_B"][k]),
+            switches=int(ctrl["switches"][k]),
+            completed_A=int(ctrl["completed_A"][k]),
+            completed_B=int(ctrl["completed_B"][k]),
+            upstream_A=queue_count(vehicles_A),
+            upstream_B=queue_count(vehicles_B),
+            vehicles_A=vehicles_A,
+            vehicles_B=vehicles_B,
+            sim_rate=sim_rate,
+        )
+
+    def positions(self, t: float) -> Dict[str, Tuple[VehicleState, ...]]:
+        """
+        Posiciones en t interpolando entre el cuadro vigente y el siguiente (útil con
+        --record-every > 1). Como en live.interpolate, los vehículos que aún no están
+        en el cuadro vigente no se dibujan y los que salen antes del siguiente sí.
+        """
+        f = self.frame_at(t)
+        cur_A, cur_B = self._vehicles(f)
+        if f + 1 >= self.n_frames:
+            return {"A": cur_A, "B": cur_B}
+        t0 = float(self.rec.frames["time"][f])
+        t1 = float(self.rec.frames["time"][f + 1])
+        if t1 <= t0:
+            return {"A": cur_A, "B": cur_B}
+        alpha = min(1.0, max(0.0, (t - t0) / (t1 - t0)))
+        nxt_A, nxt_B = self._vehicles(f + 1)
+        out = {}
+        for name, before, after in (("A", cur_A, nxt_A), ("B", cur_B, nxt_B)):
+            x1 = {vid: x for vid, x, _ in after}
+            out[name] = tuple((vid, x + alpha * (x1[vid] - x) if vid in x1 else x, sf) for vid, x, sf in before)
+        return out
+
+
+class ReplayClock:
+    """Instante de reproducción: avanza a `speed` s simulados por s de reloj salvo en pausa."""
+    def __init__(self, replay: Replay, start: Optional[float] = None, speed: float = 10.0):
+        self.replay = replay
+        self.t = replay.clamp(replay.t_start if start is None else start)
+        self.speed = speed
+        self.paused = False
+        self._last = time.perf_counter()
+
+    def tick(self) -> float:
+        now = time.perf_counter()
+        elapsed, self._last = now - self._last, now
+        if not self.paused:
+            self.t = self.replay.clamp(self.t + elapsed * self.speed)
+        return self.t
+
+    def seek(self, t: float):
+        self.t = self.replay.clamp(t)
+
+    def skip(self, seconds: float):
+        self.seek(self.t + seconds)
+
+    @property
+    def at_end(self) -> bool:
+        return self.t >= self.replay.t_end
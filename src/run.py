@@ -0,0 +1,132 @@
+"""
+Ejecución sin interfaz gráfica (no importa pygame).
+
+Ejemplos:
+    python -m src.run --duration 3600
+    python -m src.run --config escenario.toml --lambda-a 0.5 --seed 7
+    python -m src.run --duration 3600 --record corrida/ --record-every 5
+    python -m src.run --duration 3600 --profile
+    python -m src.run --duration 604800 --metrics
+"""
+import argparse
+import json
+import sys
+import time
+from dataclasses import fields
+from typing import Optional
+
+from .config import DEFAULTS, config_to_dict, load_params, make_config
+from .sim_core import Simulation, SimConfig
+
+
+_TRUE = ("1", "true", "yes", "si", "sí")
+_FALSE = ("0", "false", "no")
+
+
+def _parse_bool(s: str) -> bool:
+    v = s.strip().lower()
+    if v in _TRUE:
+        return True
+    if v in _FALSE:
+        return False
+    raise argparse.ArgumentTypeError(f"valor booleano inválido: {s!r} (usar {'/'.join(_TRUE + _FALSE)})")
+
+
+def _flag_type(ftype):
+    if ftype in (int, float, str):
+        return ftype
+    if ftype is bool:
+        return _parse_bool
+    return json.loads
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m src.run",
+                                description="Corre la simulación sin ventana y reporta un resumen en JSON.")
+    p.add_argument("--config", help="archivo JSON o TOML con parámetros de SimConfig")
+    p.add_argument("--indent", type=int, default=None, help="indentación del JSON de salida")
+    p.add_argument("--record", metavar="DIR", default=None,
+                   help="registrar controlador y vehículos en DIR (ver src/recorder.py)")
+    p.add_argument("--record-every", type=int, default=1, metavar="N",
+                   help="registrar los vehículos cada N pasos (por defecto: 1)")
+    p.add_argument("--profile", action="store_true",
+                   help="cronometrar cada etapa del paso y agregar el reporte (ver src/profiling.py)")
+    p.add_argument("--metrics", action="store_true",
+                   help="agregar demoras, colas, detenciones y duración de fases (ver src/metrics.py)")
+    add_config_args(p)
+    return p
+
+
+def add_config_args(p: argparse.ArgumentParser):
+    """Un flag por campo de SimConfig (--lambda-a, --n-threshold, ...); ver config_from_args."""
+    group = p.add_argument_group("parámetros de SimConfig (sobrescriben --config)")
+    for f in fields(SimConfig):
+        group.add_argument("--" + f.name.replace("_", "-"), dest=f.name, type=_flag_type(f.type),
+                           default=None, metavar=f.name.upper(),
+                           help=f"por defecto: {DEFAULTS.get(f.name, f.default)}")
+
+
+def config_from_args(args: argparse.Namespace) -> SimConfig:
+    params = load_params(args.config) if args.config else {}
+    overrides = {f.name: getattr(args, f.name) for f in fields(SimConfig)
+                 if getattr(args, f.name) is not None}
+    return make_config(params, **overrides)
+
+
+def run(cfg: SimConfig, record: Optional[str] = None, record_every: int = 1, profile: bool = False,
+        metrics: bool = False) -> dict:
+    sim = Simulation(cfg)
+    recorder = None
+    if record:
+        from .recorder import Recorder
+        recorder = Recorder(sim, record, vehicle_every=record_every)
+    profiler = None
+    if profile:
+        from .profiling import StageProfiler
+        profiler = StageProfiler().attach(sim)
+    perf = None
+    if metrics:
+        from .metrics import Metrics
+        perf = Metrics(sim)
+    steps = int(cfg.duration / cfg.dt)
+    t0 = time.perf_counter()
+    result = sim.run_for(cfg.duration)
+    if recorder is not None:
+        recorder.close()
+    if profiler is not None:
+        profiler.detach()
+    wall = time.perf_counter() - t0
+    summary = {
+        "config": config_to_dict(cfg),
+        "steps": steps,
+        "sim_time": sim.time,
+        "wall_s": wall,
+        "steps_per_s": steps / wall if wall > 0 else float("inf"),
+    }
+    summary.update(result)
+    if profiler is not None:
+        summary["profile"] = profiler.report()
+    if perf is not None:
+        summary["metrics"] = perf.report()
+    return summary
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        cfg = config_from_args(args)
+        summary = run(cfg, record=args.record, record_every=args.record_every, profile=args.profile,
+                      metrics=args.metrics)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(summary, indent=args.indent))
+    if args.profile:
+        from .profiling import format_report
+        print(format_report(summary["profile"]), file=sys.stderr)
+    print(f"{summary['steps_per_s']:.0f} pasos/s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
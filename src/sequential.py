@@ -0,0 +1,253 @@
+"""
+Corridas hasta alcanzar una precisión: detección del calentamiento y medias por lotes.
+
+    res = run_until_precision(make_config(lambda_a=0.4), metrics=("delay", "queue"), precision=0.05)
+    res["warmup_s"], res["steps"], res["metrics"]["delay"]["rel_half_width"]
+
+Cada `interval` s simulados se guarda lo ocurrido en el intervalo (sumas de
+src/metrics.py: salidas, demora, viaje, detenciones, cola por paso).
+
+1. Calentamiento: MSER-5 sobre la cola media de cada intervalo. Los intervalos
+   se agrupan de a 5 (z_1..z_m) y se elige el truncamiento d que minimiza
+   sum_{j>d} (z_j - media_d)^2 / (m - d)^2. Se acepta solo si d cae en la
+   primera mitad de la serie; si no, el transitorio sigue y se corre más.
+2. Medias por lotes: los intervalos posteriores se juntan en lotes; cuando hay
+   2 * `batches` lotes se combinan de a pares (el lote dobla su tamaño), así que
+   siempre hay entre `batches` y 2 * `batches` y la memoria no crece.
+3. Parada: con al menos `min_batches` lotes, cuando la semiamplitud relativa del
+   intervalo t de cada métrica (semiamplitud / |media|) es <= `precision` y la
+   autocorrelación de lag 1 de sus medias por lotes es <= `max_autocorr` (si los
+   lotes están correlacionados el intervalo sale demasiado angosto; se sigue
+   corriendo hasta que los lotes crecen), o al llegar a `max_time`.
+
+Métricas (ver METRICS): delay, travel_time, stops (por vehículo salido), queue
+(vehículos en [-road_length, 0) de ambos carriles) y throughput (salidas por hora).
+
+    python -m src.sequential --precision 0.05 --metrics delay,queue --max-time 86400 --lambda-a 0.4
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from .compare import mean_ci
+from .metrics import Metrics
+from .sim_core import SimConfig, Simulation
+
+# Sumas que se guardan por intervalo (y por lote)
+SUMS = ("steps", "exits", "delay", "travel", "stops", "queue")
+
+# Métrica de un lote a partir de sus sumas; None si no está definida (p. ej. sin salidas)
+METRICS: Dict[str, Callable[[Dict[str, float], float], Optional[float]]] = {
+    "delay": lambda s, dt: s["delay"] / s["exits"] if s["exits"] else None,
+    "travel_time": lambda s, dt: s["travel"] / s["exits"] if s["exits"] else None,
+    "stops": lambda s, dt: s["stops"] / s["exits"] if s["exits"] else None,
+    "queue": lambda s, dt: s["queue"] / s["steps"] if s["steps"] else None,
+    "throughput": lambda s, dt: 3600.0 * s["exits"] / (s["steps"] * dt) if s["steps"] else None,
+}
+
+
+def _totals(m: Metrics) -> Dict[str, float]:
+    """Sumas acumuladas desde que se enganchó `m`."""
+    out = dict.fromkeys(SUMS, 0.0)
+    out["steps"] = m.steps
+    for d in m.directions.values():
+        out["exits"] += d.exited
+        out["delay"] += d.delay.acc.mean * d.delay.acc.n
+        out["travel"] += d.travel.acc.mean * d.travel.acc.n
+        out["stops"] += d.stops.acc.mean * d.stops.acc.n
+        out["queue"] += sum(k * c for k, c in enumerate(d.queue.counts))
+    return out
+
+
+def _add(a: Dict[str, float], b: Dict[str, float]) -> Dict[str, float]:
+    return {k: a[k] + b[k] for k in SUMS}
+
+
+def mser(series: Sequence[float], group: int = 5, min_groups: int = 10) -> Optional[int]:
+    """
+    Truncamiento MSER-`group` de la serie, en elementos de la serie; None si el
+    mínimo cae en la segunda mitad (la serie todavía no muestra el régimen) o si
+    hay menos de `min_groups` grupos.
+    """
+    m = len(series) // group
+    if m < min_groups:
+        return None
+    z = [sum(series[j * group:(j + 1) * group]) / group for j in range(m)]
+    # Sumas desde el final para evaluar cada d en O(1)
+    s1 = s2 = 0.0
+    tail = [None] * m
+    for j in range(m - 1, -1, -1):
+        s1 += z[j]
+        s2 += z[j] * z[j]
+        tail[j] = (s1, s2)
+    best_d, best = 0, math.inf
+    for d in range(m // 2 + 1):
+        n = m - d
+        s1, s2 = tail[d]
+        value = max(s2 - s1 * s1 / n, 0.0) / (n * n)
+        if value < best:
+            best_d, best = d, value
+    if best_d >= m // 2:
+        return None
+    return best_d * group
+
+
+def lag1(values: Sequence[float]) -> float:
+    """Autocorrelación de lag 1."""
+    n = len(values)
+    mean = sum(values) / n
+    den = sum((v - mean) ** 2 for v in values)
+    if den == 0:
+        return 0.0
+    return sum((values[i] - mean) * (values[i + 1] - mean) for i in range(n - 1)) / den
+
+
+def _advance(sim: Simulation, steps: int):
+    done = 0
+    while done < steps:
+        done += sim.advance(steps - done)
+
+
+def run_until_precision(cfg: SimConfig, metrics: Sequence[str] = ("delay", "queue"), precision: float = 0.05,
+                        level: float = 0.95, max_time: float = 7 * 86400.0, interval: float = 10.0,
+                        batches: int = 20, min_batches: int = 10, max_autocorr: float = 0.2,
+                        sim: Optional[Simulation] = None,
+                        progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Corre hasta que todas las `metrics` tengan semiamplitud relativa <= precision
+    (o hasta max_time s simulados). `progress(estado)` se llama al cerrar cada lote.
+    """
+    unknown = sorted(set(metrics) - set(METRICS))
+    if unknown:
+        raise ValueError(f"métricas desconocidas: {', '.join(unknown)} (válidas: {', '.join(METRICS)})")
+    if min_batches < 2 or batches < min_batches:
+        raise ValueError("se necesita 2 <= min_batches <= batches")
+    sim = sim if sim is not None else Simulation(cfg)
+    dt = sim.cfg.dt
+    step_chunk = max(1, round(interval / dt))
+    max_steps = int(max_time / dt)
+    m = Metrics(sim)
+    t0 = time.perf_counter()
+
+    prev = _totals(m)
+    raw: List[Dict[str, float]] = []       # intervalos mientras se busca el calentamiento
+    warmup_steps = None
+    lots: List[Dict[str, float]] = []      # lotes completos
+    partial = dict.fromkeys(SUMS, 0.0)     # lote en curso
+    per_lot = 1                            # intervalos por lote
+    in_lot = 0
+    summary: Dict[str, Dict[str, Any]] = {}
+    reason = "max_time"
+
+    def feed(delta) -> bool:
+        """Agrega un intervalo al lote en curso; True si el lote se completó."""
+        nonlocal partial, in_lot, per_lot
+        partial = _add(partial, delta)
+        in_lot += 1
+        if in_lot < per_lot:
+            return False
+        lots.append(partial)
+        partial = dict.fromkeys(SUMS, 0.0)
+        in_lot = 0
+        if len(lots) == 2 * batches:
+            lots[:] = [_add(lots[i], lots[i + 1]) for i in range(0, len(lots), 2)]
+            per_lot *= 2
+        return True
+
+    def evaluate() -> bool:
+        summary.clear()
+        done = len(lots) >= min_batches
+        for name in metrics:
+            values = [METRICS[name](s, dt) for s in lots]
+            if any(v is None for v in values):
+                summary[name] = {"mean": None, "half_width": None, "rel_half_width": None, "lag1": None}
+                done = False
+                continue
+            ci = mean_ci(values, level)
+            rel = ci["half_width"] / abs(ci["mean"]) if ci["mean"] else (0.0 if ci["half_width"] == 0 else math.inf)
+            rho = lag1(values)
+            summary[name] = {"mean": ci["mean"], "half_width": ci["half_width"], "rel_half_width": rel, "lag1": rho}
+            done = done and rel <= precision and rho <= max_autocorr
+        return done
+
+    while m.steps < max_steps:
+        _advance(sim, min(step_chunk, max_steps - m.steps))
+        cur = _totals(m)
+        delta = {k: cur[k] - prev[k] for k in SUMS}
+        prev = cur
+        if warmup_steps is None:
+            raw.append(delta)
+            if len(raw) % 5:
+                continue
+            cut = mser([METRICS["queue"](x, dt) for x in raw])
+            if cut is None:
+                continue
+            warmup_steps = int(sum(x["steps"] for x in raw[:cut]))
+            # Los intervalos ya corridos después del calentamiento van a los primeros lotes
+            for x in raw[cut:]:
+                feed(x)
+            raw = []
+        elif not feed(delta):
+            continue
+        converged = evaluate()
+        if progress is not None:
+            progress({"steps": m.steps, "batches": len(lots), "metrics": dict(summary)})
+        if converged:
+            reason = "precision"
+            break
+    else:
+        if warmup_steps is None:
+            reason = "no_warmup"
+        else:
+            evaluate()
+    m.detach()
+
+    return {
+        "stop": reason,
+        "converged": reason == "precision",
+        "precision": precision,
+        "level": level,
+        "steps": m.steps,
+        "sim_time": m.steps * dt,
+        "warmup_steps": warmup_steps,
+        "warmup_s": None if warmup_steps is None else warmup_steps * dt,
+        "batches": len(lots),
+        "batch_s": per_lot * step_chunk * dt,
+        "metrics": dict(summary),
+        "completed_A": sim.completed_A,
+        "completed_B": sim.completed_B,
+        "switches": sim.ctrl.switches,
+        "wall_s": time.perf_counter() - t0,
+    }
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    from .run import add_config_args, config_from_args
+    p = argparse.ArgumentParser(prog="python -m src.sequential",
+                                description="Corre hasta alcanzar la precisión pedida y reporta lo usado.")
+    p.add_argument("--config", help="archivo JSON o TOML con parámetros de SimConfig")
+    p.add_argument("--metrics", default="delay,queue", help=f"separadas por comas (de: {', '.join(METRICS)})")
+    p.add_argument("--precision", type=float, default=0.05, help="semiamplitud relativa objetivo (por defecto 0.05)")
+    p.add_argument("--level", type=float, default=0.95, help="nivel de confianza (por defecto 0.95)")
+    p.add_argument("--max-time", type=float, default=7 * 86400.0, help="tope de tiempo simulado en s")
+    p.add_argument("--interval", type=float, default=10.0, help="s simulados por observación")
+    p.add_argument("--indent", type=int, default=None, help="indentación del JSON de salida")
+    add_config_args(p)
+    args = p.parse_args(argv)
+    try:
+        cfg = config_from_args(args)
+        result = run_until_precision(cfg, [s.strip() for s in args.metrics.split(",") if s.strip()],
+                                     precision=args.precision, level=args.level, max_time=args.max_time,
+                                     interval=args.interval)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(result, indent=args.indent))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,517 @@
+"""
+Servicio local de simulación: HTTP/JSON sobre un conjunto de procesos, con caché en disco.
+
+    python -m src.service --port 8765 --workers 8 --cache-dir .sim_cache --cache-mb 256
+
+POST /run con un objeto JSON:
+    {"config": {"lambda_a": 0.5, "seed": 7},   # parámetros de SimConfig (sobre DEFAULTS)
+     "horizon": 3600,                          # s simulados (por defecto config.duration)
+     "warmup": 0,                              # s previos que no se miden (opcional)
+     "metrics": true,                          # agregar el reporte de src/metrics.py
+     "stream": false}
+responde {"key": ..., "cached": bool, "result": {...}}, donde "result" es el mismo
+resumen que `python -m src.run` (más "metrics" si se pidió), salvo que "config" no
+trae los campos de EXACT_FIELDS y wall_s / steps_per_s van en "computed" junto con
+el lane_backend y time_advance de la corrida que lo produjo, que puede ser la de
+otro pedido (caché o pedido unido). Con "stream": true la
+respuesta es NDJSON: una línea {"progress": fracción, "sim_time": s} cada 2 % del
+horizonte y al final la línea con el resultado (o {"error": ...}).
+
+- Clave: SHA-256 del JSON canónico de la configuración normalizada (semilla
+  incluida), el horizonte, el calentamiento, "metrics" y ENGINE_VERSION
+  (src/sim_core.py); con arrivals="trace", también del contenido de los registros.
+  lane_backend, time_advance y log_every no entran: dan exactamente el mismo
+  resultado (python -m bench golden). RESULT_VERSION cambia con la forma de "result".
+- Los pedidos iguales que llegan mientras uno está en curso se unen a ese trabajo.
+- Caché: un archivo JSON por clave en --cache-dir. Al superar --cache-mb se borran
+  los menos usados (LRU; el mtime se renueva en cada acierto y ordena el índice al
+  reiniciar).
+
+GET /health y GET /cache (aciertos, fallos, entradas, bytes, pedidos unidos).
+
+Desde Python (notebooks, tableros):
+    from src.service import fetch
+    res = fetch({"config": {"lambda_a": 0.5}, "horizon": 3600, "metrics": True},
+                progress=lambda f, t: print(f"{100 * f:.0f} %"))
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .config import config_to_dict, make_config
+from .metrics import Metrics
+from .sim_core import ENGINE_VERSION, SimConfig, Simulation
+
+# Campos que no cambian el resultado (caminos exactos o solo registro): fuera de la clave
+EXACT_FIELDS = ("lane_backend", "time_advance", "log_every")
+RESULT_VERSION = 2
+REQUEST_FIELDS = ("config", "horizon", "warmup", "metrics", "stream")
+PROGRESS_PARTS = 50       # actualizaciones de progreso por corrida
+KEEPALIVE_S = 15.0        # sin novedades, se repite el último progreso
+
+_FIELD_TYPES = {f.name: f.type for f in fields(SimConfig)}
+
+
+def normalize_request(payload: Any) -> Dict[str, Any]:
+    """Pedido validado y canónico: config completa (floats como float), warmup y metrics."""
+    if not isinstance(payload, dict):
+        raise ValueError("el pedido debe ser un objeto JSON")
+    unknown = sorted(set(payload) - set(REQUEST_FIELDS))
+    if unknown:
+        raise ValueError(f"campos desconocidos en el pedido: {', '.join(unknown)}")
+    cfg = make_config(payload.get("config") or {})
+    # Construir la simulación valida lo que make_config no mira (carriles, avance del
+    # tiempo, integrador, llegadas): un pedido inválido es un 400, no un error del proceso
+    Simulation(cfg)
+    params = config_to_dict(cfg)
+    for name, value in params.items():
+        if _FIELD_TYPES[name] in (int, float):
+            params[name] = _FIELD_TYPES[name](value)
+    horizon = float(payload.get("horizon", params["duration"]))
+    warmup = float(payload.get("warmup", 0.0))
+    if horizon <= 0 or warmup < 0:
+        raise ValueError("se necesita horizon > 0 y warmup >= 0")
+    params["duration"] = horizon
+    return {"config": params, "warmup": warmup, "metrics": bool(payload.get("metrics", False))}
+
+
+def _file_digest(path: str) -> str:
+    if not path:
+        return ""
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                h.update(block)
+    except OSError as e:
+        raise ValueError(f"no se puede leer el registro de llegadas {path!r}: {e}")
+    return h.hexdigest()
+
+
+def request_key(req: Dict[str, Any]) -> str:
+    """Clave del caché de un pedido normalizado."""
+    cfg = {k: v for k, v in req["config"].items() if k not in EXACT_FIELDS}
+    doc = {"engine": ENGINE_VERSION, "result": RESULT_VERSION, "config": cfg, "warmup": req["warmup"], "metrics": req["metrics"]}
+    if cfg["arrivals"] == "trace":
+        doc["traces"] = [_file_digest(cfg["trace_A"]), _file_digest(cfg["trace_B"])]
+    return hashlib.sha256(json.dumps(doc, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def simulate(req: Dict[str, Any], progress: Optional[Callable[[float, float], None]] = None) -> Dict[str, Any]:
+    """Corre un pedido normalizado; `progress(fracción, sim_time)` cada 1/PROGRESS_PARTS del horizonte."""
+    cfg = make_config(req["config"])
+    sim = Simulation(cfg)
+    if req["warmup"] > 0:
+        sim.run_for(req["warmup"])
+    perf = Metrics(sim) if req["metrics"] else None
+    steps = int(cfg.duration / cfg.dt)
+    chunk = max(1, steps // PROGRESS_PARTS)
+    t0 = time.perf_counter()
+    done = 0
+    while done < steps:
+        target = min(steps, done + chunk)
+        while done < target:
+            done += sim.advance(target - done)
+        if progress is not None:
+            progress(done / steps, done * cfg.dt)
+    wall = time.perf_counter() - t0
+    # El resultado se comparte entre pedidos con la misma clave: "config" solo lleva
+    # lo que la define y lo propio de esta corrida va aparte, en "computed"
+    summary = {
+        "config": {k: v for k, v in config_to_dict(cfg).items() if k not in EXACT_FIELDS},
+        "engine": ENGINE_VERSION,
+        "steps": steps,
+        "sim_time": sim.time,
+        "completed_A": sim.completed_A,
+        "completed_B": sim.completed_B,
+        "switches": sim.ctrl.switches,
+        "computed": {
+            "lane_backend": cfg.lane_backend,
+            "time_advance": cfg.time_advance,
+            "wall_s": wall,
+            "steps_per_s": steps / wall if wall > 0 else float("inf"),
+        },
+    }
+    if perf is not None:
+        summary["metrics"] = perf.report()
+    return summary
+
+
+# En cada proceso del conjunto: cola por la que se reporta el progreso al servidor
+_progress_queue = None
+
+
+def _init_worker(queue):
+    global _progress_queue
+    _progress_queue = queue
+
+
+def _run_job(key: str, req: Dict[str, Any]) -> Dict[str, Any]:
+    def progress(fraction, sim_time):
+        _progress_queue.put((key, fraction, sim_time))
+    return simulate(req, progress if _progress_queue is not None else None)
+
+
+class DiskCache:
+    """Resultados JSON en `directory`, un archivo por clave; LRU acotado a max_bytes."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                st = os.stat(os.path.join(directory, name))
+                entries.append((st.st_mtime, name[:-5], st.st_size))
+        entries.sort()
+        # Del menos al más recientemente usado
+        self._index: "OrderedDict[str, int]" = OrderedDict((key, size) for _, key, size in entries)
+        self.bytes = sum(self._index.values())
+        with self._lock:
+            self._evict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as fh:
+                    value = json.load(fh)
+                os.utime(path)
+            except (OSError, ValueError):
+                # Borrado desde afuera o escritura truncada: se descarta
+                self.bytes -= self._index.pop(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        data = json.dumps(value).encode()
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            path = self._path(key)
+            tmp = path[:-5] + ".tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+            if key in self._index:
+                self.bytes -= self._index.pop(key)
+            self._index[key] = len(data)
+            self.bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._index), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class Job:
+    """Una corrida en curso; los pedidos iguales esperan sobre la misma instancia."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.cond = threading.Condition()
+        self.version = 0          # sube con cada novedad (progreso o fin)
+        self.progress = 0.0
+        self.sim_time = 0.0
+        self.done = False
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    def set_progress(self, fraction: float, sim_time: float):
+        with self.cond:
+            if not self.done:
+                self.progress, self.sim_time = fraction, sim_time
+                self.version += 1
+                self.cond.notify_all()
+
+    def finish(self, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        with self.cond:
+            self.result, self.error, self.done = result, error, True
+            if result is not None:
+                self.progress = 1.0
+            self.version += 1
+            self.cond.notify_all()
+
+    def wait(self) -> "Job":
+        with self.cond:
+            self.cond.wait_for(lambda: self.done)
+        return self
+
+
+class Service:
+    """Conjunto de procesos + trabajos en curso + caché. Se usa con serve() o directamente."""
+
+    def __init__(self, workers: Optional[int] = None, cache_dir: str = ".sim_cache",
+                 max_bytes: int = 256 << 20):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = DiskCache(cache_dir, max_bytes)
+        self.deduplicated = 0
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        # spawn: el servidor tiene hilos y fork desde un proceso con hilos no es seguro
+        ctx = multiprocessing.get_context("spawn")
+        self._queue = ctx.Queue()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                         initializer=_init_worker, initargs=(self._queue,))
+        self._drain = threading.Thread(target=self._drain_progress, name="progreso", daemon=True)
+        self._drain.start()
+
+    def submit(self, payload: Any) -> Tuple[str, Optional[Dict[str, Any]], Optional[Job]]:
+        """
+        (clave, resultado del caché, trabajo): exactamente uno de los dos últimos no
+        es None. Un pedido igual a uno en curso devuelve ese mismo trabajo.
+        """
+        req = normalize_request(payload)
+        key = request_key(req)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self.deduplicated += 1
+                return key, None, job
+            cached = self.cache.get(key)
+            if cached is not None:
+                return key, cached, None
+            job = self._jobs[key] = Job(key)
+        try:
+            future = self._pool.submit(_run_job, key, req)
+        except Exception as e:
+            self._forget(job, error=f"{type(e).__name__}: {e}")
+            raise
+        future.add_done_callback(lambda f, job=job: self._finish(job, f))
+        return key, None, job
+
+    def run(self, payload: Any) -> Tuple[str, bool, Dict[str, Any]]:
+        """Versión bloqueante: (clave, vino del caché, resultado); RuntimeError si la corrida falló."""
+        key, cached, job = self.submit(payload)
+        if job is None:
+            return key, True, cached
+        job.wait()
+        if job.error is not None:
+            raise RuntimeError(job.error)
+        return key, False, job.result
+
+    def _finish(self, job: Job, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self._forget(job, error=f"{type(e).__name__}: {e}")
+            return
+        # Primero al caché y después fuera de los trabajos en curso: un pedido nuevo
+        # encuentra siempre uno de los dos
+        self.cache.put(job.key, result)
+        self._forget(job, result=result)
+
+    def _forget(self, job: Job, result=None, error=None):
+        with self._lock:
+            self._jobs.pop(job.key, None)
+        job.finish(result, error)
+
+    def _drain_progress(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            key, fraction, sim_time = item
+            with self._lock:
+                job = self._jobs.get(key)
+            if job is not None:
+                job.set_progress(fraction, sim_time)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = len(self._jobs)
+        return {"engine": ENGINE_VERSION, "workers": self.workers, "in_flight": in_flight,
+                "deduplicated": self.deduplicated, "cache": self.cache.stats()}
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._queue.put(None)
+        self._drain.join()
+        self._queue.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send_json(self, status: int, doc: Dict[str, Any]):
+        body = (json.dumps(doc) + "\n").encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_line(self, doc: Dict[str, Any]):
+        """Una línea NDJSON como bloque de la respuesta chunked."""
+        data = (json.dumps(doc) + "\n").encode()
+        self.wfile.write(b"%X\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/health":
+            self._send_json(200, {"ok": True, "engine": ENGINE_VERSION, "workers": service.workers})
+        elif self.path == "/cache":
+            self._send_json(200, service.stats())
+        else:
+            self._send_json(404, {"error": f"ruta desconocida: {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/run":
+            self._send_json(404, {"error": f"ruta desconocida: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            stream = isinstance(payload, dict) and bool(payload.get("stream", False))
+            key, cached, job = self.server.service.submit(payload)
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        if not stream:
+            if job is None:
+                self._send_json(200, {"key": key, "cached": True, "result": cached})
+            elif job.wait().error is not None:
+                self._send_json(500, {"key": key, "error": job.error})
+            else:
+                self._send_json(200, {"key": key, "cached": False, "result": job.result})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            if job is None:
+                self._send_line({"key": key, "cached": True, "result": cached})
+            else:
+                seen = -1
+                while True:
+                    with job.cond:
+                        job.cond.wait_for(lambda: job.version != seen, timeout=KEEPALIVE_S)
+                        seen = job.version
+                        done, fraction, sim_time = job.done, job.progress, job.sim_time
+                    if done:
+                        break
+                    self._send_line({"key": key, "progress": fraction, "sim_time": sim_time})
+                if job.error is not None:
+                    self._send_line({"key": key, "error": job.error})
+                else:
+                    self._send_line({"key": key, "cached": False, "result": job.result})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente se fue; la corrida sigue y su resultado queda en el caché
+            self.close_connection = True
+
+
+def serve(service: Service, host: str = "127.0.0.1", port: int = 8765,
+          verbose: bool = False) -> ThreadingHTTPServer:
+    """Servidor HTTP sobre `service` (port=0 elige uno libre); llamar a serve_forever()."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def fetch(payload: Dict[str, Any], url: str = "http://127.0.0.1:8765",
+          progress: Optional[Callable[[float, float], None]] = None,
+          timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Pide una corrida al servicio y devuelve {"key", "cached", "result"}. Con
+    `progress(fracción, sim_time)` la pide en modo stream. RuntimeError si falla.
+    """
+    body = json.dumps(dict(payload, stream=progress is not None)).encode()
+    request = urllib.request.Request(url.rstrip("/") + "/run", data=body,
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            if progress is None:
+                doc = json.load(resp)
+            else:
+                doc = {"error": "la respuesta terminó sin resultado"}
+                for line in resp:
+                    doc = json.loads(line)
+                    if "progress" not in doc:
+                        break
+                    progress(doc["progress"], doc["sim_time"])
+    except urllib.error.HTTPError as e:
+        doc = json.load(e)
+    if "error" in doc:
+        raise RuntimeError(doc["error"])
+    return doc
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.service",
+                                description="Servicio HTTP/JSON local de simulación con caché de resultados.")
+    p.add_argument("--host", default="127.0.0.1", help="dirección (por defecto: solo local)")
+    p.add_argument("--port", type=int, default=8765, help="puerto (0: uno libre)")
+    p.add_argument("--workers", type=int, default=None, help="procesos (por defecto: todos los núcleos)")
+    p.add_argument("--cache-dir", default=".sim_cache", help="directorio del caché de resultados")
+    p.add_argument("--cache-mb", type=float, default=256.0, help="tamaño máximo del caché en MB")
+    p.add_argument("--verbose", action="store_true", help="registrar cada pedido en stderr")
+    args = p.parse_args(argv)
+
+    service = Service(args.workers, args.cache_dir, int(args.cache_mb * (1 << 20)))
+    server = serve(service, args.host, args.port, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"sirviendo en http://{host}:{port} ({service.workers} procesos, caché en {args.cache_dir})",
+          file=sys.stderr, flush=True)
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, List, Optional
+import math
 import random
 
 from .lanes import Lane
@@ -33,48 +34,192 @@ class SimConfig:
     # Logging
     log_every: float = 5.0
 
+    # Implementación de los carriles: "list" (Lane) o "numpy" (ArrayLane)
+    lane_backend: str = "list"
+
+    # Avance del tiempo: "fixed" (un paso dt a la vez) o "event" (salta tramos sin eventos)
+    time_advance: str = "fixed"
+
+    # Llegadas: "knuth" (sorteo de Poisson en cada paso), "schedule" (tiempos
+    # exponenciales precalculados por bloques) o "trace" (registro en disco)
+    arrivals: str = "knuth"
+    # Perfil de demanda para "schedule": puntos [t, factor] que multiplican lambda_a y
+    # lambda_b (lineal por tramos); se repite cada profile_period s si es > 0
+    rate_profile: Optional[List[List[float]]] = None
+    profile_period: float = 0.0
+    # Para "trace": archivos .npy (o float64 crudo) con los instantes de llegada en s
+    trace_A: str = ""
+    trace_B: str = ""
+    trace_offset: float = 0.0
+
+    # Números aleatorios de cada carril: "shared" (un generador para llegadas y
+    # bloqueos) o "split" (generadores independientes; cambiar un parámetro que
+    # altera los bloqueos ya no corre la secuencia de llegadas)
+    rng_streams: str = "shared"
+    # Variables antitéticas: cada sorteo u de los carriles se reemplaza por 1 - u
+    # (llegadas de Knuth y bloqueos; "schedule" y "trace" no cambian)
+    antithetic: bool = False
+
+    # Integración del movimiento: "euler" (explícita, la de referencia) o "exact"
+    # (aceleración constante por tramos resuelta dentro del paso, con instantes de
+    # llegada, cruce y salida dentro del paso; admite dt grandes). Es otro modelo: no
+    # reproduce las métricas de "euler" (ver bench/convergence.py)
+    integrator: str = "euler"
+
+def lane_class(backend: str):
+    if backend == "list":
+        return Lane
+    if backend == "numpy":
+        from .lanes_np import ArrayLane
+        return ArrayLane
+    raise ValueError(f"lane_backend desconocido: {backend!r}")
+
+def controller_config(cfg: SimConfig) -> ControllerConfig:
+    return ControllerConfig(
+        n_threshold=cfg.n_threshold,
+        u_min_green=cfg.u_min_green,
+        y_yellow=cfg.y_yellow,
+        m_small_platoon=cfg.m_small_platoon,
+        d_detect=cfg.d_detect,
+        r_close=cfg.r_close,
+        e_after=cfg.e_after,
+    )
+
+# Máximo de pasos por salto en modo "event" (acota el error de redondeo acumulado en las holguras)
+MAX_JUMP_STEPS = 10000
+# Tras intentos de salto fallidos se espera 1, 2, 4, ... (hasta este máximo) pasos fijos antes de reintentar
+MAX_JUMP_BACKOFF = 16
+# Versión del motor: forma parte de la clave del caché de resultados (src/service.py).
+# Subirla cada vez que cambian las trayectorias de referencia (bench/golden.json).
+ENGINE_VERSION = 2
+
 class Simulation:
     def __init__(self, cfg: SimConfig):
         self.cfg = cfg
         self.rng = random.Random(cfg.seed)
 
-        self.lane_A = Lane("A", cfg.road_length, cfg.v_max, cfg.safe_gap, cfg.p_block, cfg.t_block, seed=cfg.seed + 1)
-        self.lane_B = Lane("B", cfg.road_length, cfg.v_max, cfg.safe_gap, cfg.p_block, cfg.t_block, seed=cfg.seed + 2)
+        lane_cls = lane_class(cfg.lane_backend)
+        self.lane_A = lane_cls("A", cfg.road_length, cfg.v_max, cfg.safe_gap, cfg.p_block, cfg.t_block, seed=cfg.seed + 1,
+                               streams=cfg.rng_streams, antithetic=cfg.antithetic, integrator=cfg.integrator)
+        self.lane_B = lane_cls("B", cfg.road_length, cfg.v_max, cfg.safe_gap, cfg.p_block, cfg.t_block, seed=cfg.seed + 2,
+                               streams=cfg.rng_streams, antithetic=cfg.antithetic, integrator=cfg.integrator)
 
-        self.ctrl = Controller(ControllerConfig(
-            n_threshold=cfg.n_threshold,
-            u_min_green=cfg.u_min_green,
-            y_yellow=cfg.y_yellow,
-            m_small_platoon=cfg.m_small_platoon,
-            d_detect=cfg.d_detect,
-            r_close=cfg.r_close,
-            e_after=cfg.e_after,
-        ))
+        if cfg.arrivals != "knuth":
+            self._attach_arrivals()
+
+        self.ctrl = Controller(controller_config(cfg))
 
         self.time = 0.0
         self.completed_A = 0
         self.completed_B = 0
 
+        if cfg.time_advance not in ("fixed", "event"):
+            raise ValueError(f"time_advance desconocido: {cfg.time_advance!r}")
+        if cfg.integrator == "exact" and cfg.time_advance != "fixed":
+            raise ValueError("integrator=\"exact\" usa paso fijo (time_advance=\"fixed\")")
+        self._exact = cfg.integrator == "exact"
+        self._switch_at = cfg.dt  # instante del cambio de fase dentro del paso (integración exacta)
+        # Límites que un salto no puede cruzar: zonas d, r, [0, e] y salida
+        self._event_bounds = tuple(sorted((-cfg.d_detect, -cfg.r_close, 0.0,
+                                           math.nextafter(cfg.e_after, math.inf), self._cutoff())))
+        self._jump_backoff = 0
+        self._jump_wait = 0
+
+        # Registro opcional de trayectorias (src/recorder.py); se llama al final de cada paso
+        self.recorder = None
+        # Perfilador por etapas opcional (src/profiling.py); step_once le avisa el fin de cada etapa
+        self.profiler = None
+        # Métricas de desempeño opcionales (src/metrics.py); al retirar vehículos y al final de cada paso
+        self.metrics = None
+
+        # Zonas de los sensores: los carriles las mantienen al mover los vehículos
+        self.lane_A.set_sensors(cfg.d_detect, cfg.r_close, cfg.e_after)
+        self.lane_B.set_sensors(cfg.d_detect, cfg.r_close, cfg.e_after)
+
+        # Últimas lecturas de sensores (también las usa el HUD)
+        self.readings_A = self.lane_A.read_sensors(cfg.d_detect, cfg.r_close, cfg.e_after)
+        self.readings_B = self.lane_B.read_sensors(cfg.d_detect, cfg.r_close, cfg.e_after)
+
+    def _attach_arrivals(self):
+        from .arrivals import RateProfile, make_source
+        cfg = self.cfg
+        profile = RateProfile(cfg.rate_profile, cfg.profile_period) if cfg.rate_profile else None
+        self.lane_A.arrivals = make_source(cfg.arrivals, cfg.lambda_a, cfg.seed + 1, profile, cfg.trace_A, cfg.trace_offset)
+        self.lane_B.arrivals = make_source(cfg.arrivals, cfg.lambda_b, cfg.seed + 2, profile, cfg.trace_B, cfg.trace_offset)
+
     def step_once(self):
         cfg = self.cfg
+        # Con perfilador, lap(i) cierra la etapa i de profiling.STAGES
+        prof = self.profiler
+        if prof is not None:
+            prof.begin(self)
 
         # Llegadas
-        self.lane_A.spawn_poisson(cfg.lambda_a, cfg.dt, self.time)
-        self.lane_B.spawn_poisson(cfg.lambda_b, cfg.dt, self.time)
-
-        # Sensores
-        a_red = self.lane_A.count_in_range_upstream(cfg.d_detect)
-        b_red = self.lane_B.count_in_range_upstream(cfg.d_detect)
-        a_close = self.lane_A.count_close_to_line(cfg.r_close)
-        b_close = self.lane_B.count_close_to_line(cfg.r_close)
-        a_any_d = self.lane_A.any_in_range_upstream(cfg.d_detect)
-        b_any_d = self.lane_B.any_in_range_upstream(cfg.d_detect)
-        a_stop_after = self.lane_A.has_stopped_downstream(cfg.e_after, v_thresh=0.1, min_time=0.5)
-        b_stop_after = self.lane_B.has_stopped_downstream(cfg.e_after, v_thresh=0.1, min_time=0.5)
+        self.lane_A.spawn(cfg.lambda_a, cfg.dt, self.time)
+        self.lane_B.spawn(cfg.lambda_b, cfg.dt, self.time)
+        if prof is not None:
+            prof.lap(0)
+
+        # Sensores (una lectura por carril)
+        self.readings_A = self.lane_A.read_sensors(cfg.d_detect, cfg.r_close, cfg.e_after)
+        self.readings_B = self.lane_B.read_sensors(cfg.d_detect, cfg.r_close, cfg.e_after)
+        if prof is not None:
+            prof.lap(1)
 
         # Controlador
-        self.ctrl.step(cfg.dt, a_red, b_red, a_close, b_close, a_any_d, b_any_d, a_stop_after, b_stop_after)
+        self._control()
+        if prof is not None:
+            prof.lap(2)
 
+        self._move(prof)
+        if prof is not None:
+            prof.end(self)
+
+        if self.recorder is not None:
+            self.recorder.record(self)
+
+    def _control(self):
+        """Paso del controlador con las lecturas actuales."""
+        cfg = self.cfg
+        if not self._exact:
+            self.ctrl.step_readings(cfg.dt, self.readings_A, self.readings_B)
+            return
+        # Integración exacta: el cambio de fase puede caer dentro del paso, con los
+        # cruces de los sensores que ocurrirían en él con la fase actual
+        ctrl = self.ctrl
+        ra, rb = self.readings_A, self.readings_B
+        events_A = self.lane_A.sensor_events(cfg.dt, ctrl.is_green(True))
+        events_B = self.lane_B.sensor_events(cfg.dt, ctrl.is_green(False))
+        self._switch_at = ctrl.step_within(cfg.dt, ra.count_d, rb.count_d, ra.count_r, rb.count_r,
+                                           ra.blocked, rb.blocked, events_A, events_B)
+
+    def _step_lanes(self, green_A: bool, green_B: bool):
+        """Movimiento de ambos carriles en el paso."""
+        dt = self.cfg.dt
+        lane_A, lane_B = self.lane_A, self.lane_B
+        if not self._exact:
+            lane_A.step(dt, green_A)
+            lane_B.step(dt, green_B)
+            return
+        # Hasta el cambio de fase con la anterior y el resto con la nueva; el tiempo
+        # en la zona d de cada tramo va al contador en rojo de la fase que lo movió
+        ctrl = self.ctrl
+        tau = self._switch_at
+        if tau < dt:
+            lane_A.step(tau, green_A)
+            lane_B.step(tau, green_B)
+            ctrl.add_red_time(lane_A.red_zone_time, lane_B.red_zone_time)
+            ctrl.switch_pending()
+            dt -= tau
+            green_A = ctrl.is_green(True)
+            green_B = ctrl.is_green(False)
+        lane_A.step(dt, green_A)
+        lane_B.step(dt, green_B)
+        ctrl.add_red_time(lane_A.red_zone_time, lane_B.red_zone_time)
+
+    def _move(self, prof=None):
+        """Segunda mitad del paso: bloqueos, movimiento, salidas y reloj."""
+        cfg = self.cfg
         green_A = self.ctrl.is_green(True)
         green_B = self.ctrl.is_green(False)
 
@@ -83,24 +228,132 @@ class Simulation:
             self.lane_A.maybe_induce_block(cfg.e_after)
         if green_B:
             self.lane_B.maybe_induce_block(cfg.e_after)
+        if prof is not None:
+            prof.lap(3)
 
         # Movimiento
         # Nota: en amarillo consideramos "no verde"
-        self.lane_A.step(cfg.dt, green_A)
-        self.lane_B.step(cfg.dt, green_B)
+        self._step_lanes(green_A, green_B)
+        if prof is not None:
+            prof.lap(4)
 
         # Salidas
-        cutoff = cfg.e_after + cfg.intersection_len + 25.0
-        self.completed_A += self.lane_A.remove_completed(cutoff)
-        self.completed_B += self.lane_B.remove_completed(cutoff)
+        cutoff = self._cutoff()
+        metrics = self.metrics
+        if metrics is None:
+            self.completed_A += self.lane_A.remove_completed(cutoff)
+            self.completed_B += self.lane_B.remove_completed(cutoff)
+        else:
+            self.completed_A += self.lane_A.remove_completed(cutoff, metrics.exit_A)
+            self.completed_B += self.lane_B.remove_completed(cutoff, metrics.exit_B)
+        if prof is not None:
+            prof.lap(5)
 
         self.time += cfg.dt
+        if metrics is not None:
+            metrics.on_step(self.ctrl.phase, self.readings_A.upstream, self.readings_B.upstream)
+
+    def _cutoff(self) -> float:
+        cfg = self.cfg
+        return cfg.e_after + cfg.intersection_len + 25.0
+
+    def advance(self, max_steps: int) -> int:
+        """
+        Avanza hasta max_steps pasos y devuelve cuántos avanzó. En modo "fixed" es
+        un step_once(). En modo "event", mientras en ambos carriles los vehículos
+        circulan libres sin cruzar límites de sensores o esperan detenidos ante el
+        rojo, salta directamente hasta el próximo evento: una llegada, un cruce de
+        límite, un verde para vehículos detenidos o el fin del tramo seguro.
+        El controlador (barato) se sigue evaluando paso a paso con las lecturas
+        constantes del tramo, así que sus temporizadores, contadores y cambios de
+        fase son exactamente los del avance paso a paso; los carriles se mueven de
+        una vez al final del salto repitiendo las mismas operaciones.
+        """
+        if max_steps <= 0:
+            return 0
+        cfg = self.cfg
+        if cfg.time_advance != "event" or self.recorder is not None:
+            self.step_once()
+            return 1
+        if self._jump_wait > 0:
+            self._jump_wait -= 1
+            self.step_once()
+            return 1
+        dt = cfg.dt
+        prof = self.profiler
+        if prof is not None:
+            t0 = prof.clock()
+        limit = min(max_steps, MAX_JUMP_STEPS)
+        k_A, red_only_A = self.lane_A.cruise_steps(dt, self._event_bounds, cfg.e_after, limit)
+        k_B, red_only_B = self.lane_B.cruise_steps(dt, self._event_bounds, cfg.e_after, limit) if k_A >= 2 else (0, False)
+        k = min(k_A, k_B)
+        if k < 2:
+            # Con tráfico denso casi nunca se puede saltar: espaciar los intentos
+            self._jump_backoff = min(2 * self._jump_backoff or 1, MAX_JUMP_BACKOFF)
+            self._jump_wait = self._jump_backoff
+            self.step_once()
+            return 1
+        self._jump_backoff = 0
+
+        ra = self.lane_A.read_sensors(cfg.d_detect, cfg.r_close, cfg.e_after)
+        rb = self.lane_B.read_sensors(cfg.d_detect, cfg.r_close, cfg.e_after)
+        if prof is not None:
+            t1 = prof.clock()
+        greens_A, greens_B = [], []
+        ctrl = self.ctrl
+        metrics = self.metrics
+        done = 0
+        arrival = False
+        green_ends_jump = False
+        while done < k:
+            # Llegadas: el sorteo queda pendiente; si hay llegada, ese paso va completo
+            if self.lane_A.arrival_due(cfg.lambda_a, dt, self.time) or \
+                    self.lane_B.arrival_due(cfg.lambda_b, dt, self.time):
+                arrival = True
+                break
+            self.lane_A.discard_pending()
+            self.lane_B.discard_pending()
+            ctrl.step_readings(dt, ra, rb)
+            green_A = ctrl.is_green(True)
+            green_B = ctrl.is_green(False)
+            if (green_A and red_only_A) or (green_B and red_only_B):
+                # Verde en un carril cuyo tramo solo valía en rojo: este paso va completo
+                green_ends_jump = True
+                break
+            greens_A.append(green_A)
+            greens_B.append(green_B)
+            self.time += dt
+            done += 1
+            if metrics is not None:
+                # En el tramo nadie sale ni cruza x=0: las colas son las de ra/rb
+                metrics.on_step(ctrl.phase, ra.upstream, rb.upstream)
+        self.readings_A, self.readings_B = ra, rb
+        if prof is not None:
+            t2 = prof.clock()
+        self.lane_A.cruise(dt, greens_A)
+        self.lane_B.cruise(dt, greens_B)
+        if prof is not None:
+            prof.jump(self, done, t1 - t0, t2 - t1, prof.clock() - t2)
+        if arrival:
+            self.step_once()
+            done += 1
+        elif green_ends_jump:
+            # El control de este paso ya corrió en el tramo: solo se miden las etapas de _move
+            if prof is not None:
+                prof.begin(self)
+            self._move(prof)
+            if prof is not None:
+                prof.end(self)
+            done += 1
+        return done
 
     def run_for(self, duration: float):
         steps = int(duration / self.cfg.dt)
-        for _ in range(steps):
-            self.step_once()
+        done = 0
+        while done < steps:
+            done += self.advance(steps - done)
         return {
             "completed_A": self.completed_A,
             "completed_B": self.completed_B,
+            "switches": self.ctrl.switches,
         }
\ No newline at end of file
@@ -0,0 +1,308 @@
+"""
+Barridos de parámetros sobre SimConfig en paralelo (ProcessPoolExecutor).
+
+Archivo de barrido (JSON o TOML):
+    {
+      "base": {"duration": 3600, "lambda_b": 0.25},       # parámetros fijos
+      "grid": {"n_threshold": [5, 10, 20],                # producto cartesiano
+               "u_min_green": [6, 8, 12]},
+      "points": [{"lambda_a": 0.2}, {"lambda_a": 0.5}],   # opcional: lista explícita
+      "replications": 5,
+      "seed": 1234,
+      "warmup": 1800                                      # opcional
+    }
+Si hay "grid" y "points", cada punto se combina con cada celda de la grilla.
+
+Con "warmup" (s), cada réplica se calienta una sola vez con los parámetros base y
+todos los puntos parten de ese checkpoint (src/checkpoint.py) para correr luego
+"duration" s más; los resultados cuentan solo lo ocurrido después del
+calentamiento. Los puntos solo pueden variar parámetros del controlador.
+
+Con "precision" cada tarea corre hasta alcanzar la precisión pedida en lugar de
+"duration" s fijos (src/sequential.py: calentamiento por MSER-5 y medias por
+lotes), así que las réplicas ruidosas corren más y las fáciles menos:
+    "precision": {"target": 0.05, "metrics": ["delay", "queue"], "max_time": 86400}
+Se agregan al CSV el calentamiento, si se alcanzó la precisión y, por métrica, la
+media y la semiamplitud relativa. No se combina con "warmup".
+
+Los resultados se agregan a un CSV a medida que terminan las tareas; si la salida
+ya existe, las tareas ya registradas se omiten (reanudación tras una interrupción).
+Al lado se guarda <salida>.spec con una huella de la especificación y de
+--common-seeds; si no coincide, el barrido no se reanuda sobre ese archivo.
+
+    python -m src.sweep barrido.json --out resultados.csv --workers 8
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from . import checkpoint
+from .config import load_params, make_config
+from .sim_core import Simulation
+
+RESULT_FIELDS = ("steps", "completed_A", "completed_B", "switches", "wall_s")
+# Columnas adicionales con "precision" (más <métrica>_mean y <métrica>_rel por métrica)
+PRECISION_FIELDS = ("warmup_s", "converged")
+
+
+def derive_seed(base_seed: int, *key) -> int:
+    """Semilla determinista e independiente para cada tarea (hash de base_seed + clave)."""
+    h = hashlib.blake2b(repr((base_seed,) + key).encode(), digest_size=4)
+    return int.from_bytes(h.digest(), "little") & 0x7FFFFFFF
+
+
+def expand_points(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    grid = spec.get("grid") or {}
+    names = list(grid)
+    cells = [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+    points = spec.get("points") or [{}]
+    return [dict(p, **c) for p in points for c in cells]
+
+
+def make_tasks(spec: Dict[str, Any], common_seeds: bool = False) -> List[Dict[str, Any]]:
+    """
+    Una tarea por (punto, réplica). Con common_seeds=True la semilla depende solo de
+    la réplica (números aleatorios comunes entre puntos); si no, de punto y réplica.
+    """
+    base_seed = int(spec.get("seed", 0))
+    reps = int(spec.get("replications", 1))
+    tasks = []
+    for point_id, point in enumerate(expand_points(spec)):
+        for rep in range(reps):
+            seed = derive_seed(base_seed, rep) if common_seeds else derive_seed(base_seed, point_id, rep)
+            tasks.append({"task_id": len(tasks), "point": point_id, "rep": rep, "seed": seed, "params": point})
+    return tasks
+
+
+def warm_up(base: Dict[str, Any], seed: int, warmup: float) -> bytes:
+    """Checkpoint de la configuración base tras `warmup` s simulados."""
+    sim = Simulation(make_config(base, seed=seed))
+    sim.run_for(warmup)
+    return checkpoint.dumps(sim)
+
+
+def result_fields(precision: Optional[Dict[str, Any]] = None) -> List[str]:
+    fields_ = list(RESULT_FIELDS)
+    if precision:
+        fields_ += list(PRECISION_FIELDS)
+        for name in precision.get("metrics", ["delay"]):
+            fields_ += [f"{name}_mean", f"{name}_rel"]
+    return fields_
+
+
+def run_task(base: Dict[str, Any], task: Dict[str, Any], snapshot: Optional[bytes] = None,
+             precision: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Corre una tarea. Con `snapshot` (barrido con calentamiento) la tarea es una rama
+    de ese checkpoint: cambia los parámetros del controlador y reinicia los RNG con
+    la semilla de la tarea. Con `precision`, corre hasta alcanzarla (src/sequential.py).
+    """
+    if precision:
+        from .sequential import run_until_precision
+        cfg = make_config(base, **dict(task["params"], seed=task["seed"]))
+        res = run_until_precision(cfg, precision.get("metrics", ["delay"]), precision=float(precision.get("target", 0.05)),
+                                  level=float(precision.get("level", 0.95)),
+                                  max_time=float(precision.get("max_time", cfg.duration)))
+        row = {k: task[k] for k in ("task_id", "point", "rep", "seed")}
+        row.update(task["params"])
+        for k in RESULT_FIELDS + PRECISION_FIELDS:
+            row[k] = res[k]
+        for name, stat in res["metrics"].items():
+            row[f"{name}_mean"] = stat["mean"]
+            row[f"{name}_rel"] = stat["rel_half_width"]
+        return row
+    if snapshot is None:
+        cfg = make_config(base, **dict(task["params"], seed=task["seed"]))
+        sim = Simulation(cfg)
+    else:
+        sim = checkpoint.fork(snapshot, reset_counters=True, reseed=task["seed"], **task["params"])
+        cfg = sim.cfg
+    t0 = time.perf_counter()
+    result = sim.run_for(cfg.duration)
+    row = {k: task[k] for k in ("task_id", "point", "rep", "seed")}
+    row.update(task["params"])
+    row.update(result)
+    row["steps"] = int(cfg.duration / cfg.dt)
+    row["wall_s"] = time.perf_counter() - t0
+    return row
+
+
+def _run_chunk(base: Dict[str, Any], chunk: Sequence[Dict[str, Any]],
+               snapshots: Optional[Dict[int, bytes]] = None,
+               precision: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    if snapshots is None:
+        return [run_task(base, t, precision=precision) for t in chunk]
+    return [run_task(base, t, snapshots[t["rep"]]) for t in chunk]
+
+
+def spec_digest(spec: Dict[str, Any], common_seeds: bool) -> str:
+    """Huella del barrido (especificación y modo de semillas) para reanudar solo el mismo."""
+    text = json.dumps({"spec": spec, "common_seeds": bool(common_seeds)}, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def _digest_path(path: str) -> str:
+    return path + ".spec"
+
+
+def _read_done(path: str, header: Sequence[str], digest: str) -> set:
+    """
+    task_id ya registrados. Recorta el archivo hasta su último salto de línea
+    (escritura interrumpida) y descarta filas incompletas; falla si el archivo es
+    de otro barrido (encabezado o huella distintos).
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return set()
+    try:
+        with open(_digest_path(path), "r", encoding="utf-8") as fh:
+            stored = fh.read().strip()
+    except FileNotFoundError:
+        stored = None
+    if stored != digest:
+        raise ValueError(f"{path} no corresponde a este barrido (especificación, semilla o "
+                         f"--common-seeds distintos, o falta {_digest_path(path)})")
+    with open(path, "rb+") as fh:
+        data = fh.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            fh.truncate(end)
+    rows = list(csv.reader(data[:end].decode("utf-8").splitlines()))
+    if not rows or rows[0] != list(header):
+        raise ValueError(f"{path} no corresponde a este barrido (encabezado distinto)")
+    complete = [r for r in rows[1:] if len(r) == len(header)]
+    if len(complete) != len(rows) - 1:
+        with open(path, "w", newline="", encoding="utf-8") as fh:
+            w = csv.writer(fh)
+            w.writerow(header)
+            w.writerows(complete)
+    return {int(r[0]) for r in complete}
+
+
+def run_sweep(spec: Dict[str, Any], out_path: str, workers: Optional[int] = None,
+              chunksize: Optional[int] = None, common_seeds: bool = False, progress=None) -> int:
+    """
+    Ejecuta el barrido y agrega filas a out_path (CSV). Devuelve el número de tareas
+    ejecutadas en esta llamada (las ya presentes en el archivo se omiten).
+    """
+    base = dict(spec.get("base") or {})
+    warmup = float(spec.get("warmup", 0.0))
+    precision = spec.get("precision")
+    if precision and warmup > 0:
+        raise ValueError("\"precision\" detecta su propio calentamiento: no se combina con \"warmup\"")
+    tasks = make_tasks(spec, common_seeds=common_seeds)
+    param_names = sorted({k for t in tasks for k in t["params"]})
+    if warmup > 0:
+        not_ctrl = sorted(set(param_names) - set(checkpoint.CONTROLLER_FIELDS))
+        if not_ctrl:
+            raise ValueError(f"con warmup solo se pueden variar parámetros del controlador: {', '.join(not_ctrl)}")
+    header = ["task_id", "point", "rep", "seed"] + param_names + result_fields(precision)
+
+    digest = spec_digest(spec, common_seeds)
+    done = _read_done(out_path, header, digest)
+    pending = [t for t in tasks if t["task_id"] not in done]
+    if not pending:
+        return 0
+
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        # Unos 4 bloques por proceso: poco costo de despacho y buen balance de carga
+        chunksize = max(1, math.ceil(len(pending) / (workers * 4)))
+    chunks = [pending[i:i + chunksize] for i in range(0, len(pending), chunksize)]
+
+    new_file = not os.path.exists(out_path) or os.path.getsize(out_path) == 0
+    finished = 0
+    with open(out_path, "a", newline="", encoding="utf-8") as fh, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(fh, fieldnames=header, extrasaction="ignore")
+        if new_file:
+            with open(_digest_path(out_path), "w", encoding="utf-8") as side:
+                side.write(digest + "\n")
+            writer.writeheader()
+            fh.flush()
+        snapshots = None
+        if warmup > 0:
+            # Un calentamiento por réplica; cada tarea es una rama de su checkpoint
+            base_seed = int(spec.get("seed", 0))
+            reps = sorted({t["rep"] for t in pending})
+            warm_seeds = {rep: derive_seed(base_seed, "warmup", rep) for rep in reps}
+            snapshots = dict(zip(reps, pool.map(warm_up, [base] * len(reps),
+                                                [warm_seeds[r] for r in reps], [warmup] * len(reps))))
+        futures = [pool.submit(_run_chunk, base, chunk,
+                               None if snapshots is None else {t["rep"]: snapshots[t["rep"]] for t in chunk},
+                               precision)
+                   for chunk in chunks]
+        for fut in as_completed(futures):
+            rows = fut.result()
+            writer.writerows(rows)
+            fh.flush()
+            finished += len(rows)
+            if progress is not None:
+                progress(finished, len(pending))
+    return finished
+
+
+def load_columns(path: str) -> Dict[str, List[Any]]:
+    """Lee el CSV de resultados como columnas (listas), ordenado por task_id."""
+    with open(path, "r", newline="", encoding="utf-8") as fh:
+        rows = sorted(csv.DictReader(fh), key=lambda r: int(r["task_id"]))
+    cols: Dict[str, List[Any]] = {}
+    for row in rows:
+        for k, v in row.items():
+            cols.setdefault(k, []).append(_parse_value(v))
+    return cols
+
+
+def _parse_value(s: str):
+    for conv in (int, float):
+        try:
+            return conv(s)
+        except ValueError:
+            pass
+    return s
+
+
+def save_npz(csv_path: str, npz_path: str):
+    import numpy as np
+    cols = load_columns(csv_path)
+    np.savez(npz_path, **{k: np.asarray(v) for k, v in cols.items()})
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.sweep", description="Barrido de parámetros en paralelo.")
+    p.add_argument("spec", help="archivo JSON/TOML con base, grid, points, replications y seed")
+    p.add_argument("--out", required=True, help="CSV de resultados (se reanuda si ya existe)")
+    p.add_argument("--workers", type=int, default=None, help="procesos (por defecto: todos los núcleos)")
+    p.add_argument("--chunksize", type=int, default=None, help="tareas por bloque enviado a cada proceso")
+    p.add_argument("--common-seeds", action="store_true",
+                   help="misma semilla para la réplica k de todos los puntos")
+    p.add_argument("--npz", default=None, help="además, guardar los resultados en columnas en un .npz")
+    args = p.parse_args(argv)
+
+    t0 = time.perf_counter()
+
+    def progress(done, total):
+        print(f"\r{done}/{total} tareas", end="", file=sys.stderr, flush=True)
+
+    try:
+        spec = load_params(args.spec)
+        ran = run_sweep(spec, args.out, workers=args.workers, chunksize=args.chunksize,
+                        common_seeds=args.common_seeds, progress=progress)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(f"\n{ran} tareas ejecutadas en {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+    if args.npz:
+        save_npz(args.out, args.npz)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(slots=True)
 class Vehicle:
     vid: int
     x: float          # posición (m): 0 en línea de alto; negativa aguas arriba; positiva aguas abajo
@@ -8,6 +8,17 @@ class Vehicle:
     entered_at: float
     stopped_for: float = 0.0  # >=0 acumula tiempo detenido; <0 tiempo restante de bloqueo intencional
     length: float = 4.5
+    stops: int = 0            # veces que se detuvo (src/metrics.py)
 
     def is_stopped(self, v_thresh: float = 0.1) -> bool:
-        return abs(self.v) < v_thresh
\ No newline at end of file
+        return abs(self.v) < v_thresh
+
+    def reset(self, vid: int, x: float, v: float, entered_at: float):
+        """Reinicia un objeto reciclado como si fuera un Vehicle nuevo."""
+        self.vid = vid
+        self.x = x
+        self.v = v
+        self.entered_at = entered_at
+        self.stopped_for = 0.0
+        self.length = 4.5
+        self.stops = 0